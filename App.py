@@ -1,13 +1,26 @@
 ﻿import streamlit as st
+import rerun_profiler
+
+# Time this rerun from the first import on; see rerun_profiler for phases and switches
+profiler = rerun_profiler.start()
+
 import pandas as pd
 import hashlib
 import secrets
 import time
 import importlib
 import logging
-from datetime import datetime, date
-from database_postgres import Database
+from datetime import datetime, date, timedelta
+from database_postgres import Database, SLOW_QUERY_MS
 from data_manager import DataManager
+from cache_sync import TableVersionWatcher, DeltaFrameCache, tracked_cache
+from frame_schema import compact_frame, RECORD_SCHEMA
+import exports
+from export_jobs import ExportJobQueue
+import bulk_import
+import query_metrics
+import metrics_server
+import migrations
 import os
 from PIL import Image
 from functools import lru_cache
@@ -42,9 +55,11 @@ TRANSLATIONS = {
         'delete': '🗑️ Delete Data',
         'analytics': '📊 Analytics & Charts',
         'export': '📥 Export Data',
+        'export_data': '📥 Export Data',
         'request_leave': '📝 Request Leave',
         'manage_leaves': '🔧 Manage Leave Requests',
         'manage_users': '👥 Manage Users',
+        'db_metrics': '🩺 DB Metrics',
         'logout': '🚪 Logout',
         'select_page': 'Select Page:',
         'project_info': 'Information',
@@ -147,9 +162,11 @@ TRANSLATIONS = {
         'delete': '🗑️ Verileri Sil',
         'analytics': '📊 Analitikler ve Grafikler',
         'export': '📥 Verileri Dışa Aktar',
+        'export_data': '📥 Verileri Dışa Aktar',
         'request_leave': '📝 İzin Talep Et',
         'manage_leaves': '🔧 İzin Taleplerini Yönet',
         'manage_users': '👥 Kullanıcıları Yönet',
+        'db_metrics': '🩺 Veritabanı Metrikleri',
         'logout': '🚪 Çıkış Yap',
         'select_page': 'Sayfa Seç:',
         'project_info': 'Proje Bilgileri',
@@ -248,15 +265,63 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
-# Remove caching to ensure fresh data
+# Build the Database/DataManager once per process; schema setup runs only on the first call
+@st.cache_resource(show_spinner=False)
 def init_database():
-    return Database()
+    database = Database()
+    database.bootstrap_schema()
+    return database
 
+@st.cache_resource(show_spinner=False)
 def init_data_manager():
-    return DataManager()
+    return DataManager(init_database())
+
+# One watcher per process follows table_versions so cached frames are dropped
+# only when their tables change, whichever session or replica made the change
+@st.cache_resource(show_spinner=False)
+def init_version_watcher():
+    database = init_database()
+    return TableVersionWatcher(
+        database.get_table_versions,
+        listen_connection=getattr(database, 'listen_connection', None),
+    ).start()
 
+@st.cache_resource(show_spinner=False)
+def init_records_cache():
+    database = init_database()
+    return DeltaFrameCache(
+        database.get_all_records,
+        database.get_records_changed_since,
+        max_age=timedelta(days=migrations.TOMBSTONE_RETENTION_DAYS - 1),
+        prepare=lambda frame: compact_frame(frame, RECORD_SCHEMA),
+        name='records',
+    )
+
+# Export workers live as long as the process, not the rerun that submitted the job
+@st.cache_resource(show_spinner=False)
+def init_export_queue():
+    return ExportJobQueue(init_database(), init_data_manager())
+
+# Metrics for a scraper on the same host, one port per replica; off unless EIMS_METRICS_PORT is set
+@st.cache_resource(show_spinner=False)
+def init_metrics_server():
+    port = os.getenv('EIMS_METRICS_PORT')
+    if not port:
+        return None
+    try:
+        return metrics_server.start(int(port), pool_stats=Database.pool_stats)
+    except OSError as e:
+        logger.warning(f"Metrics endpoint not started on port {port}: {e}")
+        return None
+
+profiler.phase('database')
 db = init_database()
+profiler.phase('caches')
 data_manager = init_data_manager()
+version_watcher = init_version_watcher()
+records_cache = init_records_cache()
+export_queue = init_export_queue()
+init_metrics_server()
 
 # Initialize language in session state
 if 'language' not in st.session_state:
@@ -304,68 +369,92 @@ def page_matches(page_label: str, page_key: str) -> bool:
 def get_page_key(page_label: str) -> str:
     """Get the key for a page label by checking all translations."""
     for key in ['login', 'signup', 'forgot_password', 'dashboard', 'view', 'add', 'edit', 'delete', 
-                'analytics', 'export', 'request_leave', 'manage_leaves', 'manage_users',
-                'cargo_requests', 'manage_cargo_requests']:
+                'analytics', 'export_data', 'request_leave', 'manage_leaves', 'manage_users',
+                'db_metrics', 'cargo_requests', 'manage_cargo_requests', 'manage_shipments',
+                'add_shipment', 'edit_shipment', 'delete_shipment', 'my_shipments',
+                'track_shipment', 'shipment_analytics', 'messages']:
         if page_label in [TRANSLATIONS['en'].get(key, ''), TRANSLATIONS['tr'].get(key, '')]:
             return key
     return ''
 
-# ensure users table exists (safe to call repeatedly)
-try:
-    db.init_users_table()
-except Exception:
-    pass
-
-# ensure leave_requests table exists
-try:
-    db.init_leave_table()
-except Exception:
-    pass
-
-# Initialize shipment-related tables
-try:
-    db.init_shipments_table()
-    db.init_cargo_items_table()
-    db.init_tracking_updates_table()
-    db.init_documents_table()
-    db.init_cargo_requests_table()
-    db.init_messages_table()
-except Exception as e:
-    print(f"Error initializing shipment tables: {e}")
-
 def _generate_salt():
     return secrets.token_hex(16)
 
 def _hash_password(password: str, salt: str) -> str:
     return hashlib.sha256((password + salt).encode('utf-8')).hexdigest()
 
-# Cache database queries for better performance with longer TTL
-@st.cache_data(ttl=300, show_spinner=False, max_entries=20)
+# Cached loaders are keyed on the versions of the tables they read; a write to
+# one of those tables changes the key, anything else keeps serving the cache
 def get_cached_records():
-    """Cache employee records for 5 minutes"""
-    return db.get_all_records()
-
-@st.cache_data(ttl=300, show_spinner=False, max_entries=20)
-def get_cached_shipments():
-    """Cache shipments for 5 minutes"""
+    """Employee records; a company_records change fetches only the changed rows,
+    a users change reloads everything because the frame carries each user's role"""
+    return records_cache.get(
+        version_watcher.snapshot('company_records'),
+        reset_token=version_watcher.snapshot('users'),
+    )
+
+@tracked_cache('shipment_numbers', st.cache_data(show_spinner=False, max_entries=2))
+def _load_shipment_numbers(versions):
     try:
-        return db.get_all_shipments()
+        return db.get_shipment_numbers()
     except:
-        return pd.DataFrame()
+        return []
 
-@st.cache_data(ttl=600, show_spinner=False, max_entries=10)
-def get_cached_users():
-    """Cache users for 10 minutes"""
+def get_cached_shipment_numbers():
+    """Shipment numbers for the edit/delete pickers, reloaded when shipments change"""
+    return _load_shipment_numbers(version_watcher.snapshot('shipments'))
+
+@tracked_cache('record_filter_options', st.cache_data(show_spinner=False, max_entries=2))
+def _load_filter_options(versions):
+    return db.get_record_filter_options()
+
+def get_cached_filter_options():
+    """View Data filter dropdown values, reloaded when company_records or users change"""
+    return _load_filter_options(version_watcher.snapshot('company_records', 'users'))
+
+@tracked_cache('users', st.cache_data(show_spinner=False, max_entries=2))
+def _load_users(versions):
     try:
         return db.get_all_users()
     except:
         return []
 
-@st.cache_resource(show_spinner=False)
-def get_db_connection():
-    """Cache database connection"""
-    return Database()
+def get_cached_users():
+    """Users, reloaded when the users table changes"""
+    return _load_users(version_watcher.snapshot('users'))
+
+PAGE_SIZE = 50
+SEARCH_LIMIT = 200
 
+def paginate(key, fetch, **filters):
+    """Show one keyset page from fetch(cursor=, limit=, **filters) with Previous/Next buttons.
+
+    Cursors of visited pages live in session state so Previous does not re-walk
+    the table; changing any filter starts again from the newest rows.
+    """
+    state = st.session_state.setdefault(f'pager_{key}', {'filters': None, 'cursors': [None], 'page': 0})
+    if state['filters'] != filters:
+        state.update(filters=dict(filters), cursors=[None], page=0)
+    df, next_cursor = fetch(cursor=state['cursors'][state['page']], limit=PAGE_SIZE, **filters)
+
+    def _go(step):
+        if step > 0:
+            del state['cursors'][state['page'] + 1:]
+            state['cursors'].append(next_cursor)
+        state['page'] += step
+
+    col_prev, col_page, col_next = st.columns([1, 2, 1])
+    with col_prev:
+        st.button("◀ Previous", key=f'pager_{key}_prev', disabled=state['page'] == 0,
+                  on_click=_go, args=(-1,))
+    with col_page:
+        st.caption(f"Page {state['page'] + 1}")
+    with col_next:
+        st.button("Next ▶", key=f'pager_{key}_next', disabled=next_cursor is None,
+                  on_click=_go, args=(1,))
+    return df
+
+profiler.phase('admin_user')
 # Ensure specific manager email exists and has manager role
 try:
     _admin_email = 'aya@gmail.com'
@@ -391,15 +480,14 @@ try:
 except Exception as _e:
     print(f"Error ensuring manager user: {_e}")
 
+profiler.phase('sidebar')
+
 def _safe_rerun():
     """Rerun the Streamlit script in a way compatible with multiple Streamlit versions."""
-    # Clear cache before rerun for fresh data
-    try:
-        get_cached_records.clear()
-        get_cached_shipments.clear()
-        get_cached_users.clear()
-    except:
-        pass
+    # Pick up this session's own write now rather than waiting for the notification;
+    # only loaders whose tables changed will reload, other sessions keep their caches
+    version_watcher.refresh()
+    profiler.finish('rerun')
     if hasattr(st, "rerun"):
         st.rerun()
     elif hasattr(st, "experimental_rerun"):
@@ -408,6 +496,11 @@ def _safe_rerun():
         st.query_params = {"_rerun": int(time.time())}
         st.stop()
 
+def _stop():
+    """st.stop() that records this rerun as stopped rather than leaving it open"""
+    profiler.finish('stopped')
+    st.stop()
+
 PAGES = {
     'login': '🔐 Login',
     'signup': '📝 Sign Up',
@@ -478,8 +571,8 @@ with st.sidebar:
     client_pages = [t('my_shipments'), t('track_shipment'), t('cargo_requests'), t('messages')]
     admin_pages = [
         t('dashboard'), t('view'), t('add'), t('edit'), t('delete'),
-        t('analytics'), t('manage_leaves'), t('manage_users'),
-        t('shipment_analytics'), t('messages')
+        t('analytics'), t('export_data'), t('manage_leaves'), t('manage_users'),
+        t('shipment_analytics'), t('db_metrics'), t('messages')
     ]
 
     page_options = guest_pages
@@ -600,6 +693,9 @@ with st.sidebar:
     st.markdown(f"### {t('project_info')}")
     st.info(t('graduation_project'))
 
+profiler.page = get_page_key(page)
+profiler.phase('page')
+
 ### Authentication handling: Login / Sign Up pages and access control ###
 if page_matches(page, 'login'):
     st.header(t('login'))
@@ -676,11 +772,7 @@ elif page_matches(page, 'forgot_password'):
                         st.warning("If this email is registered in the system, a reset request will be sent to the manager.")
                     else:
                         # Get all managers
-                        conn = db.get_connection()
-                        cursor = conn.cursor()
-                        cursor.execute("SELECT id, email FROM users WHERE role='manager'")
-                        managers = cursor.fetchall()
-                        conn.close()
+                        managers = db.get_users_by_roles(['manager'])
                         
                         if not managers:
                             st.error("Sorry, no managers are available in the system. Please contact technical support.")
@@ -959,22 +1051,13 @@ else:
         if st.button("Go to Login"):
                 st.query_params = {"page": "login"}
                 _safe_rerun()
-        st.stop()
+        _stop()
 
 if page == "🏠 Dashboard":
     st.header("Main Dashboard")
     
-    # Use cached data for statistics
-    df = get_cached_records()
-    if not df.empty:
-        stats = {
-            'total_employees': len(df),
-            'total_departments': df['department'].nunique(),
-            'avg_salary': df['salary'].mean(),
-            'active_employees': len(df[df['status'] == 'Active'])
-        }
-    else:
-        stats = {'total_employees': 0, 'total_departments': 0, 'avg_salary': 0, 'active_employees': 0}
+    # Read from the trigger-maintained rollup instead of scanning every record
+    stats = db.get_statistics()
     
     col1, col2, col3, col4 = st.columns(4)
     
@@ -1009,10 +1092,10 @@ if page == "🏠 Dashboard":
     st.markdown("---")
     
     st.subheader("Recent Records")
-    df = get_cached_records()
+    df = db.get_recent_records(5)
     if not df.empty:
         df_display = df.drop(columns=['password'], errors='ignore')
-        st.dataframe(df_display.head(5), width='stretch')
+        st.dataframe(df_display, width='stretch')
     else:
         st.info("No data available")
 
@@ -1021,39 +1104,41 @@ elif page == "📋 View Data":
     
     search_term = st.text_input("🔍 Search Data", placeholder="Search by name, department, position...")
     
+    # Dropdown values come from a DISTINCT lookup, not from the records themselves
+    options = get_cached_filter_options()
+    col_f1, col_f2, col_f3 = st.columns(3)
+    with col_f1:
+        selected_dept = st.selectbox("Filter by Department:", ['All'] + options['departments'])
+    
+    with col_f2:
+        selected_status = st.selectbox("Filter by Status:", ['All'] + options['statuses'])
+    
+    with col_f3:
+        selected_role = st.selectbox("Filter by Role:", ['All'] + options['roles'])
+    
     if search_term:
-        df = db.search_records(search_term)
-        st.info(f"Found {len(df)} results")
+        # Filters are SQL predicates, applied before the limit
+        df = db.search_records(
+            search_term, limit=SEARCH_LIMIT,
+            department=None if selected_dept == 'All' else selected_dept,
+            status=None if selected_status == 'All' else selected_status,
+            role=None if selected_role == 'All' else selected_role,
+        )
+        truncated = len(df) >= SEARCH_LIMIT
+        if truncated:
+            st.info(f"Showing the {SEARCH_LIMIT} best matches, refine the search to narrow it down")
+        else:
+            st.info(f"Found {len(df)} results")
     else:
-        df = get_cached_records()
+        # Filters are applied in SQL and only one page of rows is loaded
+        df = paginate(
+            'records', db.get_records_page,
+            department=None if selected_dept == 'All' else selected_dept,
+            status=None if selected_status == 'All' else selected_status,
+            role=None if selected_role == 'All' else selected_role,
+        )
     
     if not df.empty:
-        col_f1, col_f2, col_f3 = st.columns(3)
-        with col_f1:
-            departments = ['All'] + list(df['department'].dropna().unique())
-            selected_dept = st.selectbox("Filter by Department:", departments)
-        
-        with col_f2:
-            statuses = ['All'] + list(df['status'].unique())
-            selected_status = st.selectbox("Filter by Status:", statuses)
-        
-        with col_f3:
-            # Add role filter
-            if 'role' in df.columns:
-                roles = ['All'] + [r for r in df['role'].unique() if pd.notna(r)]
-                selected_role = st.selectbox("Filter by Role:", roles)
-            else:
-                selected_role = 'All'
-        
-        if selected_dept != 'All':
-            df = df[df['department'] == selected_dept]
-        
-        if selected_status != 'All':
-            df = df[df['status'] == selected_status]
-        
-        if selected_role != 'All' and 'role' in df.columns:
-            df = df[df['role'] == selected_role]
-        
         # Display different columns based on role filter
         if selected_role == 'client':
             # For clients, show only: id, name, email, phone, status, hire_date, created_at
@@ -1222,6 +1307,42 @@ elif page == "➕ Add Data":
             else:
                 st.error("⚠️ Please fill all required fields (*)")
 
+    st.markdown("---")
+    with st.expander("📤 Bulk import from CSV / Excel"):
+        st.caption("Use the same column names as the exports. A row whose id (shipment number for "
+                   "shipments) already exists updates that row; every other row is added.")
+        import_target = st.selectbox(
+            "Import into:", list(bulk_import.IMPORT_TARGETS),
+            format_func=lambda name: bulk_import.IMPORT_TARGETS[name]['label'], key="import_target",
+        )
+        target_spec = bulk_import.IMPORT_TARGETS[import_target]
+        optional_columns = [c for c in target_spec['columns'] if c not in target_spec['required']]
+        st.caption(f"Required columns: {', '.join(target_spec['required'])}. "
+                   f"Optional: {', '.join(optional_columns)}.")
+        import_file = st.file_uploader("File", type=['csv', 'xlsx'], key="import_file")
+        if import_file is not None and st.button("📥 Import", key="import_run"):
+            try:
+                with st.spinner("Importing..."):
+                    import_rows, import_errors = bulk_import.validate(bulk_import.read_upload(import_file), import_target)
+                    result = {'inserted': 0, 'updated': 0, 'errors': []}
+                    if not import_rows.empty:
+                        result = db.import_rows(import_target, import_rows)
+                import_errors = pd.concat(
+                    [import_errors, pd.DataFrame(result['errors'], columns=['row', 'error'])], ignore_index=True
+                ).sort_values('row', kind='stable')
+                st.success(f"✅ Added {result['inserted']:,} and updated {result['updated']:,} row(s).")
+                if not import_errors.empty:
+                    st.warning(f"⚠️ {import_errors['row'].nunique():,} row(s) were skipped:")
+                    st.dataframe(import_errors, hide_index=True, use_container_width=True)
+                    st.download_button(
+                        "⬇️ Download errors", import_errors.to_csv(index=False).encode('utf-8-sig'),
+                        file_name="import_errors.csv", mime='text/csv',
+                    )
+                # Refresh the counters directly; a rerun would clear the report above
+                version_watcher.refresh()
+            except Exception as e:
+                st.error(f"❌ Import failed: {str(e)}")
+
 elif page == "✏️ Edit Data":
     st.header("Edit Existing Record")
     
@@ -1360,6 +1481,8 @@ elif page == "🗑️ Delete Data":
                 
                 st.markdown("---")
                 st.subheader("Record Information:")
+                # hire_date is parsed to a datetime in the cached frame; show just the day
+                hire_date_text = pd.to_datetime(record['hire_date']).date() if pd.notna(record['hire_date']) else 'N/A'
             
                 if is_client:
                     # Simplified view for clients
@@ -1369,7 +1492,7 @@ elif page == "🗑️ Delete Data":
                         st.write(f"**Email:** {record.get('email', 'N/A')}")
                         st.write(f"**Phone:** {record.get('phone', 'N/A')}")
                     with col2:
-                        st.write(f"**Registration Date:** {record['hire_date']}")
+                        st.write(f"**Registration Date:** {hire_date_text}")
                         st.write(f"**Status:** {record['status']}")
                         st.write(f"**Role:** Client")
                 else:
@@ -1382,7 +1505,7 @@ elif page == "🗑️ Delete Data":
                         st.write(f"**Email:** {record.get('email', 'N/A')}")
                     with col2:
                         st.write(f"**Salary:** {record.get('salary', 0):,.0f} $")
-                        st.write(f"**Hire Date:** {record['hire_date']}")
+                        st.write(f"**Hire Date:** {hire_date_text}")
                         st.write(f"**Status:** {record['status']}")
             
                 st.markdown("---")
@@ -1513,24 +1636,88 @@ elif page_matches(page, 'analytics'):
             col1, col2 = st.columns(2)
             with col1:
                 st.subheader("Department Sizes")
-                dept_counts = df_employees['department'].value_counts().reset_index()
+                # Categorical columns also count categories with no rows left after the role filter
+                dept_counts = df_employees['department'].value_counts().loc[lambda counts: counts > 0].reset_index()
                 dept_counts.columns = ['Department', 'Count']
                 st.dataframe(dept_counts, use_container_width=True, hide_index=True)
             
             with col2:
                 st.subheader("Status Breakdown")
-                status_counts = df_employees['status'].value_counts().reset_index()
+                status_counts = df_employees['status'].value_counts().loc[lambda counts: counts > 0].reset_index()
                 status_counts.columns = ['Status', 'Count']
                 st.dataframe(status_counts, use_container_width=True, hide_index=True)
     else:
         st.warning("No data available for charts")
 
+elif page_matches(page, 'export_data'):
+    st.header(t('export_data'))
+    user = st.session_state.get('user')
+    if not user or user.get('role') != 'manager':
+        st.error("You must be a manager to export data.")
+        _stop()
+
+    st.info("Exports run in the background and stream straight from the database, "
+            "so you can keep working while large tables export.")
+    export_formats = {'CSV': 'csv', 'Excel': 'xlsx', 'Parquet': 'parquet', 'Arrow IPC': 'arrow'}
+    export_format = st.radio("Format:", list(export_formats), horizontal=True)
+    if export_format != "Excel":
+        export_names = [st.selectbox("Table:", list(exports.EXPORT_LABELS), format_func=exports.EXPORT_LABELS.get)]
+    else:
+        export_names = st.multiselect(
+            "Sheets:", list(exports.EXPORT_LABELS), default=['records', 'shipments', 'cargo_items'],
+            format_func=exports.EXPORT_LABELS.get,
+        )
+
+    my_jobs = st.session_state.setdefault('export_jobs', [])
+    if st.button("Start export", disabled=not export_names):
+        try:
+            job_id = export_queue.submit(
+                export_formats[export_format], export_names, requested_by=user.get('id')
+            )
+            if job_id not in my_jobs:
+                my_jobs.insert(0, job_id)
+        except Exception as e:
+            st.error(f"Export failed: {str(e)}")
+
+    if my_jobs:
+        st.markdown("---")
+        col_title, col_refresh = st.columns([4, 1])
+        with col_title:
+            st.subheader("My Exports")
+        with col_refresh:
+            # Any rerun polls the job table again
+            st.button("🔄 Refresh")
+        for job_id in my_jobs:
+            job = export_queue.status(job_id)
+            if not job:
+                continue
+            names = job['export_names'].split(',')
+            title = f"#{job_id} · {job['export_format'].upper()} · " + ", ".join(
+                exports.EXPORT_LABELS.get(name, name) for name in names
+            )
+            with st.container():
+                st.markdown(f"**{title}**")
+                if job['status'] in ('queued', 'running'):
+                    st.progress(float(job['progress'] or 0), text=job['detail'] or job['status'].capitalize())
+                elif job['status'] == 'done' and job['file_path'] and os.path.exists(job['file_path']):
+                    suffix = os.path.splitext(job['file_path'])[1]
+                    with open(job['file_path'], 'rb') as f:
+                        st.download_button(
+                            label="⬇️ Download", data=f, key=f"export_download_{job_id}",
+                            file_name=f"{'_'.join(names)}_{job_id}{suffix}",
+                        )
+                    st.caption(f"Available until {job['expires_at']}")
+                elif job['status'] == 'failed':
+                    st.error(f"Failed: {job['error']}")
+                else:
+                    st.caption("Expired - start the export again for a fresh file.")
+
 elif page_matches(page, 'request_leave'):
     st.header(t('request_leave'))
     user = st.session_state.get('user')
     if not user:
         st.error("Please log in to submit a leave request.")
-        st.stop()
+        _stop()
 
     # Request card
     with st.container():
@@ -1623,10 +1810,10 @@ elif page_matches(page, 'manage_leaves'):
     user = st.session_state.get('user')
     if not user or user.get('role') != 'manager':
         st.error("You must be a manager to manage leave requests.")
-        st.stop()
+        _stop()
 
     try:
-        df = db.get_all_leave_requests()
+        df = paginate('leave_requests', db.get_leave_requests_page)
         if df.empty:
             st.info("No leave requests found.")
         else:
@@ -1670,7 +1857,7 @@ elif page_matches(page, 'manage_users'):
     user = st.session_state.get('user')
     if not user or user.get('role') != 'manager':
         st.error("You must be a manager to manage users.")
-        st.stop()
+        _stop()
 
     try:
         # Get all records from company_records (same as View Data)
@@ -1761,43 +1948,112 @@ elif page_matches(page, 'manage_users'):
     except Exception as e:
         st.error(f"Error loading users: {str(e)}")
 
+elif page_matches(page, 'db_metrics'):
+    st.header(t('db_metrics'))
+    user = st.session_state.get('user')
+    if not user or user.get('role') != 'manager':
+        st.error("You must be a manager to view database metrics.")
+        _stop()
+
+    snapshot = query_metrics.METRICS.snapshot()
+    methods = snapshot['methods']
+    pool = Database.pool_stats()
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        st.metric("Calls", f"{sum(m['calls'] for m in methods):,}")
+    with col2:
+        st.metric("Slow calls", f"{sum(m['slow'] for m in methods):,}")
+    with col3:
+        st.metric("Errors", f"{sum(m['errors'] for m in methods):,}")
+    with col4:
+        st.metric("Connections in use", pool['checked_out'], help=f"{pool['idle']} idle, pool size {pool['size']}")
+    mean_wait = snapshot['checkout_wait_seconds'] * 1000 / snapshot['checkouts'] if snapshot['checkouts'] else 0
+    st.caption(
+        f"Since this server process started or was last reset. {snapshot['checkouts']:,} pool checkouts, "
+        f"{mean_wait:.1f} ms mean wait. Calls slower than {SLOW_QUERY_MS:g} ms "
+        "are logged to eims_app.log."
+    )
+
+    st.subheader("Database calls")
+    if methods:
+        df_metrics = pd.DataFrame(methods).drop(columns=['buckets'])
+        st.dataframe(
+            df_metrics, width='stretch', hide_index=True,
+            column_config={
+                column: st.column_config.NumberColumn(format="%.1f")
+                for column in df_metrics.columns if column.endswith('_ms')
+            },
+        )
+    else:
+        st.info("No database calls recorded yet.")
+
+    st.subheader("Reruns per page")
+    st.caption("Mean milliseconds per phase of App.py. Reruns cut short by st.stop(), "
+               "st.rerun() or an error are counted as interrupted.")
+    rerun_stats = rerun_profiler.snapshot()
+    if rerun_stats:
+        df_reruns = pd.DataFrame([
+            {
+                'page': stats['page'],
+                'reruns': stats['reruns'],
+                'interrupted': stats['reruns'] - stats['statuses'].get('complete', 0),
+                'mean_ms': stats['mean_ms'],
+                'max_ms': stats['max_ms'],
+                **{f"{phase}_ms": value for phase, value in stats['phases_mean_ms'].items()},
+            }
+            for stats in rerun_stats
+        ])
+        st.dataframe(
+            df_reruns, width='stretch', hide_index=True,
+            column_config={
+                column: st.column_config.NumberColumn(format="%.1f")
+                for column in df_reruns.columns if column.endswith('_ms')
+            },
+        )
+    else:
+        st.info("No reruns recorded yet.")
+
+    col_refresh, col_reset = st.columns([1, 1])
+    with col_refresh:
+        st.button("🔄 Refresh")
+    with col_reset:
+        if st.button("Reset metrics"):
+            query_metrics.METRICS.reset()
+            rerun_profiler.reset()
+            st.rerun()
+
 # Shipment Management Pages
 elif page_matches(page, 'manage_shipments'):
     st.header(t('manage_shipments'))
     user = st.session_state.get('user')
     if not user or user.get('role') not in ['manager', 'employee']:
         st.error("You must be a manager or employee to manage shipments.")
-        st.stop()
+        _stop()
 
     try:
-        # Fetch data from database with caching
-        df = get_cached_shipments()
+        rollup = db.get_shipment_rollup()
         
-        if df.empty:
+        if rollup.empty:
             st.info("No shipments found. Add a new shipment to get started.")
         else:
             # Filter options
             col1, col2, col3 = st.columns(3)
             with col1:
-                shipment_types = ['All'] + list(df['type'].unique())
+                shipment_types = ['All'] + sorted(rollup['type'].unique())
                 selected_type = st.selectbox("Filter by Type:", shipment_types)
             with col2:
-                statuses = ['All'] + list(df['status'].unique())
+                statuses = ['All'] + sorted(s for s in rollup['status'].unique() if s)
                 selected_status = st.selectbox("Filter by Status:", statuses)
             with col3:
                 search_term = st.text_input("🔍 Search", placeholder="Shipment number, client...")
             
-            # Apply filters
-            filtered_df = df.copy()
-            if selected_type != 'All':
-                filtered_df = filtered_df[filtered_df['type'] == selected_type]
-            if selected_status != 'All':
-                filtered_df = filtered_df[filtered_df['status'] == selected_status]
-            if search_term:
-                filtered_df = filtered_df[
-                    filtered_df['shipment_number'].str.contains(search_term, case=False, na=False) |
-                    filtered_df['client_email'].str.contains(search_term, case=False, na=False)
-                ]
+            # Filters run in SQL; only the current page of shipments is loaded
+            filtered_df = paginate(
+                'shipments', db.get_shipments_page,
+                shipment_type=None if selected_type == 'All' else selected_type,
+                status=None if selected_status == 'All' else selected_status,
+                search=search_term or None,
+            )
             
             st.dataframe(filtered_df, width='stretch')
             
@@ -1809,9 +2065,13 @@ elif page_matches(page, 'manage_shipments'):
                 shipment_nums = filtered_df['shipment_number'].tolist()
                 selected_shipment = st.selectbox("Select Shipment:", shipment_nums)
                 
-                # Get fresh data from database for selected shipment
-                fresh_df = db.get_all_shipments()
-                ship_data = fresh_df[fresh_df['shipment_number'] == selected_shipment].iloc[0]
+                # Header, cargo, tracking and documents for the selected shipment in one query
+                selected_id = filtered_df.loc[filtered_df['shipment_number'] == selected_shipment, 'id'].iloc[0]
+                bundle = db.get_shipment_bundle(int(selected_id))
+                ship_data = bundle['shipment']
+                if ship_data is None:
+                    st.error("Shipment not found, it may have been deleted.")
+                    _stop()
                 
                 tab1, tab2, tab3, tab4 = st.tabs(["📋 Details", "📦 Cargo Items", "🗺️ Tracking", "📄 Documents"])
                 
@@ -1828,7 +2088,7 @@ elif page_matches(page, 'manage_shipments'):
                         st.write(f"**{t('expected_arrival')}:** {ship_data['expected_arrival']}")
                         st.write(f"**{t('actual_arrival')}:** {ship_data.get('actual_arrival', 'N/A')}")
                         st.write(f"**{t('total_weight')}:** {ship_data['total_weight']} kg")
-                        st.write(f"**{t('total_value')}:** {ship_data['currency']} {ship_data['total_value']:,.2f}")
+                        st.write(f"**{t('total_value')}:** {ship_data['currency']} {ship_data['total_value'] or 0:,.2f}")
                     
                     st.markdown("---")
                     st.subheader("Update Status")
@@ -1854,121 +2114,52 @@ elif page_matches(page, 'manage_shipments'):
                 
                 with tab2:
                     st.subheader(t('cargo_items'))
-                    cargo_df = db.get_cargo_items_by_shipment(int(ship_data['id']))
-                    if not cargo_df.empty:
-                        st.dataframe(cargo_df, width='stretch')
-                        
-                        st.markdown("---")
-                        st.markdown("### 🔧 Manage Cargo Items")
-                        # Edit and Delete cargo items
-                        col_edit, col_delete = st.columns(2)
-                        
-                        with col_edit:
-                            st.markdown("#### ✏️ Edit Cargo Item")
-                            item_to_edit = st.selectbox("Select item to edit:", 
-                                [(f"{row['id']} - {row['item_name']}", row['id']) for _, row in cargo_df.iterrows()],
-                                format_func=lambda x: x[0], key="edit_cargo_select")
-                            
-                            if item_to_edit:
-                                selected_id = item_to_edit[1]
-                                selected_item = cargo_df[cargo_df['id'] == selected_id].iloc[0]
-                                
-                                with st.form("edit_cargo_form"):
-                                    edit_item_name = st.text_input("Item Name", value=selected_item['item_name'])
-                                    col_e1, col_e2 = st.columns(2)
-                                    with col_e1:
-                                        edit_quantity = st.number_input("Quantity", min_value=1, value=int(selected_item['quantity']))
-                                        edit_weight = st.number_input("Weight (kg)", min_value=0.0, value=float(selected_item['weight']))
-                                    with col_e2:
-                                        edit_unit = st.selectbox("Unit", ["pcs", "kg", "ton", "box", "container"],
-                                            index=["pcs", "kg", "ton", "box", "container"].index(selected_item['unit']) 
-                                            if selected_item['unit'] in ["pcs", "kg", "ton", "box", "container"] else 0)
-                                        edit_value = st.number_input("Value", min_value=0.0, value=float(selected_item['value']))
-                                    edit_description = st.text_area("Description", value=selected_item.get('description', ''))
-                                    edit_hs_code = st.text_input("HS Code", value=selected_item.get('hs_code', ''))
-                                    
-                                    if st.form_submit_button("💾 Save Changes", width='stretch'):
-                                        try:
-                                            db.update_cargo_item(
-                                                item_id=selected_id,
-                                                item_name=edit_item_name,
-                                                quantity=edit_quantity,
-                                                weight=edit_weight,
-                                                unit=edit_unit,
-                                                value=edit_value,
-                                                description=edit_description,
-                                                hs_code=edit_hs_code
-                                            )
-                                            st.success("✅ Cargo item updated successfully!")
-                                            _safe_rerun()
-                                        except Exception as e:
-                                            st.error(f"❌ Error: {str(e)}")
-                        
-                        with col_delete:
-                            st.markdown("#### 🗑️ Delete Cargo Item")
-                            item_to_delete = st.selectbox("Select item to delete:", 
-                                [(f"{row['id']} - {row['item_name']}", row['id']) for _, row in cargo_df.iterrows()],
-                                format_func=lambda x: x[0], key="delete_cargo_select")
-                            
-                            if item_to_delete:
-                                delete_id = item_to_delete[1]
-                                delete_item = cargo_df[cargo_df['id'] == delete_id].iloc[0]
-                                
-                                st.markdown("**Item Details:**")
-                                st.write(f"📦 **Item:** {delete_item['item_name']}")
-                                st.write(f"📊 **Quantity:** {delete_item['quantity']} {delete_item['unit']}")
-                                st.write(f"⚖️ **Weight:** {delete_item['weight']} kg")
-                                st.write(f"💰 **Value:** ${delete_item['value']:,.2f}")
-                                
-                                st.warning("⚠️ This action cannot be undone!")
-                                
-                                if st.button("🗑️ Confirm Delete", type="primary", width='stretch'):
-                                    try:
-                                        db.delete_cargo_item(delete_id)
-                                        st.success("✅ Item deleted successfully!")
-                                        _safe_rerun()
-                                    except Exception as e:
-                                        st.error(f"❌ Error: {str(e)}")
-                    else:
-                        st.info("No cargo items found.")
-                    
-                    st.markdown("---")
-                    st.subheader(f"➕ {t('add_cargo')}")
-                    with st.form("add_cargo_form"):
-                        c1, c2 = st.columns(2)
-                        with c1:
-                            item_name = st.text_input(t('item_name') + " *")
-                            quantity = st.number_input(t('quantity') + " *", min_value=1, value=1)
-                            weight = st.number_input(t('weight') + " *", min_value=0.0, value=0.0)
-                        with c2:
-                            unit = st.selectbox("Unit *", ["pcs", "kg", "ton", "box", "container"])
-                            value = st.number_input(t('value') + " *", min_value=0.0, value=0.0)
-                            description = st.text_area(t('description'))
-                        hs_code = st.text_input("HS Code (Optional)")
-                        
-                        if st.form_submit_button(f"➕ {t('add_cargo')}", width='stretch'):
-                            if item_name:
-                                try:
-                                    db.add_cargo_item(
-                                        int(ship_data['id']), 
-                                        item_name, 
-                                        description, 
-                                        int(quantity), 
-                                        unit, 
-                                        float(weight), 
-                                        float(value), 
-                                        hs_code
-                                    )
-                                    st.success("✅ Cargo item added successfully!")
-                                    _safe_rerun()
-                                except Exception as e:
-                                    st.error(f"❌ Error: {str(e)}")
-                            else:
-                                st.error("⚠️ Please enter item name")
+                    cargo_df = bundle['cargo_items']
+                    cargo_columns = ['item_name', 'description', 'quantity', 'unit', 'weight', 'value', 'hs_code']
+                    cargo_units = ["pcs", "kg", "ton", "box", "container"]
+                    st.caption("Edit cells, add lines at the bottom or select lines to delete, "
+                               "then save the whole manifest at once.")
+                    # A new key after each save drops the editor's pending edits along with the old rows
+                    editor_version = st.session_state.get('cargo_editor_version', 0)
+                    edited_cargo = st.data_editor(
+                        cargo_df[['id'] + cargo_columns],
+                        num_rows="dynamic",
+                        disabled=['id'],
+                        hide_index=True,
+                        width='stretch',
+                        key=f"cargo_editor_{selected_id}_{editor_version}",
+                        column_config={
+                            'id': st.column_config.NumberColumn("ID"),
+                            'item_name': st.column_config.TextColumn(t('item_name'), required=True),
+                            'description': st.column_config.TextColumn(t('description')),
+                            'quantity': st.column_config.NumberColumn(t('quantity'), min_value=1, step=1, default=1, required=True),
+                            'unit': st.column_config.SelectboxColumn("Unit", options=cargo_units, default="pcs", required=True),
+                            'weight': st.column_config.NumberColumn(t('weight'), min_value=0.0, default=0.0),
+                            'value': st.column_config.NumberColumn(t('value'), min_value=0.0, default=0.0),
+                            'hs_code': st.column_config.TextColumn("HS Code"),
+                        },
+                    )
+
+                    if st.button("💾 Save Cargo Changes", width='stretch'):
+                        added, updated, deleted = data_manager.diff_rows(cargo_df, edited_cargo, cargo_columns)
+                        if any(not item.get('item_name') or item.get('quantity') is None for item in added + updated):
+                            st.error("⚠️ Every cargo line needs an item name and a quantity")
+                        elif not (added or updated or deleted):
+                            st.info("No changes to save.")
+                        else:
+                            try:
+                                for item in added:
+                                    item['shipment_id'] = int(ship_data['id'])
+                                db.save_cargo_items(added=added, updated=updated, deleted=deleted)
+                                st.session_state['cargo_editor_version'] = editor_version + 1
+                                st.success(f"✅ Saved: {len(added)} added, {len(updated)} updated, {len(deleted)} deleted")
+                                _safe_rerun()
+                            except Exception as e:
+                                st.error(f"❌ Error: {str(e)}")
                 
                 with tab3:
                     st.subheader(t('tracking'))
-                    tracking_df = db.get_tracking_updates(int(ship_data['id']))
+                    tracking_df = bundle['tracking']
                     if not tracking_df.empty:
                         for _, row in tracking_df.iterrows():
                             status_class = row['status'].lower().replace(' ', '-')
@@ -2008,7 +2199,7 @@ elif page_matches(page, 'manage_shipments'):
                 
                 with tab4:
                     st.subheader(t('documents'))
-                    docs_df = db.get_shipment_documents(int(ship_data['id']))
+                    docs_df = bundle['documents']
                     if not docs_df.empty:
                         for _, doc in docs_df.iterrows():
                             st.markdown(f"""
@@ -2056,7 +2247,7 @@ elif page_matches(page, 'add_shipment'):
     user = st.session_state.get('user')
     if not user or user.get('role') not in ['manager', 'employee']:
         st.error("You must be a manager or employee to add shipments.")
-        st.stop()
+        _stop()
 
     with st.form("add_shipment_form"):
         col1, col2 = st.columns(2)
@@ -2152,7 +2343,7 @@ elif page_matches(page, 'my_shipments'):
     user = st.session_state.get('user')
     if not user or user.get('role') != 'client':
         st.error("This page is only for clients.")
-        st.stop()
+        _stop()
 
     try:
         df = db.get_shipments_by_client(user['id'])
@@ -2167,7 +2358,12 @@ elif page_matches(page, 'my_shipments'):
             shipment_nums = df['shipment_number'].tolist()
             selected_shipment = st.selectbox("Select Your Shipment:", shipment_nums)
             
-            ship_data = df[df['shipment_number'] == selected_shipment].iloc[0]
+            selected_id = df.loc[df['shipment_number'] == selected_shipment, 'id'].iloc[0]
+            bundle = db.get_shipment_bundle(int(selected_id))
+            ship_data = bundle['shipment']
+            if ship_data is None:
+                st.error("Shipment not found, it may have been deleted.")
+                _stop()
             
             col1, col2 = st.columns(2)
             with col1:
@@ -2176,7 +2372,7 @@ elif page_matches(page, 'my_shipments'):
                 st.write(f"**{t('destination')}:** {ship_data['destination_country']}")
                 st.write(f"**Type:** {ship_data['type']}")
             with col2:
-                st.metric(t('total_value'), f"{ship_data['currency']} {ship_data['total_value']:,.2f}")
+                st.metric(t('total_value'), f"{ship_data['currency']} {ship_data['total_value'] or 0:,.2f}")
                 st.write(f"**{t('departure_date')}:** {ship_data['departure_date']}")
                 st.write(f"**{t('expected_arrival')}:** {ship_data['expected_arrival']}")
                 st.write(f"**{t('customs_cleared')}:** {'Yes' if ship_data.get('customs_cleared') else 'No'}")
@@ -2184,7 +2380,7 @@ elif page_matches(page, 'my_shipments'):
             # Show cargo items
             st.markdown("---")
             st.subheader(t('cargo_items'))
-            cargo_df = db.get_cargo_items_by_shipment(int(ship_data['id']))
+            cargo_df = bundle['cargo_items']
             if not cargo_df.empty:
                 st.dataframe(cargo_df[['item_name', 'quantity', 'unit', 'weight', 'value']], width='stretch')
             else:
@@ -2193,7 +2389,7 @@ elif page_matches(page, 'my_shipments'):
             # Show tracking
             st.markdown("---")
             st.subheader(t('tracking'))
-            tracking_df = db.get_tracking_updates(int(ship_data['id']))
+            tracking_df = bundle['tracking']
             if not tracking_df.empty:
                 for _, row in tracking_df.iterrows():
                     st.markdown(f"""
@@ -2216,19 +2412,16 @@ elif page_matches(page, 'track_shipment'):
     if st.button("🔍 Track"):
         if shipment_number:
             try:
-                df = get_cached_shipments()
-                ship_data = df[df['shipment_number'] == shipment_number]
+                ship = db.get_shipment_by_number(shipment_number.strip())
                 
-                if ship_data.empty:
+                if ship is None:
                     st.error("Shipment not found.")
                 else:
-                    ship = ship_data.iloc[0]
-                    
                     # Check if user is client and can only view their own shipments
                     user = st.session_state.get('user')
                     if user and user.get('role') == 'client' and ship['client_id'] != user['id']:
                         st.error("You can only track your own shipments.")
-                        st.stop()
+                        _stop()
                     
                     st.success(f"Shipment Found: {shipment_number}")
                     
@@ -2266,7 +2459,7 @@ elif page_matches(page, 'shipment_analytics'):
     user = st.session_state.get('user')
     if not user or user.get('role') not in ['manager', 'employee']:
         st.error("You must be a manager or employee to view analytics.")
-        st.stop()
+        _stop()
 
     try:
         stats = db.get_shipment_statistics()
@@ -2283,25 +2476,26 @@ elif page_matches(page, 'shipment_analytics'):
         
         st.metric("Total Value", f"${stats['total_value']:,.2f}")
         
-        # Charts
-        df = db.get_all_shipments()
-        if not df.empty:
+        # Charts come from the per type/status rollup rather than the full shipments table
+        rollup = db.get_shipment_rollup()
+        if not rollup.empty:
             st.markdown("---")
             col_a, col_b = st.columns(2)
             
             with col_a:
                 st.subheader("Shipments by Type")
-                type_counts = df['type'].value_counts()
+                type_counts = rollup.groupby('type')['shipment_count'].sum().sort_values(ascending=False)
                 st.bar_chart(type_counts)
             
             with col_b:
                 st.subheader("Shipments by Status")
-                status_counts = df['status'].value_counts()
+                by_status = rollup[rollup['status'] != '']
+                status_counts = by_status.groupby('status')['shipment_count'].sum().sort_values(ascending=False)
                 st.bar_chart(status_counts)
             
             st.markdown("---")
             st.subheader("Recent Shipments")
-            st.dataframe(df.head(10), width='stretch')
+            st.dataframe(db.get_recent_shipments(10), width='stretch')
     except Exception as e:
         st.error(f"Error loading analytics: {str(e)}")
 
@@ -2310,15 +2504,13 @@ elif page_matches(page, 'cargo_requests'):
     user = st.session_state.get('user')
     if not user or user.get('role') != 'client':
         st.error("This page is only for clients.")
-        st.stop()
+        _stop()
 
     try:
         st.subheader(t('request_cargo_change'))
         
         # Get all cargo items from database
-        conn = db.get_connection()
-        cargo_df = pd.read_sql_query('SELECT * FROM cargo_items', conn)
-        conn.close()
+        cargo_df = db.get_all_cargo_items()
         
         if not cargo_df.empty:
             with st.form("cargo_request_form"):
@@ -2386,71 +2578,65 @@ elif page_matches(page, 'manage_cargo_requests'):
     user = st.session_state.get('user')
     if not user or user.get('role') not in ['manager', 'employee']:
         st.error("You must be a manager or employee to manage cargo requests.")
-        st.stop()
+        _stop()
 
     try:
-        requests_df = db.get_all_cargo_requests()
+        # Filter options
+        col1, col2 = st.columns(2)
+        with col1:
+            status_filter = st.selectbox("Filter by Status:", ["All", "Pending", "Approved", "Rejected"])
+        with col2:
+            type_filter = st.selectbox("Filter by Type:", ["All", t('modify'), t('remove')])
         
-        if requests_df.empty:
-            st.info("No cargo requests found.")
+        filtered_df = paginate(
+            'cargo_requests', db.get_cargo_requests_page,
+            status=None if status_filter == "All" else status_filter,
+            request_type=None if type_filter == "All" else type_filter,
+        )
+        
+        st.markdown("---")
+        
+        if filtered_df.empty:
+            st.info("No cargo requests match the selected filters.")
         else:
-            # Filter options
-            col1, col2 = st.columns(2)
-            with col1:
-                status_filter = st.selectbox("Filter by Status:", ["All", "Pending", "Approved", "Rejected"])
-            with col2:
-                type_filter = st.selectbox("Filter by Type:", ["All", t('modify'), t('remove')])
-            
-            # Apply filters
-            filtered_df = requests_df.copy()
-            if status_filter != "All":
-                filtered_df = filtered_df[filtered_df['status'] == status_filter]
-            if type_filter != "All":
-                filtered_df = filtered_df[filtered_df['request_type'] == type_filter]
-            
-            st.markdown("---")
-            
-            if filtered_df.empty:
-                st.info("No requests match the selected filters.")
-            else:
-                for _, req in filtered_df.iterrows():
-                    request_id = int(req['id'])
+            for _, req in filtered_df.iterrows():
+                request_id = int(req['id'])
+                
+                with st.expander(f"Request #{request_id} - {req.get('client_email', 'Unknown')} - {req.get('status', 'Pending')}"):
+                    col_info, col_action = st.columns([2, 1])
                     
-                    with st.expander(f"Request #{request_id} - {req.get('client_email', 'Unknown')} - {req.get('status', 'Pending')}"):
-                        col_info, col_action = st.columns([2, 1])
-                        
-                        with col_info:
-                            st.write(f"**Client:** {req.get('client_email', 'Unknown')}")
-                            st.write(f"**Shipment:** {req.get('shipment_number', 'N/A')}")
-                            st.write(f"**Cargo Item:** {req.get('item_name', 'N/A')}")
-                            st.write(f"**Request Type:** {req.get('request_type', 'N/A')}")
-                            st.write(f"**Reason:** {req.get('reason', 'N/A')}")
-                            st.write(f"**Date:** {req.get('created_at', 'N/A')}")
-                            st.write(f"**Current Status:** {req.get('status', 'Pending')}")
-                        
-                        with col_action:
-                            if req.get('status') == 'Pending':
-                                with st.form(f"manage_request_{request_id}"):
-                                    new_status = st.selectbox("Action:", ["Pending", "Approved", "Rejected"], 
-                                                            key=f"status_{request_id}")
-                                    response = st.text_area("Response to client:", key=f"response_{request_id}")
-                                    
-                                    if st.form_submit_button(t('save')):
-                                        try:
-                                            db.update_cargo_request_status(request_id, new_status, response)
-                                            
-                                            # If approved and request is to remove, delete the cargo item
-                                            if new_status == "Approved" and req.get('request_type') == t('remove'):
-                                                db.delete_cargo_item(req['cargo_item_id'])
-                                            
-                                            st.success("Request updated successfully!")
-                                            _safe_rerun()
-                                        except Exception as e:
-                                            st.error(f"Error: {str(e)}")
-                            else:
-                                st.info(f"Status: {req.get('status')}")
-                                if req.get('employee_response'):
-                                    st.write(f"**Response:** {req.get('employee_response')}")
+                    with col_info:
+                        st.write(f"**Client:** {req.get('client_email', 'Unknown')}")
+                        st.write(f"**Shipment:** {req.get('shipment_number', 'N/A')}")
+                        st.write(f"**Cargo Item:** {req.get('item_name', 'N/A')}")
+                        st.write(f"**Request Type:** {req.get('request_type', 'N/A')}")
+                        st.write(f"**Reason:** {req.get('reason', 'N/A')}")
+                        st.write(f"**Date:** {req.get('created_at', 'N/A')}")
+                        st.write(f"**Current Status:** {req.get('status', 'Pending')}")
+                    
+                    with col_action:
+                        if req.get('status') == 'Pending':
+                            with st.form(f"manage_request_{request_id}"):
+                                new_status = st.selectbox("Action:", ["Pending", "Approved", "Rejected"], 
+                                                        key=f"status_{request_id}")
+                                response = st.text_area("Response to client:", key=f"response_{request_id}")
+                                
+                                if st.form_submit_button(t('save')):
+                                    try:
+                                        db.update_cargo_request_status(request_id, new_status, response)
+                                        
+                                        # If approved and request is to remove, delete the cargo item
+                                        if new_status == "Approved" and req.get('request_type') == t('remove'):
+                                            db.delete_cargo_item(req['cargo_item_id'])
+                                        
+                                        st.success("Request updated successfully!")
+                                        _safe_rerun()
+                                    except Exception as e:
+                                        st.error(f"Error: {str(e)}")
+                        else:
+                            st.info(f"Status: {req.get('status')}")
+                            if req.get('employee_response'):
+                                st.write(f"**Response:** {req.get('employee_response')}")
     except Exception as e:
         st.error(f"Error loading requests: {str(e)}")
 
@@ -2459,26 +2645,26 @@ elif page_matches(page, 'edit_shipment'):
     user = st.session_state.get('user')
     if not user or user.get('role') not in ['manager', 'employee']:
         st.error("Only managers and employees can edit shipments.")
-        st.stop()
+        _stop()
 
     # Clear any session state cache
     if 'last_edited_shipment' not in st.session_state:
         st.session_state.last_edited_shipment = None
 
     try:
-        # Get fresh data
-        df = db.get_all_shipments()
+        shipment_nums = get_cached_shipment_numbers()
         
-        if df.empty:
+        if not shipment_nums:
             st.info("No shipments found.")
         else:
             # Select shipment to edit
-            shipment_nums = df['shipment_number'].tolist()
             selected_shipment = st.selectbox("Select Shipment to Edit:", shipment_nums)
             
             # Always get fresh data for selected shipment
-            fresh_df = db.get_all_shipments()
-            ship_data = fresh_df[fresh_df['shipment_number'] == selected_shipment].iloc[0]
+            ship_data = db.get_shipment_by_number(selected_shipment)
+            if ship_data is None:
+                st.error("Shipment not found, it may have been deleted.")
+                _stop()
             
             st.markdown("---")
             st.subheader(f"Edit Shipment: {selected_shipment}")
@@ -2500,13 +2686,13 @@ elif page_matches(page, 'edit_shipment'):
                     origin = st.text_input(t('origin'), value=ship_data['origin_country'])
                     destination = st.text_input(t('destination'), value=ship_data['destination_country'])
                     departure = st.date_input(t('departure_date'), 
-                                             value=pd.to_datetime(ship_data['departure_date']).date())
+                                             value=pd.to_datetime(ship_data['departure_date'] or date.today()).date())
                 
                 with col2:
                     expected = st.date_input(t('expected_arrival'), 
-                                            value=pd.to_datetime(ship_data['expected_arrival']).date())
-                    weight = st.number_input(t('total_weight'), value=float(ship_data['total_weight']), min_value=0.0)
-                    value_amount = st.number_input(t('total_value'), value=float(ship_data['total_value']), min_value=0.0)
+                                            value=pd.to_datetime(ship_data['expected_arrival'] or date.today()).date())
+                    weight = st.number_input(t('total_weight'), value=float(ship_data['total_weight'] or 0), min_value=0.0)
+                    value_amount = st.number_input(t('total_value'), value=float(ship_data['total_value'] or 0), min_value=0.0)
                     currency = st.selectbox("Currency", ["USD", "EUR", "TRY"], 
                                            index=["USD", "EUR", "TRY"].index(ship_data['currency']))
         
@@ -2514,21 +2700,8 @@ elif page_matches(page, 'edit_shipment'):
                 
                 if submitted:
                     try:
-                        conn = db.get_connection()
-                        cursor = conn.cursor()
-                        
-                        # Execute update
-                        cursor.execute('''
-                            UPDATE shipments 
-                            SET type=%s, origin_country=%s, destination_country=%s,
-                                departure_date=%s, expected_arrival=%s, total_weight=%s, 
-                                total_value=%s, currency=%s, updated_at=CURRENT_TIMESTAMP
-                            WHERE id=%s
-                        ''', (shipment_type, origin, destination, str(departure), str(expected),
-                              weight, value_amount, currency, int(ship_data['id'])))
-                        
-                        conn.commit()
-                        conn.close()
+                        db.update_shipment(int(ship_data['id']), shipment_type, origin, destination,
+                                           str(departure), str(expected), weight, value_amount, currency)
                         
                         # Store in session state
                         st.session_state.last_edited_shipment = selected_shipment
@@ -2552,19 +2725,21 @@ elif page_matches(page, 'delete_shipment'):
     user = st.session_state.get('user')
     if not user or user.get('role') not in ['manager', 'employee']:
         st.error("Only managers and employees can delete shipments.")
-        st.stop()
+        _stop()
 
     try:
-        df = db.get_all_shipments()
+        shipment_nums = get_cached_shipment_numbers()
         
-        if df.empty:
+        if not shipment_nums:
             st.info("No shipments found.")
         else:
             # Select shipment to delete
-            shipment_nums = df['shipment_number'].tolist()
             selected_shipment = st.selectbox("Select Shipment to Delete:", shipment_nums)
             
-            ship_data = df[df['shipment_number'] == selected_shipment].iloc[0]
+            ship_data = db.get_shipment_by_number(selected_shipment)
+            if ship_data is None:
+                st.error("Shipment not found, it may have been deleted.")
+                _stop()
             
             st.markdown("---")
             st.warning(f"⚠️ You are about to delete shipment: **{selected_shipment}**")
@@ -2586,11 +2761,7 @@ elif page_matches(page, 'delete_shipment'):
             
             if st.button("🗑️ Delete Shipment", type="primary", disabled=not confirm):
                 try:
-                    conn = db.get_connection()
-                    cursor = conn.cursor()
-                    cursor.execute('DELETE FROM shipments WHERE id=%s', (int(ship_data['id']),))
-                    conn.commit()
-                    conn.close()
+                    db.delete_shipment(int(ship_data['id']))
                     
                     st.success(f"✅ Shipment {selected_shipment} deleted successfully!")
                     _safe_rerun()
@@ -2670,18 +2841,10 @@ elif page == "💬 Messages":
             # Get list of users to send to
             if user_role == 'client':
                 # Clients can send to employees
-                conn = db.get_connection()
-                cursor = conn.cursor()
-                cursor.execute("SELECT id, email FROM users WHERE role IN ('employee', 'manager')")
-                users = cursor.fetchall()
-                conn.close()
+                users = db.get_users_by_roles(['employee', 'manager'])
             else:
                 # Employees can send to clients
-                conn = db.get_connection()
-                cursor = conn.cursor()
-                cursor.execute("SELECT id, email FROM users WHERE role='client'")
-                users = cursor.fetchall()
-                conn.close()
+                users = db.get_users_by_roles(['client'])
             
             if len(users) == 0:
                 st.warning("No users available to send messages to.")
@@ -2746,3 +2909,4 @@ st.markdown(
     unsafe_allow_html=True
 )
 
+profiler.finish()
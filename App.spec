@@ -1,7 +1,7 @@
 # -*- mode: python ; coding: utf-8 -*-
 from PyInstaller.utils.hooks import collect_all
 
-datas = [('company_data.csv', '.'), ('admin_credentials.txt', '.'), ('employee_credentials.txt', '.'), ('requirements.txt', '.'), ('database.py', '.'), ('database_postgres.py', '.'), ('data_manager.py', '.'), ('assets', 'assets'), ('uploads', 'uploads'), ('shipment_documents', 'shipment_documents')]
+datas = [('company_data.csv', '.'), ('admin_credentials.txt', '.'), ('employee_credentials.txt', '.'), ('requirements.txt', '.'), ('database.py', '.'), ('database_postgres.py', '.'), ('data_manager.py', '.'), ('migrations.py', '.'), ('cache_sync.py', '.'), ('frame_schema.py', '.'), ('exports.py', '.'), ('export_jobs.py', '.'), ('bulk_import.py', '.'), ('query_metrics.py', '.'), ('rerun_profiler.py', '.'), ('metrics_server.py', '.'), ('assets', 'assets'), ('uploads', 'uploads'), ('shipment_documents', 'shipment_documents')]
 binaries = []
 hiddenimports = []
 tmp_ret = collect_all('streamlit')
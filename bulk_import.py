@@ -0,0 +1,271 @@
+"""Bulk import of employee records, shipments and cargo items from CSV or Excel.
+
+read_upload() parses the file with every cell as text. validate() checks all
+rows at once with vectorised pandas operations and splits the frame into rows
+ready to load and per-row errors. Database.import_rows() then loads the valid
+rows into a temporary staging table (COPY on Postgres, executemany on SQLite)
+and merges them into the real table with INSERT ... ON CONFLICT, all in one
+transaction. References that only the database can check (client emails,
+shipment numbers) are resolved during the merge; rows that do not resolve are
+reported instead of failing the whole import.
+
+A file exported from this app can be imported back as it is: unknown columns
+such as role or created_at are ignored, and rows that carry an existing key
+update that row instead of adding a new one.
+"""
+import pandas as pd
+
+# column -> kind; kinds are checked and converted by validate()
+IMPORT_TARGETS = {
+    'records': {
+        'label': 'Employee records',
+        'table': 'company_records',
+        'key': 'id',
+        'columns': {
+            'id': 'int', 'employee_name': 'text', 'department': 'text', 'position': 'text',
+            'salary': 'float', 'hire_date': 'date', 'email': 'email', 'phone': 'text', 'status': 'text',
+        },
+        'required': ('employee_name', 'department', 'position', 'salary', 'hire_date', 'email'),
+        'choices': {'status': ('Active', 'Inactive', 'On Leave')},
+        'defaults': {'status': 'Active'},
+        'unresolved': None,
+        'shipments_touched': None,
+        'existing': "SELECT COUNT(*) FROM import_records i JOIN company_records t ON t.id = i.id",
+        'merge': [
+            '''
+            INSERT INTO company_records (id, employee_name, department, position, salary, hire_date, email, phone, status)
+            SELECT id, employee_name, department, position, salary, hire_date, email, phone, status
+            FROM import_records
+            WHERE id IS NOT NULL
+            ON CONFLICT (id) DO UPDATE SET
+                employee_name = excluded.employee_name, department = excluded.department,
+                position = excluded.position, salary = excluded.salary, hire_date = excluded.hire_date,
+                email = excluded.email, phone = excluded.phone, status = excluded.status
+            ''',
+            '''
+            INSERT INTO company_records (employee_name, department, position, salary, hire_date, email, phone, status)
+            SELECT employee_name, department, position, salary, hire_date, email, phone, status
+            FROM import_records
+            WHERE id IS NULL
+            ORDER BY row_number
+            ''',
+        ],
+    },
+    'shipments': {
+        'label': 'Shipments',
+        'table': 'shipments',
+        'key': 'shipment_number',
+        'columns': {
+            'shipment_number': 'text', 'client_email': 'email', 'type': 'text', 'origin_country': 'text',
+            'destination_country': 'text', 'departure_date': 'date', 'expected_arrival': 'date',
+            'actual_arrival': 'date', 'status': 'text', 'total_weight': 'float', 'total_value': 'float',
+            'currency': 'text', 'customs_cleared': 'bool', 'notes': 'text',
+        },
+        'required': ('shipment_number', 'client_email', 'type', 'departure_date', 'expected_arrival'),
+        'choices': {
+            'type': ('Import', 'Export'),
+            'status': ('Pending', 'In Transit', 'Customs', 'Delivered', 'Cancelled'),
+        },
+        # Totals are normally kept up to date from cargo items; start them at 0 like the add form
+        'defaults': {'status': 'Pending', 'currency': 'USD', 'customs_cleared': '0',
+                     'total_weight': '0', 'total_value': '0'},
+        'unresolved': '''
+            SELECT i.row_number, 'Unknown client email: ' || i.client_email
+            FROM import_shipments i
+            LEFT JOIN users u ON u.email = i.client_email
+            WHERE u.id IS NULL
+        ''',
+        'shipments_touched': None,
+        'existing': '''
+            SELECT COUNT(*)
+            FROM import_shipments i
+            JOIN users u ON u.email = i.client_email
+            JOIN shipments t ON t.shipment_number = i.shipment_number
+        ''',
+        'merge': [
+            '''
+            INSERT INTO shipments (shipment_number, client_id, type, origin_country, destination_country,
+                                   departure_date, expected_arrival, actual_arrival, status, total_weight,
+                                   total_value, currency, customs_cleared, notes)
+            SELECT i.shipment_number, u.id, i.type, i.origin_country, i.destination_country,
+                   i.departure_date, i.expected_arrival, i.actual_arrival, i.status, i.total_weight,
+                   i.total_value, i.currency, i.customs_cleared, i.notes
+            FROM import_shipments i
+            JOIN users u ON u.email = i.client_email
+            WHERE TRUE
+            ORDER BY i.row_number
+            ON CONFLICT (shipment_number) DO UPDATE SET
+                client_id = excluded.client_id, type = excluded.type,
+                origin_country = excluded.origin_country, destination_country = excluded.destination_country,
+                departure_date = excluded.departure_date, expected_arrival = excluded.expected_arrival,
+                actual_arrival = excluded.actual_arrival, status = excluded.status,
+                total_weight = excluded.total_weight, total_value = excluded.total_value,
+                currency = excluded.currency, customs_cleared = excluded.customs_cleared,
+                notes = excluded.notes, updated_at = CURRENT_TIMESTAMP
+            ''',
+        ],
+    },
+    'cargo_items': {
+        'label': 'Cargo items',
+        'table': 'cargo_items',
+        'key': 'id',
+        'columns': {
+            'id': 'int', 'shipment_number': 'text', 'item_name': 'text', 'description': 'text',
+            'quantity': 'int', 'unit': 'text', 'weight': 'float', 'value': 'float', 'hs_code': 'text',
+        },
+        'required': ('shipment_number', 'item_name', 'quantity'),
+        'choices': {'unit': ('pcs', 'kg', 'ton', 'box', 'container')},
+        'defaults': {'unit': 'pcs'},
+        'unresolved': '''
+            SELECT i.row_number, 'Unknown shipment number: ' || i.shipment_number
+            FROM import_cargo_items i
+            LEFT JOIN shipments s ON s.shipment_number = i.shipment_number
+            WHERE s.id IS NULL
+        ''',
+        # Run before the merge: the shipments an item moves away from need new totals too
+        'shipments_touched': '''
+            SELECT c.shipment_id FROM cargo_items c JOIN import_cargo_items i ON i.id = c.id
+            UNION
+            SELECT s.id FROM import_cargo_items i JOIN shipments s ON s.shipment_number = i.shipment_number
+        ''',
+        'existing': '''
+            SELECT COUNT(*)
+            FROM import_cargo_items i
+            JOIN shipments s ON s.shipment_number = i.shipment_number
+            JOIN cargo_items t ON t.id = i.id
+        ''',
+        'merge': [
+            '''
+            INSERT INTO cargo_items (id, shipment_id, item_name, description, quantity, unit, weight, value, hs_code)
+            SELECT i.id, s.id, i.item_name, i.description, i.quantity, i.unit, i.weight, i.value, i.hs_code
+            FROM import_cargo_items i
+            JOIN shipments s ON s.shipment_number = i.shipment_number
+            WHERE i.id IS NOT NULL
+            ON CONFLICT (id) DO UPDATE SET
+                shipment_id = excluded.shipment_id, item_name = excluded.item_name,
+                description = excluded.description, quantity = excluded.quantity, unit = excluded.unit,
+                weight = excluded.weight, value = excluded.value, hs_code = excluded.hs_code
+            ''',
+            '''
+            INSERT INTO cargo_items (shipment_id, item_name, description, quantity, unit, weight, value, hs_code)
+            SELECT s.id, i.item_name, i.description, i.quantity, i.unit, i.weight, i.value, i.hs_code
+            FROM import_cargo_items i
+            JOIN shipments s ON s.shipment_number = i.shipment_number
+            WHERE i.id IS NULL
+            ORDER BY i.row_number
+            ''',
+        ],
+    },
+}
+
+_SQL_TYPES = {'int': 'INTEGER', 'float': 'REAL', 'bool': 'INTEGER'}
+
+_KIND_ERRORS = {
+    'int': 'must be a whole number',
+    'float': 'must be a number of zero or more',
+    'date': 'must be a date (YYYY-MM-DD)',
+    'email': 'must be an email address',
+    'bool': 'must be yes/no, true/false or 1/0',
+}
+
+_BOOL_VALUES = {'1': 1, 'true': 1, 'yes': 1, 'y': 1, '0': 0, 'false': 0, 'no': 0, 'n': 0}
+
+
+def read_upload(uploaded_file):
+    """Read an uploaded .csv or .xlsx file with every cell as text"""
+    name = uploaded_file.name.lower()
+    if name.endswith('.csv'):
+        return pd.read_csv(uploaded_file, dtype=str, keep_default_na=False, encoding='utf-8-sig')
+    if name.endswith(('.xlsx', '.xlsm')):
+        return pd.read_excel(uploaded_file, dtype=str, keep_default_na=False, engine='openpyxl')
+    raise ValueError("Upload a .csv or .xlsx file")
+
+
+def staging_columns(target_name):
+    """Columns of the staging table, in the order import rows carry them"""
+    return ['row_number'] + list(IMPORT_TARGETS[target_name]['columns'])
+
+
+def staging_table_sql(target_name):
+    """CREATE TEMP TABLE statement for a target's staging table (valid on both backends)"""
+    columns = IMPORT_TARGETS[target_name]['columns']
+    definitions = ', '.join(f"{column} {_SQL_TYPES.get(kind, 'TEXT')}" for column, kind in columns.items())
+    return f"CREATE TEMP TABLE import_{target_name} (row_number INTEGER, {definitions})"
+
+
+def validate(df, target_name):
+    """Check every row of an uploaded frame against a target.
+
+    Returns (rows, errors). rows has the staging columns with converted values and
+    only the rows that passed; errors has one line per problem with the row
+    number as a spreadsheet shows it (the header is row 1). Raises ValueError
+    when a required column is missing altogether.
+    """
+    target = IMPORT_TARGETS[target_name]
+    df = df.rename(columns=lambda column: str(column).strip().lower())
+    missing = [column for column in target['required'] if column not in df.columns]
+    if missing:
+        raise ValueError(f"Missing required column(s): {', '.join(missing)}")
+
+    row_numbers = pd.Series(range(2, len(df) + 2), index=df.index)
+    rows = pd.DataFrame({'row_number': row_numbers})
+    problems = []
+    for column, kind in target['columns'].items():
+        if column in df.columns:
+            raw = df[column]
+            text = raw.astype(str).where(raw.notna()).str.strip()
+            text = text.mask(text == '')
+        else:
+            text = pd.Series(None, index=df.index, dtype=object)
+        if column in target['defaults']:
+            text = text.fillna(target['defaults'][column])
+        blank = text.isna()
+        if column in target['required']:
+            problems.append((blank, f"{column} is required"))
+
+        value, invalid = _convert(text, kind)
+        if kind in _KIND_ERRORS:
+            problems.append((invalid & ~blank, f"{column} {_KIND_ERRORS[kind]}"))
+        if column in target['choices']:
+            allowed = target['choices'][column]
+            problems.append((~blank & ~value.isin(allowed), f"{column} must be one of {', '.join(allowed)}"))
+        rows[column] = value
+
+    key = rows[target['key']]
+    problems.append((key.notna() & key.duplicated(), f"{target['key']} appears more than once in the file"))
+
+    errors = pd.concat(
+        [pd.DataFrame({'row': row_numbers[mask], 'error': message}) for mask, message in problems if mask.any()]
+        or [pd.DataFrame({'row': pd.Series(dtype='int64'), 'error': pd.Series(dtype=object)})],
+        ignore_index=True,
+    ).sort_values('row', kind='stable', ignore_index=True)
+    rows = rows[~rows['row_number'].isin(errors['row'])].reset_index(drop=True)
+    return rows, errors
+
+
+def _convert(text, kind):
+    """Convert a text column to kind; returns (values, mask of unconvertible values)"""
+    if kind in ('int', 'float'):
+        number = pd.to_numeric(text, errors='coerce')
+        if kind == 'int':
+            invalid = number.isna() | (number % 1 != 0)
+            return number.where(~invalid).astype('Int64'), invalid
+        invalid = number.isna() | (number < 0)
+        return number.where(~invalid), invalid
+    if kind == 'date':
+        parsed = pd.to_datetime(text, format='ISO8601', errors='coerce')
+        # Dates are stored as YYYY-MM-DD text, like the add forms write them
+        return parsed.dt.strftime('%Y-%m-%d').astype(object).where(parsed.notna(), None), parsed.isna()
+    if kind == 'bool':
+        flag = text.str.lower().map(_BOOL_VALUES)
+        return flag.astype('Int64'), flag.isna()
+    if kind == 'email':
+        valid = text.str.fullmatch(r'[^@\s]+@[^@\s]+\.[^@\s]+').fillna(False).astype(bool)
+        return text.where(valid, None), ~valid
+    return text.where(text.notna(), None), pd.Series(False, index=text.index)
+
+
+def row_tuples(rows):
+    """Rows as tuples of plain Python values (None for missing), for executemany"""
+    columns = [[None if pd.isna(value) else value for value in rows[column].tolist()] for column in rows.columns]
+    return list(zip(*columns))
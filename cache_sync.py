@@ -0,0 +1,255 @@
+"""Cross-session cache invalidation driven by per-table version counters.
+
+Triggers bump table_versions on every write to a tracked table (see migration 5).
+One TableVersionWatcher per process keeps the latest counters in memory: on
+Postgres it LISTENs for the NOTIFY sent by those triggers, elsewhere it polls.
+Cached loaders take the counters of the tables they read as arguments, so a
+cache entry is replaced only when one of its tables actually changed, in any
+session or process. DeltaFrameCache then refreshes such an entry by fetching
+only the rows that changed instead of the whole table. CACHE_STATS counts the
+hits and misses of both kinds of cache for the metrics endpoint.
+"""
+import functools
+import logging
+import select
+import threading
+import time
+from datetime import timedelta
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+
+class CacheStats:
+    """Lookups per named cache by result ('hit', 'miss' or 'delta') and the seconds spent loading"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._caches = {}
+
+    def record(self, name, result=None, load_seconds=0.0):
+        with self._lock:
+            cache = self._caches.setdefault(name, {'results': {}, 'load_seconds': 0.0})
+            if result is not None:
+                cache['results'][result] = cache['results'].get(result, 0) + 1
+            cache['load_seconds'] += load_seconds
+
+    def snapshot(self):
+        """{name: {'results': {result: count}, 'load_seconds': s}}"""
+        with self._lock:
+            return {name: {'results': dict(cache['results']), 'load_seconds': cache['load_seconds']}
+                    for name, cache in self._caches.items()}
+
+
+CACHE_STATS = CacheStats()
+
+_local = threading.local()
+
+
+def tracked_cache(name, cache, stats=CACHE_STATS):
+    """Apply a caching decorator such as st.cache_data(...) to a loader, counting
+    hits and misses under name; a miss is a call that ran the loader itself"""
+    def decorate(func):
+        @functools.wraps(func)
+        def load(*args, **kwargs):
+            _local.loads = getattr(_local, 'loads', 0) + 1
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                stats.record(name, load_seconds=time.perf_counter() - started)
+
+        cached = cache(load)
+
+        @functools.wraps(func)
+        def lookup(*args, **kwargs):
+            loads = getattr(_local, 'loads', 0)
+            try:
+                return cached(*args, **kwargs)
+            finally:
+                stats.record(name, 'miss' if getattr(_local, 'loads', 0) != loads else 'hit')
+
+        lookup.clear = cached.clear
+        return lookup
+    return decorate
+
+
+class TableVersionWatcher:
+    def __init__(self, load_versions, listen_connection=None, poll_interval=5.0, listen_timeout=60.0):
+        """load_versions() returns {table: version}; listen_connection() returns a
+        psycopg2 connection already LISTENing, or is None to poll instead."""
+        self._load_versions = load_versions
+        self._listen_connection = listen_connection
+        self.poll_interval = poll_interval
+        self.listen_timeout = listen_timeout
+        self._lock = threading.Lock()
+        self._versions = {}
+        self._stop = threading.Event()
+        self._thread = None
+        self.refresh()
+
+    def snapshot(self, *tables):
+        """Versions of the given tables, as a hashable cache key"""
+        with self._lock:
+            return tuple(self._versions.get(table, 0) for table in tables)
+
+    def refresh(self):
+        """Re-read every counter now, e.g. right after this session wrote something"""
+        try:
+            versions = self._load_versions()
+        except Exception as e:
+            logger.warning(f"Could not read table versions: {e}")
+            return
+        self._merge(versions)
+
+    def _merge(self, versions):
+        # Counters only grow; never let a late or reordered read move one backwards
+        with self._lock:
+            for table, version in versions.items():
+                if version > self._versions.get(table, 0):
+                    self._versions[table] = version
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="table-version-watcher", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                if self._listen_connection is not None:
+                    self._listen()
+                else:
+                    self._stop.wait(self.poll_interval)
+                    self.refresh()
+            except Exception as e:
+                logger.warning(f"Table version listener failed, retrying: {e}")
+                self._stop.wait(self.poll_interval)
+
+    def _listen(self):
+        conn = self._listen_connection()
+        try:
+            # Pick up anything committed between the last read and LISTEN taking effect
+            self.refresh()
+            while not self._stop.is_set():
+                if select.select([conn], [], [], self.listen_timeout) == ([], [], []):
+                    # Quiet period: re-read as a safety net against lost notifications
+                    self.refresh()
+                    continue
+                conn.poll()
+                updates = {}
+                while conn.notifies:
+                    table, _, version = conn.notifies.pop(0).payload.rpartition(':')
+                    updates[table] = max(updates.get(table, 0), int(version))
+                self._merge(updates)
+        finally:
+            conn.close()
+
+
+class DeltaFrameCache:
+    """The last full frame of a table, kept current by merging in changed rows.
+
+    load_all() returns the whole frame. load_changes(since) returns the rows whose
+    timestamp column is >= since and a frame of tombstones (row_id, deleted_at)
+    for rows deleted since then. prepare(frame), if given, is applied to both
+    before they are cached (e.g. to compact dtypes). Lookups are counted in stats
+    under name, if one is given. The watermark is the newest timestamp seen; each
+    fetch starts overlap before it, so a row stamped before the watermark but
+    committed after the previous fetch is still picked up. Re-fetched rows simply
+    replace themselves.
+    """
+
+    def __init__(self, load_all, load_changes, key='id', timestamp='updated_at',
+                 overlap=timedelta(minutes=2), max_age=timedelta(days=6), prepare=None,
+                 name=None, stats=CACHE_STATS):
+        self._load_all = load_all
+        self._load_changes = load_changes
+        self._prepare = prepare or (lambda frame: frame)
+        self.name = name
+        self._stats = stats
+        self.key = key
+        self.timestamp = timestamp
+        self.overlap = overlap
+        # Past this, tombstones may have been pruned and a delta could miss deletes
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._frame = None
+        self._watermark = None
+        self._version = None
+        self._reset_token = None
+        self._synced_at = 0.0
+
+    def get(self, version, reset_token=None):
+        """Frame for this table version; a new reset_token forces a full reload.
+
+        Returns a shallow copy: adding columns is safe, editing values in place is not.
+        """
+        with self._lock:
+            started = time.perf_counter()
+            result = 'hit'
+            stale = time.monotonic() - self._synced_at > self.max_age.total_seconds()
+            if self._frame is None or stale or reset_token != self._reset_token:
+                result = 'miss'
+                self._reload()
+            elif version != self._version:
+                # Without a watermark (the table was empty) there is nothing to diff against
+                if self._watermark is None:
+                    result = 'miss'
+                    self._reload()
+                else:
+                    result = 'delta'
+                    self._apply_changes()
+            if self.name:
+                self._stats.record(self.name, result, 0.0 if result == 'hit' else time.perf_counter() - started)
+            self._version = version
+            self._reset_token = reset_token
+            return self._frame.copy(deep=False)
+
+    def _reload(self):
+        self._frame = self._prepare(self._load_all())
+        self._watermark = self._newest(self._frame[self.timestamp]) if self.timestamp in self._frame else None
+        self._synced_at = time.monotonic()
+
+    def _apply_changes(self):
+        since = self._watermark - self.overlap
+        changed, deleted = self._load_changes(since.to_pydatetime())
+        changed = self._prepare(changed)
+        drop = set(deleted['row_id']) | set(changed[self.key])
+        frame = self._frame
+        if drop:
+            frame = frame[~frame[self.key].isin(drop)]
+        if not changed.empty:
+            changed, frame = _align_categories(changed, frame)
+            frame = pd.concat([changed, frame], ignore_index=True)
+        # Database round-trip cost is O(changed rows); the merge below is an in-memory pass
+        self._frame = frame.sort_values(self.key, ascending=False, ignore_index=True)
+        seen = [self._newest(changed[self.timestamp]), self._newest(deleted['deleted_at'])]
+        self._watermark = max([self._watermark] + [t for t in seen if t is not None])
+        self._synced_at = time.monotonic()
+        logger.debug(f"Delta refresh: {len(changed)} changed, {len(deleted)} deleted since {since}")
+
+    @staticmethod
+    def _newest(values):
+        if len(values) == 0:
+            return None
+        newest = pd.to_datetime(values).max()
+        return None if pd.isna(newest) else newest
+
+
+def _align_categories(left, right):
+    """Give shared categorical columns the same categories, so concat keeps them
+    categorical instead of falling back to object strings"""
+    left, right = left.copy(deep=False), right.copy(deep=False)
+    for column in left.columns.intersection(right.columns):
+        a, b = left[column], right[column]
+        if isinstance(a.dtype, pd.CategoricalDtype) and isinstance(b.dtype, pd.CategoricalDtype):
+            categories = b.cat.categories.union(a.cat.categories, sort=False)
+            # Only the integer codes are remapped; the strings are not factorized again
+            left[column] = a.cat.set_categories(categories)
+            right[column] = b.cat.set_categories(categories)
+    return left, right
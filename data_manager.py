@@ -1,22 +1,213 @@
+import codecs
+import os
 import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.cell.cell import ILLEGAL_CHARACTERS_RE
 from database_postgres import Database
+import exports
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+# Rows per worksheet, header included; longer exports continue on another sheet
+EXCEL_MAX_ROWS = 1048576
+
+
+def _value_counts(values):
+    """value_counts without the zero rows a categorical column reports for unused categories"""
+    counts = values.value_counts()
+    return counts[counts > 0]
+
+
+def _excel_value(sheet, value):
+    """A value openpyxl will write verbatim"""
+    if isinstance(value, str):
+        value = ILLEGAL_CHARACTERS_RE.sub('', value)
+        if value.startswith('='):
+            # Stored text such as "=SUM(A1)" must not turn into a live formula
+            cell = WriteOnlyCell(sheet, value)
+            cell.data_type = 's'
+            return cell
+    return value
+
+
+def _arrow_type(logical_type):
+    """pyarrow type for a logical type from exports.EXPORT_COLUMN_TYPES"""
+    return {
+        'int': pa.int64(),
+        'float': pa.float64(),
+        'bool': pa.bool_(),
+        'text': pa.string(),
+        'category': pa.dictionary(pa.int32(), pa.string()),
+        'date': pa.date32(),
+        'timestamp': pa.timestamp('us'),
+    }[logical_type]
+
+
+def _arrow_column(values, arrow_type):
+    """Convert one column of a fetched batch to an Arrow array of arrow_type"""
+    if pa.types.is_dictionary(arrow_type):
+        return pa.array(values, pa.string()).dictionary_encode()
+    if pa.types.is_date(arrow_type) or pa.types.is_timestamp(arrow_type):
+        # Postgres returns datetimes and SQLite returns text; parse both the same way
+        parsed = pd.to_datetime(pd.Series(values, dtype=object), errors='coerce')
+        return pa.Array.from_pandas(parsed).cast(arrow_type, safe=False)
+    if pa.types.is_boolean(arrow_type):
+        values = [None if value is None else bool(value) for value in values]
+    return pa.array(values, arrow_type)
+
 
 class DataManager:
-    def __init__(self):
-        self.db = Database()
+    def __init__(self, db=None):
+        self.db = db if db is not None else Database()
     
-    def export_to_csv(self, df, filename="company_data.csv"):
+    def export_to_csv(self, df, filename=None):
+        """Write df to filename, or to a new temp file when None; returns the path"""
+        if filename is None:
+            out, filename = exports.temp_export_file('frame', '.csv')
+            out.close()
         df.to_csv(filename, index=False, encoding='utf-8-sig')
         return filename
     
-    def export_to_excel(self, df, filename="company_data.xlsx"):
+    def export_to_excel(self, df, filename=None):
+        """Write df to filename, or to a new temp file when None; returns the path"""
+        if filename is None:
+            out, filename = exports.temp_export_file('frame', '.xlsx')
+            out.close()
         df.to_excel(filename, index=False, engine='openpyxl')
         return filename
+
+    def export_table_csv(self, name):
+        """Stream a whitelisted export (see exports.EXPORT_QUERIES) from the database
+        into a new temp file and return its path; the caller removes the file"""
+        out, path = exports.temp_export_file(name, '.csv')
+        try:
+            with out:
+                # BOM so Excel opens the UTF-8 file with the right encoding, as export_to_csv does
+                out.write(codecs.BOM_UTF8)
+                self.db.export_csv(name, out)
+        except BaseException:
+            os.remove(path)
+            raise
+        return path
+
+    def export_tables_excel(self, names, progress=None):
+        """Stream whitelisted exports into one workbook, a sheet per export, and
+        return the temp file path; the caller removes the file.
+
+        Rows come from iter_export_rows batch by batch and go into a write-only
+        workbook, which spools them to disk instead of keeping cells in memory.
+        progress(name, rows_written, exports_done, exports_total) is called
+        after every batch.
+        """
+        out, path = exports.temp_export_file('_'.join(names), '.xlsx')
+        out.close()
+        try:
+            workbook = Workbook(write_only=True)
+            for done, name in enumerate(names):
+                batches = self.db.iter_export_rows(name)
+                header = next(batches)
+                label = exports.EXPORT_LABELS[name]
+                sheet = workbook.create_sheet(label)
+                sheet.append(header)
+                sheet_rows, part, written = 1, 1, 0
+                for rows in batches:
+                    for row in rows:
+                        if sheet_rows == EXCEL_MAX_ROWS:
+                            part += 1
+                            sheet = workbook.create_sheet(f"{label} ({part})")
+                            sheet.append(header)
+                            sheet_rows = 1
+                        sheet.append([_excel_value(sheet, value) for value in row])
+                        sheet_rows += 1
+                    written += len(rows)
+                    if progress:
+                        progress(name, written, done, len(names))
+                if progress:
+                    progress(name, written, done + 1, len(names))
+            workbook.save(path)
+        except BaseException:
+            os.remove(path)
+            raise
+        return path
+
+    def export_table_parquet(self, name, progress=None):
+        """Stream a whitelisted export into a Parquet file (dictionary-encoded, zstd),
+        one row group per fetched batch; returns the temp file path"""
+        return self._export_columnar(name, '.parquet', progress)
+
+    def export_table_arrow(self, name, progress=None):
+        """Stream a whitelisted export into an Arrow IPC file, one record batch per
+        fetched batch; returns the temp file path"""
+        return self._export_columnar(name, '.arrow', progress)
+
+    def _export_columnar(self, name, suffix, progress):
+        if pa is None:
+            raise RuntimeError("Parquet and Arrow exports need pyarrow (pip install pyarrow)")
+        out, path = exports.temp_export_file(name, suffix)
+        out.close()
+        try:
+            batches = self.db.iter_export_rows(name, batch_size=exports.COLUMNAR_BATCH_ROWS)
+            header = next(batches)
+            types = exports.EXPORT_COLUMN_TYPES[name]
+            schema = pa.schema([(column, _arrow_type(types[column])) for column in header])
+            if suffix == '.parquet':
+                writer = pq.ParquetWriter(path, schema, compression='zstd', use_dictionary=True)
+            else:
+                # The IPC file format cannot replace a dictionary between batches, so
+                # categories are written as plain strings and left to compression
+                schema = pa.schema([
+                    field.with_type(pa.string()) if pa.types.is_dictionary(field.type) else field
+                    for field in schema
+                ])
+                writer = pa.ipc.new_file(path, schema, options=pa.ipc.IpcWriteOptions(compression='zstd'))
+            written = 0
+            with writer:
+                for rows in batches:
+                    columns = list(zip(*rows))
+                    arrays = [_arrow_column(values, field.type) for values, field in zip(columns, schema)]
+                    writer.write_batch(pa.RecordBatch.from_arrays(arrays, schema=schema))
+                    written += len(rows)
+                    if progress:
+                        progress(name, written, 0, 1)
+            if progress:
+                progress(name, written, 1, 1)
+        except BaseException:
+            os.remove(path)
+            raise
+        return path
     
+    def diff_rows(self, original, edited, columns, key='id'):
+        """Compare a frame with what st.data_editor returned for it.
+
+        Returns (added, updated, deleted): new rows and rows whose columns
+        changed as lists of dicts (updated ones also carry key), and the keys
+        of rows that were removed.
+        """
+        is_new = edited[key].isna()
+        before = original.set_index(key)[columns]
+        after = edited.loc[~is_new].set_index(key)[columns]
+        after.index = after.index.astype(before.index.dtype)
+
+        deleted = before.index.difference(after.index)
+        common = after.index.intersection(before.index)
+        before, after = before.loc[common], after.loc[common]
+        same = (before == after) | (before.isna() & after.isna())
+        changed = after[~same.all(axis=1)].reset_index()
+
+        def records(frame):
+            return frame.astype(object).where(frame.notna(), None).to_dict('records')
+
+        return records(edited.loc[is_new, columns]), records(changed), [int(k) for k in deleted]
+
     def create_department_chart(self, df):
-        dept_counts = df['department'].value_counts()
+        dept_counts = _value_counts(df['department'])
         fig = px.bar(
             x=dept_counts.index,
             y=dept_counts.values,
@@ -33,7 +224,7 @@ class DataManager:
         return fig
     
     def create_salary_chart(self, df):
-        avg_salary = df.groupby('department')['salary'].mean().sort_values(ascending=False)
+        avg_salary = df.groupby('department', observed=True)['salary'].mean().sort_values(ascending=False)
         fig = px.bar(
             x=avg_salary.index,
             y=avg_salary.values,
@@ -50,7 +241,7 @@ class DataManager:
         return fig
     
     def create_status_pie_chart(self, df):
-        status_counts = df['status'].value_counts()
+        status_counts = _value_counts(df['status'])
         fig = px.pie(
             values=status_counts.values,
             names=status_counts.index,
@@ -60,7 +251,7 @@ class DataManager:
         return fig
     
     def create_position_chart(self, df):
-        position_counts = df['position'].value_counts().head(10)
+        position_counts = _value_counts(df['position']).head(10)
         fig = px.bar(
             x=position_counts.values,
             y=position_counts.index,
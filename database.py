@@ -1,71 +1,93 @@
+import csv
+import io
 import sqlite3
 import pandas as pd
 from datetime import datetime
 import streamlit as st
+import migrations
+import exports
+import bulk_import
+
+
+def _split_page(df, limit):
+    """Trim a LIMIT n+1 result to n rows; the cursor is the last kept id, or None on the last page"""
+    if len(df) > limit:
+        df = df.iloc[:limit]
+        return df, int(df['id'].iloc[-1])
+    return df, None
+
+
+# Kind column of the get_record_filter_options query -> key of the dict it returns
+FILTER_OPTION_KEYS = {'department': 'departments', 'status': 'statuses', 'role': 'roles'}
+
+# Fixed columns and dtypes of the frames returned by get_shipment_bundle, so
+# callers get the same shape whether or not a shipment has any child rows
+SHIPMENT_BUNDLE_FRAMES = {
+    'cargo_items': {
+        'id': 'int64', 'shipment_id': 'int64', 'item_name': 'object', 'description': 'object',
+        'quantity': 'int64', 'unit': 'object', 'weight': 'float64', 'value': 'float64',
+        'hs_code': 'object', 'created_at': 'datetime64[ns]',
+    },
+    'tracking': {
+        'id': 'int64', 'shipment_id': 'int64', 'location': 'object', 'status': 'object',
+        'notes': 'object', 'update_date': 'object', 'created_by': 'Int64',
+        'created_at': 'datetime64[ns]', 'updated_by_email': 'object',
+    },
+    'documents': {
+        'id': 'int64', 'shipment_id': 'int64', 'document_type': 'object', 'file_path': 'object',
+        'uploaded_by': 'Int64', 'notes': 'object', 'created_at': 'datetime64[ns]',
+        'uploaded_by_email': 'object',
+    },
+}
+
+
+def _cargo_fields(item):
+    """Item fields of a cargo item dict, in column order, with the add form's defaults"""
+    return (
+        item['item_name'], item.get('description') or '', int(item['quantity']), item.get('unit') or 'pcs',
+        float(item.get('weight') or 0), float(item.get('value') or 0), item.get('hs_code') or '',
+    )
+
+
+def _recompute_shipment_totals(cursor, shipment_ids):
+    """Set total_weight/total_value of the given shipments from their cargo items"""
+    cursor.executemany('''
+        UPDATE shipments
+        SET total_weight = (SELECT COALESCE(SUM(weight), 0) FROM cargo_items WHERE shipment_id = shipments.id),
+            total_value = (SELECT COALESCE(SUM(value), 0) FROM cargo_items WHERE shipment_id = shipments.id),
+            updated_at = CURRENT_TIMESTAMP
+        WHERE id = ?
+    ''', [(int(shipment_id),) for shipment_id in sorted(set(shipment_ids))])
+
+
+def _typed_frame(rows, dtypes):
+    """Build a frame with exactly the given columns, coerced to the given dtypes"""
+    df = pd.DataFrame(rows, columns=list(dtypes))
+    for column, dtype in dtypes.items():
+        if dtype.startswith('datetime'):
+            # Fractional seconds are left out when zero, so one column can mix precisions
+            df[column] = pd.to_datetime(df[column], format='ISO8601')
+        else:
+            df[column] = df[column].astype(dtype)
+    return df
+
 
 class Database:
     def __init__(self, db_name="company_data.db"):
         self.db_name = db_name
-        self.init_database()
+        conn = self.get_connection()
+        try:
+            migrations.migrate(conn, migrations.SQLITE)
+        finally:
+            conn.close()
     
-    def init_database(self):
-        conn = sqlite3.connect(self.db_name)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS company_records (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                employee_name TEXT NOT NULL,
-                department TEXT NOT NULL,
-                position TEXT NOT NULL,
-                salary REAL NOT NULL,
-                hire_date TEXT NOT NULL,
-                email TEXT,
-                phone TEXT,
-                status TEXT DEFAULT 'Active',
-                created_at TEXT DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        
-        cursor.execute("SELECT COUNT(*) FROM company_records")
-        if cursor.fetchone()[0] == 0:
-            sample_data = [
-                ('Ahmed Mohammed', 'IT', 'Software Developer', 5000, '2023-01-15', 'ahmed@company.com', '0501234567', 'Active'),
-                ('Fatima Ali', 'HR', 'HR Manager', 6000, '2022-06-10', 'fatima@company.com', '0507654321', 'Active'),
-                ('Mohammed Khalid', 'Sales', 'Sales Representative', 4500, '2023-03-20', 'mohammed@company.com', '0509876543', 'Active'),
-                ('Sara Ahmed', 'Marketing', 'Marketing Specialist', 4800, '2023-02-01', 'sara@company.com', '0502345678', 'Active'),
-                ('Abdullah Youssef', 'Finance', 'Accountant', 5200, '2022-09-15', 'abdullah@company.com', '0508765432', 'Active'),
-            ]
-            cursor.executemany('''
-                INSERT INTO company_records (employee_name, department, position, salary, hire_date, email, phone, status)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-            ''', sample_data)
-        
-        conn.commit()
-        conn.close()
-
-    def init_users_table(self):
+    def get_table_versions(self):
         conn = self.get_connection()
         cursor = conn.cursor()
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS users (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                email TEXT UNIQUE NOT NULL,
-                password_hash TEXT NOT NULL,
-                salt TEXT NOT NULL,
-                role TEXT DEFAULT 'user',
-                created_at TEXT DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        cursor.execute("PRAGMA table_info(users)")
-        cols = [r[1] for r in cursor.fetchall()]
-        if 'role' not in cols:
-            try:
-                cursor.execute("ALTER TABLE users ADD COLUMN role TEXT DEFAULT 'user'")
-            except Exception:
-                pass
-        conn.commit()
+        cursor.execute('SELECT table_name, version FROM table_versions')
+        versions = dict(cursor.fetchall())
         conn.close()
+        return versions
 
     def create_user(self, email, password_hash, salt, role='user'):
         conn = self.get_connection()
@@ -99,47 +121,6 @@ class Database:
             }
         return None
 
-    def init_leave_table(self):
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS leave_requests (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER NOT NULL,
-                start_date TEXT NOT NULL,
-                end_date TEXT NOT NULL,
-                reason TEXT,
-                leave_type TEXT DEFAULT 'Other',
-                attachment TEXT DEFAULT '',
-                status TEXT DEFAULT 'Pending',
-                admin_response TEXT DEFAULT '',
-                created_at TEXT DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY(user_id) REFERENCES users(id)
-            )
-        ''')
-        conn.commit()
-        cursor.execute("PRAGMA table_info(leave_requests)")
-        cols = [r[1] for r in cursor.fetchall()]
-        if 'leave_type' not in cols:
-            try:
-                cursor.execute("ALTER TABLE leave_requests ADD COLUMN leave_type TEXT DEFAULT 'Other'")
-                conn.commit()
-            except Exception:
-                pass
-        if 'attachment' not in cols:
-            try:
-                cursor.execute("ALTER TABLE leave_requests ADD COLUMN attachment TEXT DEFAULT ''")
-                conn.commit()
-            except Exception:
-                pass
-        if 'admin_response' not in cols:
-            try:
-                cursor.execute("ALTER TABLE leave_requests ADD COLUMN admin_response TEXT DEFAULT ''")
-                conn.commit()
-            except Exception:
-                pass
-        conn.close()
-
     def create_leave_request(self, user_id, start_date, end_date, reason, leave_type='Other', attachment=''):
         conn = self.get_connection()
         cursor = conn.cursor()
@@ -162,6 +143,12 @@ class Database:
         conn.close()
         return df
 
+    def get_leave_requests_page(self, cursor=None, limit=50, status=None):
+        return self._read_page(
+            'SELECT lr.id, lr.user_id, u.email as user_email, lr.start_date, lr.end_date, lr.reason, lr.leave_type, lr.attachment, lr.status, lr.admin_response, lr.created_at FROM leave_requests lr JOIN users u ON lr.user_id=u.id',
+            'lr.id', {'lr.status': status}, cursor, limit
+        )
+
     def update_leave_request_status(self, request_id, status, admin_response=None):
         conn = self.get_connection()
         cursor = conn.cursor()
@@ -177,12 +164,37 @@ class Database:
         conn.execute("PRAGMA foreign_keys = ON")  # Enable foreign keys
         return conn
 
+    def _read_page(self, select, id_column, filters, cursor, limit, extra_conditions=(), params=()):
+        """Run select newest-first from cursor using keyset pagination on id_column.
+
+        filters maps a column to the value it must equal; None means no filter.
+        Returns (df, next_cursor) with next_cursor None on the last page.
+        """
+        conditions = list(extra_conditions)
+        params = list(params)
+        for column, value in filters.items():
+            if value is not None:
+                conditions.append(f"{column} = ?")
+                params.append(value)
+        if cursor is not None:
+            conditions.append(f"{id_column} < ?")
+            params.append(cursor)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        params.append(limit + 1)
+        conn = self.get_connection()
+        df = pd.read_sql_query(f"{select} {where} ORDER BY {id_column} DESC LIMIT ?", conn, params=params)
+        conn.close()
+        return _split_page(df, limit)
+
     def get_all_users(self):
         conn = self.get_connection()
         df = pd.read_sql_query('SELECT id, email, role, created_at FROM users ORDER BY id DESC', conn)
         conn.close()
         return df
 
+    def get_users_page(self, cursor=None, limit=50, role=None):
+        return self._read_page('SELECT id, email, role, created_at FROM users', 'id', {'role': role}, cursor, limit)
+
     def update_user_role(self, user_id, role):
         conn = self.get_connection()
         cursor = conn.cursor()
@@ -196,6 +208,29 @@ class Database:
         conn.close()
         return df
     
+    def get_records_changed_since(self, since):
+        # Timestamps are stored as 'YYYY-MM-DD HH:MM:SS' text, which compares in time order
+        since = pd.Timestamp(since).strftime('%Y-%m-%d %H:%M:%S')
+        conn = self.get_connection()
+        changed = pd.read_sql_query(
+            "SELECT * FROM company_records WHERE updated_at >= ? ORDER BY id DESC", conn, params=(since,)
+        )
+        deleted = pd.read_sql_query(
+            "SELECT row_id, deleted_at FROM deleted_rows WHERE table_name = 'company_records' AND deleted_at >= ?",
+            conn, params=(since,)
+        )
+        conn.close()
+        return changed, deleted
+    
+    def get_records_page(self, cursor=None, limit=50, department=None, status=None, role=None):
+        """One page of records newest first; pass the returned cursor back for the next page"""
+        return self._read_page(
+            """SELECT cr.*, u.role
+               FROM company_records cr
+               LEFT JOIN users u ON cr.email = u.email""",
+            'cr.id', {'cr.department': department, 'cr.status': status, 'u.role': role}, cursor, limit
+        )
+    
     def add_record(self, employee_name, department, position, salary, hire_date, email, phone, status):
         conn = self.get_connection()
         cursor = conn.cursor()
@@ -234,153 +269,97 @@ class Database:
         finally:
             conn.close()
     
-    def search_records(self, search_term):
-        conn = self.get_connection()
-        query = f"""
-            SELECT * FROM company_records 
-            WHERE employee_name LIKE '%{search_term}%' 
-            OR department LIKE '%{search_term}%'
-            OR position LIKE '%{search_term}%'
-            OR email LIKE '%{search_term}%'
-            ORDER BY id DESC
-        """
-        df = pd.read_sql_query(query, conn)
+    def search_records(self, search_term, limit=200, department=None, status=None, role=None):
+        """Records matching search_term, best matches first; the filters are applied before the limit"""
+        term = search_term.strip()
+        filters = ''
+        filter_params = []
+        for column, value in (('cr.department', department), ('cr.status', status), ('u.role', role)):
+            if value is not None:
+                filters += f" AND {column} = ?"
+                filter_params.append(value)
+        conn = self.get_connection()
+        if len(term) >= 3:
+            # Trigram FTS5 index, ranked by bm25; the term is quoted as a single phrase
+            df = pd.read_sql_query(f'''
+                SELECT cr.*, u.role
+                FROM company_records_fts f
+                JOIN company_records cr ON cr.id = f.rowid
+                LEFT JOIN users u ON cr.email = u.email
+                WHERE company_records_fts MATCH ?{filters}
+                ORDER BY f.rank, cr.id DESC
+                LIMIT ?
+            ''', conn, params=('"' + term.replace('"', '""') + '"', *filter_params, limit))
+        else:
+            # Trigrams cannot match one or two characters, fall back to a bounded LIKE scan
+            pattern = '%' + term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+            df = pd.read_sql_query(f'''
+                SELECT cr.*, u.role
+                FROM company_records cr
+                LEFT JOIN users u ON cr.email = u.email
+                WHERE (cr.employee_name LIKE ? ESCAPE '\\'
+                OR cr.department LIKE ? ESCAPE '\\'
+                OR cr.position LIKE ? ESCAPE '\\'
+                OR cr.email LIKE ? ESCAPE '\\'){filters}
+                ORDER BY cr.id DESC
+                LIMIT ?
+            ''', conn, params=(pattern, pattern, pattern, pattern, *filter_params, limit))
         conn.close()
         return df
     
-    def get_statistics(self):
+    def get_recent_records(self, limit=5):
         conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute("SELECT COUNT(*) FROM company_records")
-        total_employees = cursor.fetchone()[0]
-        
-        cursor.execute("SELECT COUNT(DISTINCT department) FROM company_records")
-        total_departments = cursor.fetchone()[0]
-        
-        cursor.execute("SELECT AVG(salary) FROM company_records")
-        avg_salary = cursor.fetchone()[0] or 0
-        
-        cursor.execute("SELECT COUNT(*) FROM company_records WHERE status='Active'")
-        active_employees = cursor.fetchone()[0]
-        
-        conn.close()
-        
-        return {
-            'total_employees': total_employees,
-            'total_departments': total_departments,
-            'avg_salary': round(avg_salary, 2),
-            'active_employees': active_employees
-        }
-
-    def init_shipments_table(self):
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS shipments (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                shipment_number TEXT UNIQUE NOT NULL,
-                client_id INTEGER NOT NULL,
-                type TEXT NOT NULL,
-                origin_country TEXT,
-                destination_country TEXT,
-                departure_date TEXT,
-                expected_arrival TEXT,
-                actual_arrival TEXT,
-                status TEXT DEFAULT 'Pending',
-                total_weight REAL,
-                total_value REAL,
-                currency TEXT DEFAULT 'USD',
-                customs_cleared INTEGER DEFAULT 0,
-                notes TEXT,
-                created_at TEXT DEFAULT CURRENT_TIMESTAMP,
-                updated_at TEXT DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY(client_id) REFERENCES users(id)
-            )
-        ''')
-        conn.commit()
+        df = pd.read_sql_query("SELECT * FROM company_records ORDER BY id DESC LIMIT ?", conn, params=(limit,))
         conn.close()
+        return df
 
-    def init_cargo_items_table(self):
+    def get_department_rollup(self):
         conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS cargo_items (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                shipment_id INTEGER NOT NULL,
-                item_name TEXT NOT NULL,
-                description TEXT,
-                quantity INTEGER NOT NULL,
-                unit TEXT DEFAULT 'pcs',
-                weight REAL,
-                value REAL,
-                hs_code TEXT,
-                created_at TEXT DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY(shipment_id) REFERENCES shipments(id) ON DELETE CASCADE
-            )
-        ''')
-        conn.commit()
+        df = pd.read_sql_query(
+            "SELECT department, status, employee_count, salary_sum FROM department_rollup ORDER BY department, status",
+            conn
+        )
         conn.close()
+        return df
 
-    def init_tracking_updates_table(self):
+    def get_record_filter_options(self):
         conn = self.get_connection()
         cursor = conn.cursor()
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS tracking_updates (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                shipment_id INTEGER NOT NULL,
-                location TEXT NOT NULL,
-                status TEXT NOT NULL,
-                notes TEXT,
-                update_date TEXT NOT NULL,
-                created_by INTEGER,
-                created_at TEXT DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY(shipment_id) REFERENCES shipments(id) ON DELETE CASCADE,
-                FOREIGN KEY(created_by) REFERENCES users(id)
-            )
-        ''')
-        conn.commit()
-        conn.close()
+        cursor.execute("""
+            SELECT 'department', department FROM department_rollup
+            UNION SELECT 'status', status FROM department_rollup WHERE status <> ''
+            UNION SELECT 'role', role FROM users WHERE role IS NOT NULL
+            ORDER BY 1, 2
+        """)
+        rows = cursor.fetchall()
+        conn.close()
+        options = {'departments': [], 'statuses': [], 'roles': []}
+        for kind, value in rows:
+            options[FILTER_OPTION_KEYS[kind]].append(value)
+        return options
 
-    def init_documents_table(self):
+    def get_statistics(self):
         conn = self.get_connection()
         cursor = conn.cursor()
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS shipment_documents (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                shipment_id INTEGER NOT NULL,
-                document_type TEXT NOT NULL,
-                file_path TEXT NOT NULL,
-                uploaded_by INTEGER,
-                notes TEXT,
-                created_at TEXT DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY(shipment_id) REFERENCES shipments(id) ON DELETE CASCADE,
-                FOREIGN KEY(uploaded_by) REFERENCES users(id)
-            )
-        ''')
-        conn.commit()
-        conn.close()
 
-    def init_cargo_requests_table(self):
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS cargo_requests (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                cargo_item_id INTEGER NOT NULL,
-                client_id INTEGER NOT NULL,
-                request_type TEXT NOT NULL,
-                reason TEXT,
-                status TEXT DEFAULT 'Pending',
-                employee_response TEXT,
-                created_at TEXT DEFAULT CURRENT_TIMESTAMP,
-                updated_at TEXT DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY(cargo_item_id) REFERENCES cargo_items(id) ON DELETE CASCADE,
-                FOREIGN KEY(client_id) REFERENCES users(id)
-            )
-        ''')
-        conn.commit()
+        cursor.execute("""
+            SELECT COALESCE(SUM(employee_count), 0),
+                   COUNT(DISTINCT department),
+                   SUM(salary_sum) / NULLIF(SUM(employee_count), 0),
+                   COALESCE(SUM(CASE WHEN status = 'Active' THEN employee_count END), 0)
+            FROM department_rollup
+        """)
+        total_employees, total_departments, avg_salary, active_employees = cursor.fetchone()
+        avg_salary = avg_salary or 0
+        
         conn.close()
+        
+        return {
+            'total_employees': total_employees,
+            'total_departments': total_departments,
+            'avg_salary': round(avg_salary, 2),
+            'active_employees': active_employees
+        }
 
     def create_shipment(self, shipment_number, client_id, shipment_type, origin_country, 
                        destination_country, departure_date, expected_arrival, total_weight, 
@@ -414,6 +393,54 @@ class Database:
         conn.close()
         return df
 
+    def get_shipment_by_number(self, shipment_number):
+        conn = self.get_connection()
+        conn.row_factory = sqlite3.Row
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT s.*, u.email as client_email
+            FROM shipments s
+            LEFT JOIN users u ON s.client_id = u.id
+            WHERE s.shipment_number = ?
+        ''', (shipment_number,))
+        row = cursor.fetchone()
+        conn.close()
+        return dict(row) if row else None
+
+    def get_shipment_by_id(self, shipment_id):
+        conn = self.get_connection()
+        conn.row_factory = sqlite3.Row
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT s.*, u.email as client_email
+            FROM shipments s
+            LEFT JOIN users u ON s.client_id = u.id
+            WHERE s.id = ?
+        ''', (shipment_id,))
+        row = cursor.fetchone()
+        conn.close()
+        return dict(row) if row else None
+
+    def get_shipment_numbers(self):
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute('SELECT shipment_number FROM shipments ORDER BY id DESC')
+        numbers = [row[0] for row in cursor.fetchall()]
+        conn.close()
+        return numbers
+
+    def get_shipments_page(self, cursor=None, limit=50, shipment_type=None, status=None, search=None):
+        extra, params = [], []
+        if search:
+            extra.append("(s.shipment_number LIKE ? OR u.email LIKE ?)")
+            params += [f"%{search}%", f"%{search}%"]
+        return self._read_page(
+            """SELECT s.*, u.email as client_email
+               FROM shipments s
+               LEFT JOIN users u ON s.client_id = u.id""",
+            's.id', {'s.type': shipment_type, 's.status': status}, cursor, limit, extra, params
+        )
+
     def get_shipments_by_client(self, client_id):
         conn = self.get_connection()
         df = pd.read_sql_query('''
@@ -480,6 +507,63 @@ class Database:
         conn.commit()
         conn.close()
 
+    def add_cargo_items_bulk(self, items):
+        """Insert many cargo items (dicts with shipment_id and the item fields) in one
+        transaction; returns the new ids"""
+        return self.save_cargo_items(added=items)['added']
+
+    def update_cargo_items_bulk(self, items):
+        """Update many cargo items (dicts with id and the item fields) in one transaction"""
+        return self.save_cargo_items(updated=items)['updated']
+
+    def delete_cargo_items_bulk(self, item_ids):
+        return self.save_cargo_items(deleted=item_ids)['deleted']
+
+    def save_cargo_items(self, added=(), updated=(), deleted=()):
+        """Apply a batch of cargo item inserts, updates and deletes in one transaction,
+        then recompute total_weight/total_value once for every shipment touched.
+
+        Returns {'added': [new ids], 'updated': count, 'deleted': count}.
+        """
+        conn = self.get_connection()
+        try:
+            cursor = conn.cursor()
+            touched_ids = [int(item_id) for item_id in deleted] + [int(item['id']) for item in updated]
+            shipment_ids = {int(item['shipment_id']) for item in added}
+            # Stay under SQLite's limit on bound parameters per statement
+            for start in range(0, len(touched_ids), 500):
+                chunk = touched_ids[start:start + 500]
+                cursor.execute(
+                    f"SELECT DISTINCT shipment_id FROM cargo_items WHERE id IN ({', '.join('?' * len(chunk))})", chunk
+                )
+                shipment_ids.update(row[0] for row in cursor.fetchall())
+
+            result = {'added': [], 'updated': 0, 'deleted': 0}
+            if deleted:
+                cursor.executemany("DELETE FROM cargo_items WHERE id = ?", [(int(item_id),) for item_id in deleted])
+                result['deleted'] = cursor.rowcount
+            if updated:
+                cursor.executemany('''
+                    UPDATE cargo_items
+                    SET item_name=?, description=?, quantity=?, unit=?, weight=?, value=?, hs_code=?
+                    WHERE id=?
+                ''', [_cargo_fields(item) + (int(item['id']),) for item in updated])
+                result['updated'] = cursor.rowcount
+            for item in added:
+                cursor.execute('''
+                    INSERT INTO cargo_items (shipment_id, item_name, description, quantity, unit, weight, value, hs_code)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ''', (int(item['shipment_id']),) + _cargo_fields(item))
+                result['added'].append(cursor.lastrowid)
+            _recompute_shipment_totals(cursor, shipment_ids)
+            conn.commit()
+            return result
+        except BaseException:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
     def add_tracking_update(self, shipment_id, location, status, notes, update_date, created_by):
         conn = self.get_connection()
         cursor = conn.cursor()
@@ -524,6 +608,45 @@ class Database:
         conn.close()
         return df
 
+    def get_shipment_bundle(self, shipment_id):
+        """Shipment header, cargo items, tracking history and documents over one connection"""
+        shipment_id = int(shipment_id)
+        conn = self.get_connection()
+        conn.row_factory = sqlite3.Row
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT s.*, u.email as client_email
+            FROM shipments s
+            LEFT JOIN users u ON s.client_id = u.id
+            WHERE s.id = ?
+        ''', (shipment_id,))
+        header = cursor.fetchone()
+        cursor.execute('SELECT * FROM cargo_items WHERE shipment_id=? ORDER BY id', (shipment_id,))
+        cargo_items = [dict(r) for r in cursor.fetchall()]
+        cursor.execute('''
+            SELECT t.*, u.email as updated_by_email
+            FROM tracking_updates t
+            LEFT JOIN users u ON t.created_by = u.id
+            WHERE t.shipment_id=?
+            ORDER BY t.update_date DESC, t.id DESC
+        ''', (shipment_id,))
+        tracking = [dict(r) for r in cursor.fetchall()]
+        cursor.execute('''
+            SELECT d.*, u.email as uploaded_by_email
+            FROM shipment_documents d
+            LEFT JOIN users u ON d.uploaded_by = u.id
+            WHERE d.shipment_id=?
+            ORDER BY d.id DESC
+        ''', (shipment_id,))
+        documents = [dict(r) for r in cursor.fetchall()]
+        conn.close()
+        return {
+            'shipment': dict(header) if header else None,
+            'cargo_items': _typed_frame(cargo_items, SHIPMENT_BUNDLE_FRAMES['cargo_items']),
+            'tracking': _typed_frame(tracking, SHIPMENT_BUNDLE_FRAMES['tracking']),
+            'documents': _typed_frame(documents, SHIPMENT_BUNDLE_FRAMES['documents']),
+        }
+
     def create_cargo_request(self, cargo_item_id, client_id, request_type, reason=''):
         conn = self.get_connection()
         cursor = conn.cursor()
@@ -560,6 +683,16 @@ class Database:
         conn.close()
         return df
 
+    def get_cargo_requests_page(self, cursor=None, limit=50, status=None, request_type=None):
+        return self._read_page(
+            """SELECT cr.*, ci.item_name, ci.shipment_id, s.shipment_number, u.email as client_email
+               FROM cargo_requests cr
+               LEFT JOIN cargo_items ci ON cr.cargo_item_id = ci.id
+               LEFT JOIN shipments s ON ci.shipment_id = s.id
+               LEFT JOIN users u ON cr.client_id = u.id""",
+            'cr.id', {'cr.status': status, 'cr.request_type': request_type}, cursor, limit
+        )
+
     def update_cargo_request_status(self, request_id, status, employee_response=''):
         conn = self.get_connection()
         cursor = conn.cursor()
@@ -571,24 +704,40 @@ class Database:
         conn.commit()
         conn.close()
 
+    def get_shipment_rollup(self):
+        conn = self.get_connection()
+        df = pd.read_sql_query(
+            "SELECT type, status, shipment_count, value_sum FROM shipment_rollup ORDER BY type, status",
+            conn
+        )
+        conn.close()
+        return df
+
+    def get_recent_shipments(self, limit=10):
+        conn = self.get_connection()
+        df = pd.read_sql_query('''
+            SELECT s.*, u.email as client_email
+            FROM shipments s
+            LEFT JOIN users u ON s.client_id = u.id
+            ORDER BY s.id DESC
+            LIMIT ?
+        ''', conn, params=(limit,))
+        conn.close()
+        return df
+
     def get_shipment_statistics(self):
         conn = self.get_connection()
         cursor = conn.cursor()
-        
-        cursor.execute("SELECT COUNT(*) FROM shipments")
-        total_shipments = cursor.fetchone()[0]
-        
-        cursor.execute("SELECT COUNT(*) FROM shipments WHERE type='Import'")
-        total_imports = cursor.fetchone()[0]
-        
-        cursor.execute("SELECT COUNT(*) FROM shipments WHERE type='Export'")
-        total_exports = cursor.fetchone()[0]
-        
-        cursor.execute("SELECT COUNT(*) FROM shipments WHERE status='In Transit'")
-        in_transit = cursor.fetchone()[0]
-        
-        cursor.execute("SELECT SUM(total_value) FROM shipments")
-        total_value = cursor.fetchone()[0] or 0
+
+        cursor.execute("""
+            SELECT COALESCE(SUM(shipment_count), 0),
+                   COALESCE(SUM(CASE WHEN type = 'Import' THEN shipment_count END), 0),
+                   COALESCE(SUM(CASE WHEN type = 'Export' THEN shipment_count END), 0),
+                   COALESCE(SUM(CASE WHEN status = 'In Transit' THEN shipment_count END), 0),
+                   COALESCE(SUM(value_sum), 0)
+            FROM shipment_rollup
+        """)
+        total_shipments, total_imports, total_exports, in_transit, total_value = cursor.fetchone()
         
         conn.close()
         
@@ -598,4 +747,192 @@ class Database:
             'total_exports': total_exports,
             'in_transit': in_transit,
             'total_value': round(total_value, 2)
-        }
\ No newline at end of file
+        }
+
+    def iter_export_rows(self, name, batch_size=exports.EXPORT_BATCH_ROWS):
+        """Yield the column names of a whitelisted export, then its rows in batches"""
+        conn = self.get_connection()
+        try:
+            cursor = conn.execute(exports.export_query(name))
+            yield [column[0] for column in cursor.description]
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield rows
+        finally:
+            conn.close()
+
+    def export_csv(self, name, out):
+        """Write a whitelisted export as CSV with a header row into the binary file out"""
+        text = io.TextIOWrapper(out, encoding='utf-8', newline='', write_through=True)
+        try:
+            writer = csv.writer(text)
+            batches = self.iter_export_rows(name)
+            writer.writerow(next(batches))
+            for rows in batches:
+                writer.writerows(rows)
+        finally:
+            # Hand out back to the caller still open
+            text.detach()
+
+    def create_export_job(self, request_hash, export_format, export_names, requested_by=None):
+        """Queue an export job and return its id, or None if an identical job is already queued or running"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        try:
+            cursor.execute('''
+                INSERT INTO export_jobs (request_hash, export_format, export_names, requested_by)
+                VALUES (?, ?, ?, ?)
+            ''', (request_hash, export_format, ','.join(export_names), requested_by))
+            conn.commit()
+            return cursor.lastrowid
+        except sqlite3.IntegrityError:
+            return None
+        finally:
+            conn.close()
+
+    def get_export_job(self, job_id):
+        conn = self.get_connection()
+        conn.row_factory = sqlite3.Row
+        row = conn.execute('SELECT * FROM export_jobs WHERE id = ?', (job_id,)).fetchone()
+        conn.close()
+        return dict(row) if row else None
+
+    def find_active_export_job(self, request_hash):
+        """The queued or running job for request_hash, or None"""
+        conn = self.get_connection()
+        conn.row_factory = sqlite3.Row
+        row = conn.execute(
+            "SELECT * FROM export_jobs WHERE request_hash = ? AND status IN ('queued', 'running')",
+            (request_hash,)
+        ).fetchone()
+        conn.close()
+        return dict(row) if row else None
+
+    def start_export_job(self, job_id):
+        conn = self.get_connection()
+        conn.execute(
+            "UPDATE export_jobs SET status = 'running', heartbeat_at = CURRENT_TIMESTAMP WHERE id = ?",
+            (job_id,)
+        )
+        conn.commit()
+        conn.close()
+
+    def update_export_job_progress(self, job_id, progress, detail=''):
+        conn = self.get_connection()
+        conn.execute(
+            "UPDATE export_jobs SET progress = ?, detail = ?, heartbeat_at = CURRENT_TIMESTAMP WHERE id = ?",
+            (progress, detail, job_id)
+        )
+        conn.commit()
+        conn.close()
+
+    def heartbeat_export_job(self, job_id):
+        """Show the job is still alive when its writer reports no progress"""
+        conn = self.get_connection()
+        conn.execute("UPDATE export_jobs SET heartbeat_at = CURRENT_TIMESTAMP WHERE id = ?", (job_id,))
+        conn.commit()
+        conn.close()
+
+    def claim_export_file(self, job_id, file_path):
+        """Point a running job at its output file before the file is stored, so sweeps keep it"""
+        conn = self.get_connection()
+        conn.execute("UPDATE export_jobs SET file_path = ? WHERE id = ?", (file_path, job_id))
+        conn.commit()
+        conn.close()
+
+    def finish_export_job(self, job_id, file_path, ttl_seconds):
+        conn = self.get_connection()
+        conn.execute('''
+            UPDATE export_jobs
+            SET status = 'done', progress = 1, file_path = ?, finished_at = CURRENT_TIMESTAMP,
+                expires_at = datetime('now', ?)
+            WHERE id = ?
+        ''', (file_path, f'{int(ttl_seconds):+d} seconds', job_id))
+        conn.commit()
+        conn.close()
+
+    def fail_export_job(self, job_id, error):
+        conn = self.get_connection()
+        conn.execute(
+            "UPDATE export_jobs SET status = 'failed', error = ?, finished_at = CURRENT_TIMESTAMP WHERE id = ?",
+            (error, job_id)
+        )
+        conn.commit()
+        conn.close()
+
+    def fail_stale_export_jobs(self, stale_seconds):
+        """Fail queued or running jobs with no heartbeat for stale_seconds, e.g. after a
+        restart killed their worker; returns how many were failed"""
+        conn = self.get_connection()
+        cursor = conn.execute('''
+            UPDATE export_jobs
+            SET status = 'failed', error = 'Interrupted', finished_at = CURRENT_TIMESTAMP
+            WHERE status IN ('queued', 'running') AND heartbeat_at < datetime('now', ?)
+        ''', (f'{-int(stale_seconds):+d} seconds',))
+        conn.commit()
+        conn.close()
+        return cursor.rowcount
+
+    def expire_export_jobs(self):
+        """Mark finished jobs past their expiry as expired and return the files that
+        no unexpired job still points at, for the caller to delete"""
+        conn = self.get_connection()
+        try:
+            cursor = conn.cursor()
+            # Take the write lock first so no job can finish between the SELECT and the UPDATE
+            cursor.execute("BEGIN IMMEDIATE")
+            cursor.execute(
+                "SELECT file_path FROM export_jobs WHERE status = 'done' AND expires_at < datetime('now')"
+            )
+            paths = {row[0] for row in cursor.fetchall() if row[0]}
+            cursor.execute(
+                "UPDATE export_jobs SET status = 'expired' WHERE status = 'done' AND expires_at < datetime('now')"
+            )
+            # Output files are content-addressed, so several jobs may share one, and a
+            # running job may have claimed one it is about to reuse
+            cursor.execute(
+                "SELECT DISTINCT file_path FROM export_jobs WHERE status IN ('queued', 'running', 'done')"
+            )
+            still_used = {row[0] for row in cursor.fetchall()}
+            conn.commit()
+            return sorted(paths - still_used)
+        finally:
+            conn.close()
+
+    def import_rows(self, target_name, rows):
+        """Merge validated import rows (see bulk_import.validate) into their table in one
+        transaction; returns {'inserted', 'updated', 'errors': [(row, message), ...]}"""
+        target = bulk_import.IMPORT_TARGETS[target_name]
+        columns = bulk_import.staging_columns(target_name)
+        conn = self.get_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(bulk_import.staging_table_sql(target_name))
+            cursor.executemany(
+                f"INSERT INTO import_{target_name} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+                bulk_import.row_tuples(rows[columns])
+            )
+            errors = []
+            if target['unresolved']:
+                cursor.execute(target['unresolved'])
+                errors = cursor.fetchall()
+            shipment_ids = []
+            if target['shipments_touched']:
+                cursor.execute(target['shipments_touched'])
+                shipment_ids = [row[0] for row in cursor.fetchall()]
+            cursor.execute(target['existing'])
+            updated = cursor.fetchone()[0]
+            merged = 0
+            for statement in target['merge']:
+                cursor.execute(statement)
+                merged += cursor.rowcount
+            _recompute_shipment_totals(cursor, shipment_ids)
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+        return {'inserted': merged - updated, 'updated': updated, 'errors': errors}
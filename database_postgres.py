@@ -1,190 +1,322 @@
 import psycopg2
-from psycopg2.extras import RealDictCursor
-from psycopg2 import pool
+import psycopg2.extensions
+from psycopg2.extras import RealDictCursor, execute_values
 import pandas as pd
 from datetime import datetime
 import streamlit as st
+import io
 import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
 from sqlalchemy import create_engine
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import QueuePool
+import migrations
+import exports
+import bulk_import
+import query_metrics
 
+
+def _setting(name, default):
+    """Read a setting from the environment, then Streamlit secrets, then fall back to default"""
+    value = os.getenv(name)
+    if value is None:
+        try:
+            value = st.secrets.get(name)
+        except Exception:
+            value = None
+    return default if value in (None, "") else value
+
+
+def _split_page(df, limit):
+    """Trim a LIMIT n+1 result to n rows; the cursor is the last kept id, or None on the last page"""
+    if len(df) > limit:
+        df = df.iloc[:limit]
+        return df, int(df['id'].iloc[-1])
+    return df, None
+
+
+# Kind column of the get_record_filter_options query -> key of the dict it returns
+FILTER_OPTION_KEYS = {'department': 'departments', 'status': 'statuses', 'role': 'roles'}
+
+# Fixed columns and dtypes of the frames returned by get_shipment_bundle, so
+# callers get the same shape whether or not a shipment has any child rows
+SHIPMENT_BUNDLE_FRAMES = {
+    'cargo_items': {
+        'id': 'int64', 'shipment_id': 'int64', 'item_name': 'object', 'description': 'object',
+        'quantity': 'int64', 'unit': 'object', 'weight': 'float64', 'value': 'float64',
+        'hs_code': 'object', 'created_at': 'datetime64[ns]',
+    },
+    'tracking': {
+        'id': 'int64', 'shipment_id': 'int64', 'location': 'object', 'status': 'object',
+        'notes': 'object', 'update_date': 'object', 'created_by': 'Int64',
+        'created_at': 'datetime64[ns]', 'updated_by_email': 'object',
+    },
+    'documents': {
+        'id': 'int64', 'shipment_id': 'int64', 'document_type': 'object', 'file_path': 'object',
+        'uploaded_by': 'Int64', 'notes': 'object', 'created_at': 'datetime64[ns]',
+        'uploaded_by_email': 'object',
+    },
+}
+
+
+def _cargo_fields(item):
+    """Item fields of a cargo item dict, in column order, with the add form's defaults"""
+    return (
+        item['item_name'], item.get('description') or '', int(item['quantity']), item.get('unit') or 'pcs',
+        float(item.get('weight') or 0), float(item.get('value') or 0), item.get('hs_code') or '',
+    )
+
+
+def _recompute_shipment_totals(cursor, shipment_ids):
+    """Set total_weight/total_value of the given shipments from their cargo items"""
+    if shipment_ids:
+        cursor.execute('''
+            UPDATE shipments s
+            SET total_weight = (SELECT COALESCE(SUM(weight), 0) FROM cargo_items WHERE shipment_id = s.id),
+                total_value = (SELECT COALESCE(SUM(value), 0) FROM cargo_items WHERE shipment_id = s.id),
+                updated_at = CURRENT_TIMESTAMP
+            WHERE s.id = ANY(%s)
+        ''', (sorted({int(shipment_id) for shipment_id in shipment_ids}),))
+
+
+def _typed_frame(rows, dtypes):
+    """Build a frame with exactly the given columns, coerced to the given dtypes"""
+    df = pd.DataFrame(rows, columns=list(dtypes))
+    for column, dtype in dtypes.items():
+        if dtype.startswith('datetime'):
+            # Fractional seconds are left out when zero, so one column can mix precisions
+            df[column] = pd.to_datetime(df[column], format='ISO8601')
+        else:
+            df[column] = df[column].astype(dtype)
+    return df
+
+
+class _TimedQueuePool(QueuePool):
+    """QueuePool reporting how long every checkout took, for pandas reads and cursors alike.
+
+    Checkout time covers waiting for a free connection and, when the pool grows,
+    opening a new one. waiting counts only threads that found every connection
+    in use and are blocked until one is returned or DB_POOL_TIMEOUT passes.
+    """
+    waiting = 0
+    _waiting_lock = threading.Lock()
+
+    def connect(self):
+        started = time.perf_counter()
+        # A snapshot: another thread may return a connection right after, which only shortens the wait
+        blocked = self._max_overflow >= 0 and self.checkedout() >= self.size() + self._max_overflow
+        if blocked:
+            with _TimedQueuePool._waiting_lock:
+                _TimedQueuePool.waiting += 1
+        try:
+            return super().connect()
+        finally:
+            if blocked:
+                with _TimedQueuePool._waiting_lock:
+                    _TimedQueuePool.waiting -= 1
+            query_metrics.add_pool_wait(time.perf_counter() - started)
+
+
+# Database calls slower than this many milliseconds are logged as warnings
+SLOW_QUERY_MS = float(_setting("DB_SLOW_QUERY_MS", 500))
+
+
+# Connection plumbing is left out: its time already counts against the calling method
+@query_metrics.instrument(
+    slow_ms=SLOW_QUERY_MS,
+    exclude=('get_connection', 'return_connection', 'connection', 'cursor', 'listen_connection'),
+)
 class Database:
-    _connection_pool = None
+    # One pool per process serves both pandas reads and cursor writes. Keep
+    # (pool_size + max_overflow) * replicas under the server's max_connections.
+    # Streamlit runs every session on its own thread; QueuePool is thread-safe
+    # and _engine_lock keeps concurrent first sessions from building two engines.
     _engine = None
-    
+    _engine_lock = threading.Lock()
+    _schema_ready = False
+    _schema_lock = threading.Lock()
+    _checked_out = 0
+    _checked_out_lock = threading.Lock()
+
     def __init__(self):
         self.db_url = os.getenv("DATABASE_URL") or st.secrets.get("DATABASE_URL", "")
         if not self.db_url:
             st.error("Database URL not configured. Please add DATABASE_URL to secrets.")
             st.stop()
-        
+
         if Database._engine is None:
-            Database._engine = create_engine(
-                self.db_url,
-                pool_size=20,
-                max_overflow=40,
-                pool_pre_ping=True,
-                pool_recycle=1800,
-                pool_timeout=10,
-                echo=False
-            )
-        
-        if Database._connection_pool is None:
-            try:
-                Database._connection_pool = pool.SimpleConnectionPool(
-                    minconn=10,
-                    maxconn=40,
-                    dsn=self.db_url
-                )
-            except Exception as e:
-                st.error(f"Failed to create connection pool: {e}")
-                st.stop()
-        
-        self.init_database()
-    
+            with Database._engine_lock:
+                if Database._engine is None:
+                    # QueuePool opens connections on first checkout, so nothing is dialled at import
+                    Database._engine = create_engine(
+                        self.db_url,
+                        poolclass=_TimedQueuePool,
+                        pool_size=int(_setting("DB_POOL_SIZE", 5)),
+                        max_overflow=int(_setting("DB_MAX_OVERFLOW", 5)),
+                        pool_pre_ping=True,
+                        pool_recycle=1800,
+                        pool_timeout=float(_setting("DB_POOL_TIMEOUT", 10)),
+                        echo=False
+                    )
+
     def get_connection(self):
+        """Check out a raw DBAPI connection from the shared engine pool.
+
+        Blocks for up to DB_POOL_TIMEOUT seconds when every connection is in use
+        rather than opening an unpooled one behind the pool's back.
+        """
         try:
-            conn = Database._connection_pool.getconn()
-            return conn
-        except Exception:
-            return psycopg2.connect(self.db_url)
-    
-    def return_connection(self, conn):
-        try:
-            Database._connection_pool.putconn(conn)
-        except Exception:
-            conn.close()
-    
-    def init_database(self):
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS company_records (
-                id SERIAL PRIMARY KEY,
-                employee_name TEXT NOT NULL,
-                department TEXT NOT NULL,
-                position TEXT NOT NULL,
-                salary REAL NOT NULL,
-                hire_date TEXT NOT NULL,
-                email TEXT,
-                phone TEXT,
-                status TEXT DEFAULT 'Active',
-                password TEXT DEFAULT '',
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        
-        # Create indexes for faster queries
-        cursor.execute("CREATE INDEX IF NOT EXISTS idx_department ON company_records(department)")
-        cursor.execute("CREATE INDEX IF NOT EXISTS idx_status ON company_records(status)")
-        cursor.execute("CREATE INDEX IF NOT EXISTS idx_email ON company_records(email)")
-        
-        # Add password column if it doesn't exist
-        cursor.execute("""
-            DO $$ 
-            BEGIN
-                IF NOT EXISTS (SELECT 1 FROM information_schema.columns 
-                              WHERE table_name='company_records' AND column_name='password') THEN
-                    ALTER TABLE company_records ADD COLUMN password TEXT DEFAULT '';
-                END IF;
-            END $$;
-        """)
-        
-        cursor.execute("SELECT COUNT(*) FROM company_records")
-        if cursor.fetchone()[0] == 0:
-            sample_data = [
-                ('Ahmed Mohammed', 'IT', 'Software Developer', 5000, '2023-01-15', 'ahmed@company.com', '0501234567', 'Active'),
-                ('Fatima Ali', 'HR', 'HR Manager', 6000, '2022-06-10', 'fatima@company.com', '0507654321', 'Active'),
-                ('Mohammed Khalid', 'Sales', 'Sales Representative', 4500, '2023-03-20', 'mohammed@company.com', '0509876543', 'Active'),
-                ('Sara Ahmed', 'Marketing', 'Marketing Specialist', 4800, '2023-02-01', 'sara@company.com', '0502345678', 'Active'),
-                ('Abdullah Youssef', 'Finance', 'Accountant', 5200, '2022-09-15', 'abdullah@company.com', '0508765432', 'Active'),
-            ]
-            cursor.executemany('''
-                INSERT INTO company_records (employee_name, department, position, salary, hire_date, email, phone, status)
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-            ''', sample_data)
-        
-        conn.commit()
-        self.return_connection(conn)
+            conn = Database._engine.raw_connection()
+        except PoolTimeoutError as e:
+            raise RuntimeError(
+                f"Database is busy, no connection was freed in time ({Database._engine.pool.status()}). "
+                "Please try again."
+            ) from e
+        Database._track_checkout(1)
+        return conn
 
-    def init_users_table(self):
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS users (
-                id SERIAL PRIMARY KEY,
-                email TEXT UNIQUE NOT NULL,
-                password_hash TEXT NOT NULL,
-                salt TEXT NOT NULL,
-                role TEXT DEFAULT 'user',
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        
-        # Create indexes for faster queries
-        cursor.execute("CREATE INDEX IF NOT EXISTS idx_user_email ON users(email)")
-        cursor.execute("CREATE INDEX IF NOT EXISTS idx_user_role ON users(role)")
-        conn.commit()
+    def return_connection(self, conn):
+        Database._track_checkout(-1)
+        # close() on a pooled connection hands it back to the engine pool
         conn.close()
 
-    def create_user(self, email, password_hash, salt, role='user'):
+    @classmethod
+    def _track_checkout(cls, delta):
+        with cls._checked_out_lock:
+            cls._checked_out += delta
+
+    @classmethod
+    def checked_out_connections(cls):
+        """Number of connections currently checked out and not yet returned"""
+        return cls._checked_out
+
+    @classmethod
+    def assert_no_leaks(cls):
+        """Raise if any connection was checked out and never returned"""
+        if cls._checked_out:
+            raise RuntimeError(f"{cls._checked_out} database connection(s) checked out but never returned")
+
+    @classmethod
+    def pool_stats(cls):
+        """Configured size, current idle, checked-out and overflow connections of the
+        shared pool, and how many threads are blocked because every connection is in use"""
+        pool = cls._engine.pool
+        return {'size': pool.size(), 'idle': pool.checkedin(), 'checked_out': pool.checkedout(),
+                'overflow': max(pool.overflow(), 0), 'waiting': _TimedQueuePool.waiting}
+
+    @contextmanager
+    def connection(self):
+        """Check out a connection, commit on success, roll back on error and always return it"""
         conn = self.get_connection()
-        cursor = conn.cursor()
         try:
-            cursor.execute('''
-                INSERT INTO users (email, password_hash, salt, role)
-                VALUES (%s, %s, %s, %s)
-            ''', (email, password_hash, salt, role))
+            yield conn
             conn.commit()
+        except BaseException:
+            # st.stop()/st.rerun() raise BaseException subclasses, so catch those too
+            # and never hand an open transaction back to the pool
+            try:
+                conn.rollback()
+            except Exception:
+                pass
+            raise
+        finally:
+            self.return_connection(conn)
+
+    @contextmanager
+    def cursor(self, cursor_factory=None):
+        """Cursor on a checked-out connection, see connection()"""
+        with self.connection() as conn:
+            cursor = conn.cursor(cursor_factory=cursor_factory)
+            try:
+                yield cursor
+            finally:
+                cursor.close()
+
+    def _read_page(self, select, id_column, filters, cursor, limit, extra_conditions=(), params=None):
+        """Run select newest-first from cursor using keyset pagination on id_column.
+
+        filters maps a column to the value it must equal; None means no filter.
+        Returns (df, next_cursor) with next_cursor None on the last page.
+        """
+        conditions = list(extra_conditions)
+        params = dict(params or {})
+        for i, (column, value) in enumerate(filters.items()):
+            if value is not None:
+                conditions.append(f"{column} = %(f{i})s")
+                params[f'f{i}'] = value
+        if cursor is not None:
+            conditions.append(f"{id_column} < %(cursor)s")
+            params['cursor'] = cursor
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        params['limit'] = limit + 1
+        df = pd.read_sql_query(
+            f"{select} {where} ORDER BY {id_column} DESC LIMIT %(limit)s",
+            Database._engine,
+            params=params
+        )
+        return _split_page(df, limit)
+
+    def bootstrap_schema(self):
+        """Apply pending schema migrations once per process; later calls are free"""
+        if Database._schema_ready:
+            return
+        with Database._schema_lock:
+            if Database._schema_ready:
+                return
+            with self.connection() as conn:
+                migrations.migrate(conn, migrations.POSTGRES)
+            Database._schema_ready = True
+
+    def get_table_versions(self):
+        """Current change counter of every table in migrations.VERSIONED_TABLES"""
+        with self.cursor() as cursor:
+            cursor.execute('SELECT table_name, version FROM table_versions')
+            return dict(cursor.fetchall())
+
+    def listen_connection(self):
+        """Dedicated autocommit connection LISTENing for table version changes.
+
+        It is held open for as long as the listener runs, so it is opened outside
+        the pool instead of pinning one of its connections.
+        """
+        conn = psycopg2.connect(self.db_url)
+        conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+        with conn.cursor() as cursor:
+            cursor.execute(f"LISTEN {migrations.TABLE_VERSION_CHANNEL}")
+        return conn
+
+    def create_user(self, email, password_hash, salt, role='user'):
+        try:
+            with self.cursor() as cursor:
+                cursor.execute('''
+                    INSERT INTO users (email, password_hash, salt, role)
+                    VALUES (%s, %s, %s, %s)
+                ''', (email, password_hash, salt, role))
             return True
         except Exception:
             return False
-        finally:
-            conn.close()
 
     def get_user_by_email(self, email):
-        conn = self.get_connection()
-        cursor = conn.cursor(cursor_factory=RealDictCursor)
-        cursor.execute('SELECT id, email, password_hash, salt, role, created_at FROM users WHERE email=%s', (email,))
-        row = cursor.fetchone()
-        conn.close()
+        with self.cursor(cursor_factory=RealDictCursor) as cursor:
+            cursor.execute('SELECT id, email, password_hash, salt, role, created_at FROM users WHERE email=%s', (email,))
+            row = cursor.fetchone()
         return dict(row) if row else None
 
-    def init_leave_table(self):
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS leave_requests (
-                id SERIAL PRIMARY KEY,
-                user_id INTEGER NOT NULL,
-                start_date TEXT NOT NULL,
-                end_date TEXT NOT NULL,
-                reason TEXT,
-                leave_type TEXT DEFAULT 'Other',
-                attachment TEXT DEFAULT '',
-                status TEXT DEFAULT 'Pending',
-                admin_response TEXT DEFAULT '',
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY(user_id) REFERENCES users(id)
-            )
-        ''')
-        
-        # Create indexes for faster queries
-        cursor.execute("CREATE INDEX IF NOT EXISTS idx_leave_user ON leave_requests(user_id)")
-        cursor.execute("CREATE INDEX IF NOT EXISTS idx_leave_status ON leave_requests(status)")
-        
-        conn.commit()
-        conn.close()
+    def get_users_by_roles(self, roles):
+        """Get (id, email) pairs for every user whose role is in roles"""
+        with self.cursor() as cursor:
+            cursor.execute('SELECT id, email FROM users WHERE role = ANY(%s)', (list(roles),))
+            return cursor.fetchall()
 
     def create_leave_request(self, user_id, start_date, end_date, reason, leave_type='Other', attachment=''):
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('''
-            INSERT INTO leave_requests (user_id, start_date, end_date, reason, leave_type, attachment)
-            VALUES (%s, %s, %s, %s, %s, %s)
-        ''', (user_id, start_date, end_date, reason, leave_type, attachment))
-        conn.commit()
-        conn.close()
+        with self.cursor() as cursor:
+            cursor.execute('''
+                INSERT INTO leave_requests (user_id, start_date, end_date, reason, leave_type, attachment)
+                VALUES (%s, %s, %s, %s, %s, %s)
+            ''', (user_id, start_date, end_date, reason, leave_type, attachment))
 
     def get_leave_requests_by_user(self, user_id):
         return pd.read_sql_query(
@@ -199,15 +331,18 @@ class Database:
             Database._engine
         )
 
+    def get_leave_requests_page(self, cursor=None, limit=50, status=None):
+        return self._read_page(
+            'SELECT lr.id, lr.user_id, u.email as user_email, lr.start_date, lr.end_date, lr.reason, lr.leave_type, lr.attachment, lr.status, lr.admin_response, lr.created_at FROM leave_requests lr JOIN users u ON lr.user_id=u.id',
+            'lr.id', {'lr.status': status}, cursor, limit
+        )
+
     def update_leave_request_status(self, request_id, status, admin_response=None):
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        if admin_response is None:
-            cursor.execute('UPDATE leave_requests SET status=%s WHERE id=%s', (status, request_id))
-        else:
-            cursor.execute('UPDATE leave_requests SET status=%s, admin_response=%s WHERE id=%s', (status, admin_response, request_id))
-        conn.commit()
-        conn.close()
+        with self.cursor() as cursor:
+            if admin_response is None:
+                cursor.execute('UPDATE leave_requests SET status=%s WHERE id=%s', (status, request_id))
+            else:
+                cursor.execute('UPDATE leave_requests SET status=%s, admin_response=%s WHERE id=%s', (status, admin_response, request_id))
 
     def get_all_users(self):
         return pd.read_sql_query(
@@ -215,132 +350,205 @@ class Database:
             Database._engine
         )
 
+    def get_users_page(self, cursor=None, limit=50, role=None):
+        return self._read_page(
+            'SELECT id, email, role, created_at FROM users',
+            'id', {'role': role}, cursor, limit
+        )
+
     def update_user_role(self, user_id, role):
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('UPDATE users SET role=%s WHERE id=%s', (role, user_id))
-        conn.commit()
-        conn.close()
-    
+        with self.cursor() as cursor:
+            cursor.execute('UPDATE users SET role=%s WHERE id=%s', (role, user_id))
+
     def update_user_password(self, user_id, new_password_hash, new_salt):
         """Update user password with new hash and salt"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('UPDATE users SET password_hash=%s, salt=%s WHERE id=%s', 
-                      (new_password_hash, new_salt, user_id))
-        conn.commit()
-        conn.close()
-    
+        with self.cursor() as cursor:
+            cursor.execute('UPDATE users SET password_hash=%s, salt=%s WHERE id=%s',
+                          (new_password_hash, new_salt, user_id))
+
     def get_all_records(self):
         return pd.read_sql_query(
-            """SELECT cr.*, u.role 
-               FROM company_records cr 
-               LEFT JOIN users u ON cr.email = u.email 
+            """SELECT cr.*, u.role
+               FROM company_records cr
+               LEFT JOIN users u ON cr.email = u.email
                ORDER BY cr.id DESC""",
             Database._engine
         )
-    
+
+    def get_records_changed_since(self, since):
+        """Records inserted or updated at or after since, plus tombstones of records deleted since then"""
+        changed = pd.read_sql_query(
+            """SELECT cr.*, u.role
+               FROM company_records cr
+               LEFT JOIN users u ON cr.email = u.email
+               WHERE cr.updated_at >= %(since)s
+               ORDER BY cr.id DESC""",
+            Database._engine,
+            params={'since': since}
+        )
+        deleted = pd.read_sql_query(
+            "SELECT row_id, deleted_at FROM deleted_rows WHERE table_name = 'company_records' AND deleted_at >= %(since)s",
+            Database._engine,
+            params={'since': since}
+        )
+        return changed, deleted
+
+    def get_records_page(self, cursor=None, limit=50, department=None, status=None, role=None):
+        """One page of records newest first; pass the returned cursor back for the next page"""
+        return self._read_page(
+            """SELECT cr.*, u.role
+               FROM company_records cr
+               LEFT JOIN users u ON cr.email = u.email""",
+            'cr.id', {'cr.department': department, 'cr.status': status, 'u.role': role}, cursor, limit
+        )
+
     def add_record(self, employee_name, department, position, salary, hire_date, email, phone, status, password=''):
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('''
-            INSERT INTO company_records (employee_name, department, position, salary, hire_date, email, phone, status, password)
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
-        ''', (employee_name, department, position, salary, hire_date, email, phone, status, password))
-        conn.commit()
-        conn.close()
-    
-    def update_record(self, record_id, employee_name, department, position, salary, hire_date, email, phone, status, password=None):
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        if password is not None:
-            cursor.execute('''
-                UPDATE company_records 
-                SET employee_name=%s, department=%s, position=%s, salary=%s, hire_date=%s, email=%s, phone=%s, status=%s, password=%s
-                WHERE id=%s
-            ''', (employee_name, department, position, salary, hire_date, email, phone, status, password, record_id))
-        else:
+        with self.cursor() as cursor:
             cursor.execute('''
-                UPDATE company_records 
-                SET employee_name=%s, department=%s, position=%s, salary=%s, hire_date=%s, email=%s, phone=%s, status=%s
-                WHERE id=%s
-            ''', (employee_name, department, position, salary, hire_date, email, phone, status, record_id))
-        conn.commit()
-        conn.close()
-    
-    def generate_employee_passwords(self):
+                INSERT INTO company_records (employee_name, department, position, salary, hire_date, email, phone, status, password)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+            ''', (employee_name, department, position, salary, hire_date, email, phone, status, password))
+
+    def update_record(self, record_id, employee_name, department, position, salary, hire_date, email, phone, status, password=None):
+        with self.cursor() as cursor:
+            if password is not None:
+                cursor.execute('''
+                    UPDATE company_records
+                    SET employee_name=%s, department=%s, position=%s, salary=%s, hire_date=%s, email=%s, phone=%s, status=%s, password=%s
+                    WHERE id=%s
+                ''', (employee_name, department, position, salary, hire_date, email, phone, status, password, record_id))
+            else:
+                cursor.execute('''
+                    UPDATE company_records
+                    SET employee_name=%s, department=%s, position=%s, salary=%s, hire_date=%s, email=%s, phone=%s, status=%s
+                    WHERE id=%s
+                ''', (employee_name, department, position, salary, hire_date, email, phone, status, record_id))
+
+    def generate_employee_passwords(self, password='123', chunk_size=1000):
         """Generate passwords for employees who don't have one - sets password to '123'"""
-        conn = self.get_connection()
-        cursor = conn.cursor(cursor_factory=RealDictCursor)
-        cursor.execute("SELECT id, employee_name, email FROM company_records WHERE password IS NULL OR password = ''")
-        employees = cursor.fetchall()
-        
-        credentials = []
-        for emp in employees:
-            password = '123'
-            cursor.execute("UPDATE company_records SET password=%s WHERE id=%s", (password, emp['id']))
-            credentials.append({
-                'id': emp['id'],
-                'name': emp['employee_name'],
-                'email': emp['email'],
-                'password': password
-            })
-        
-        conn.commit()
-        conn.close()
-        return credentials
-    
+        return list(self.iter_generate_employee_passwords(password, chunk_size))
+
+    def iter_generate_employee_passwords(self, password='123', chunk_size=1000):
+        """Set password on every employee without one, yielding each one's credentials.
+
+        Each chunk is a single UPDATE ... RETURNING over at most chunk_size rows,
+        committed before its rows are yielded. SKIP LOCKED lets concurrent runs
+        split the work instead of queueing behind each other.
+        """
+        if not password:
+            raise ValueError("password must not be empty")
+        while True:
+            with self.cursor(cursor_factory=RealDictCursor) as cursor:
+                cursor.execute('''
+                    UPDATE company_records cr
+                    SET password = %s
+                    FROM (
+                        SELECT id FROM company_records
+                        WHERE password IS NULL OR password = ''
+                        ORDER BY id
+                        LIMIT %s
+                        FOR UPDATE SKIP LOCKED
+                    ) pending
+                    WHERE cr.id = pending.id
+                    RETURNING cr.id, cr.employee_name AS name, cr.email, cr.password
+                ''', (password, chunk_size))
+                rows = cursor.fetchall()
+            yield from (dict(row) for row in rows)
+            if len(rows) < chunk_size:
+                return
+
     def delete_record(self, record_id):
         try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
-            cursor.execute("DELETE FROM company_records WHERE id=%s", (record_id,))
-            conn.commit()
-            
-            if cursor.rowcount == 0:
-                return False
-            return True
-            
+            with self.cursor() as cursor:
+                cursor.execute("DELETE FROM company_records WHERE id=%s", (record_id,))
+                return cursor.rowcount > 0
         except Exception as e:
             print(f"Error deleting record: {e}")
             return False
-        finally:
-            conn.close()
-    
-    def search_records(self, search_term):
-        query = """
-            SELECT * FROM company_records 
-            WHERE employee_name ILIKE %(pattern)s 
-            OR department ILIKE %(pattern)s
-            OR position ILIKE %(pattern)s
-            OR email ILIKE %(pattern)s
-            ORDER BY id DESC
+
+    def search_records(self, search_term, limit=200, department=None, status=None, role=None):
+        """Substring search over name, department, position and email, best matches first.
+
+        The LIKE runs against the pg_trgm GIN index on RECORD_SEARCH_EXPRESSION;
+        word_similarity ranks whole-word hits above matches inside a word.
+        department, status and role filter the matches before the limit.
         """
-        search_pattern = f'%{search_term}%'
+        expression = migrations.RECORD_SEARCH_EXPRESSION
+        term = search_term.strip().lower()
+        escaped = term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+        params = {'term': term, 'pattern': f'%{escaped}%', 'limit': limit}
+        filters = ''
+        if department is not None:
+            filters += " AND department = %(department)s"
+            params['department'] = department
+        if status is not None:
+            filters += " AND status = %(status)s"
+            params['status'] = status
+        if role is not None:
+            filters += (" AND EXISTS (SELECT 1 FROM users WHERE users.email = company_records.email"
+                        " AND users.role = %(role)s)")
+            params['role'] = role
+        df = pd.read_sql_query(
+            f"""SELECT cr.*, u.role
+                FROM (
+                    SELECT *, word_similarity(%(term)s, {expression}) AS search_rank
+                    FROM company_records
+                    WHERE {expression} LIKE %(pattern)s{filters}
+                    ORDER BY search_rank DESC, id DESC
+                    LIMIT %(limit)s
+                ) cr
+                LEFT JOIN users u ON cr.email = u.email
+                ORDER BY cr.search_rank DESC, cr.id DESC""",
+            Database._engine,
+            params=params
+        )
+        return df.drop(columns=['search_rank'])
+
+    def get_recent_records(self, limit=5):
         return pd.read_sql_query(
-            query,
+            """SELECT cr.*, u.role
+               FROM company_records cr
+               LEFT JOIN users u ON cr.email = u.email
+               ORDER BY cr.id DESC
+               LIMIT %(limit)s""",
             Database._engine,
-            params={'pattern': search_pattern}
+            params={'limit': limit}
         )
-    
+
+    def get_department_rollup(self):
+        """Per department/status employee counts and salary sums, kept current by triggers"""
+        return pd.read_sql_query(
+            "SELECT department, status, employee_count, salary_sum FROM department_rollup ORDER BY department, status",
+            Database._engine
+        )
+
+    def get_record_filter_options(self):
+        """Distinct departments, statuses and roles for the record filters, in one round-trip"""
+        with self.cursor() as cursor:
+            cursor.execute("""
+                SELECT 'department', department FROM department_rollup
+                UNION SELECT 'status', status FROM department_rollup WHERE status <> ''
+                UNION SELECT 'role', role FROM users WHERE role IS NOT NULL
+                ORDER BY 1, 2
+            """)
+            rows = cursor.fetchall()
+        options = {'departments': [], 'statuses': [], 'roles': []}
+        for kind, value in rows:
+            options[FILTER_OPTION_KEYS[kind]].append(value)
+        return options
+
     def get_statistics(self):
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute("SELECT COUNT(*) FROM company_records")
-        total_employees = cursor.fetchone()[0]
-        
-        cursor.execute("SELECT COUNT(DISTINCT department) FROM company_records")
-        total_departments = cursor.fetchone()[0]
-        
-        cursor.execute("SELECT AVG(salary) FROM company_records")
-        avg_salary = cursor.fetchone()[0] or 0
-        
-        cursor.execute("SELECT COUNT(*) FROM company_records WHERE status='Active'")
-        active_employees = cursor.fetchone()[0]
-        
-        conn.close()
-        
+        with self.cursor() as cursor:
+            cursor.execute("""
+                SELECT COALESCE(SUM(employee_count), 0),
+                       COUNT(DISTINCT department),
+                       SUM(salary_sum) / NULLIF(SUM(employee_count), 0),
+                       COALESCE(SUM(employee_count) FILTER (WHERE status = 'Active'), 0)
+                FROM department_rollup
+            """)
+            total_employees, total_departments, avg_salary, active_employees = cursor.fetchone()
+            avg_salary = avg_salary or 0
+
         return {
             'total_employees': total_employees,
             'total_departments': total_departments,
@@ -348,194 +556,122 @@ class Database:
             'active_employees': active_employees
         }
 
-    def init_shipments_table(self):
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS shipments (
-                id SERIAL PRIMARY KEY,
-                shipment_number TEXT UNIQUE NOT NULL,
-                client_id INTEGER NOT NULL,
-                type TEXT NOT NULL,
-                origin_country TEXT,
-                destination_country TEXT,
-                departure_date TEXT,
-                expected_arrival TEXT,
-                actual_arrival TEXT,
-                status TEXT DEFAULT 'Pending',
-                total_weight REAL,
-                total_value REAL,
-                currency TEXT DEFAULT 'USD',
-                customs_cleared INTEGER DEFAULT 0,
-                notes TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY(client_id) REFERENCES users(id)
-            )
-        ''')
-        
-        # Create indexes for faster queries
-        cursor.execute("CREATE INDEX IF NOT EXISTS idx_shipment_number ON shipments(shipment_number)")
-        cursor.execute("CREATE INDEX IF NOT EXISTS idx_shipment_client ON shipments(client_id)")
-        cursor.execute("CREATE INDEX IF NOT EXISTS idx_shipment_status ON shipments(status)")
-        
-        conn.commit()
-        conn.close()
-
-    def init_cargo_items_table(self):
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS cargo_items (
-                id SERIAL PRIMARY KEY,
-                shipment_id INTEGER NOT NULL,
-                item_name TEXT NOT NULL,
-                description TEXT,
-                quantity INTEGER NOT NULL,
-                unit TEXT DEFAULT 'pcs',
-                weight REAL,
-                value REAL,
-                hs_code TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY(shipment_id) REFERENCES shipments(id) ON DELETE CASCADE
-            )
-        ''')
-        
-        # Create index for faster queries
-        cursor.execute("CREATE INDEX IF NOT EXISTS idx_cargo_shipment ON cargo_items(shipment_id)")
-        
-        conn.commit()
-        conn.close()
-
-    def init_tracking_updates_table(self):
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS tracking_updates (
-                id SERIAL PRIMARY KEY,
-                shipment_id INTEGER NOT NULL,
-                location TEXT NOT NULL,
-                status TEXT NOT NULL,
-                notes TEXT,
-                update_date TEXT NOT NULL,
-                created_by INTEGER,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY(shipment_id) REFERENCES shipments(id) ON DELETE CASCADE,
-                FOREIGN KEY(created_by) REFERENCES users(id)
-            )
-        ''')
-        conn.commit()
-        conn.close()
-
-    def init_documents_table(self):
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS shipment_documents (
-                id SERIAL PRIMARY KEY,
-                shipment_id INTEGER NOT NULL,
-                document_type TEXT NOT NULL,
-                file_path TEXT NOT NULL,
-                uploaded_by INTEGER,
-                notes TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY(shipment_id) REFERENCES shipments(id) ON DELETE CASCADE,
-                FOREIGN KEY(uploaded_by) REFERENCES users(id)
-            )
-        ''')
-        conn.commit()
-        conn.close()
-
-    def init_cargo_requests_table(self):
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS cargo_requests (
-                id SERIAL PRIMARY KEY,
-                cargo_item_id INTEGER NOT NULL,
-                client_id INTEGER NOT NULL,
-                request_type TEXT NOT NULL,
-                reason TEXT,
-                status TEXT DEFAULT 'Pending',
-                employee_response TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY(cargo_item_id) REFERENCES cargo_items(id) ON DELETE CASCADE,
-                FOREIGN KEY(client_id) REFERENCES users(id)
-            )
-        ''')
-        conn.commit()
-        conn.close()
-
-    def create_shipment(self, shipment_number, client_id, shipment_type, origin_country, 
-                       destination_country, departure_date, expected_arrival, total_weight, 
+    def create_shipment(self, shipment_number, client_id, shipment_type, origin_country,
+                       destination_country, departure_date, expected_arrival, total_weight,
                        total_value, currency='USD', notes=''):
-        conn = self.get_connection()
-        cursor = conn.cursor()
         try:
-            cursor.execute('''
-                INSERT INTO shipments (shipment_number, client_id, type, origin_country, 
-                                     destination_country, departure_date, expected_arrival, 
-                                     total_weight, total_value, currency, notes)
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-                RETURNING id
-            ''', (shipment_number, client_id, shipment_type, origin_country, destination_country, 
-                  departure_date, expected_arrival, total_weight, total_value, currency, notes))
-            shipment_id = cursor.fetchone()[0]
-            conn.commit()
-            return shipment_id
+            with self.cursor() as cursor:
+                cursor.execute('''
+                    INSERT INTO shipments (shipment_number, client_id, type, origin_country,
+                                         destination_country, departure_date, expected_arrival,
+                                         total_weight, total_value, currency, notes)
+                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+                    RETURNING id
+                ''', (shipment_number, client_id, shipment_type, origin_country, destination_country,
+                      departure_date, expected_arrival, total_weight, total_value, currency, notes))
+                return cursor.fetchone()[0]
         except Exception as e:
             print(f"Error creating shipment: {e}")
             return None
-        finally:
-            conn.close()
 
     def get_all_shipments(self):
         return pd.read_sql_query('''
-            SELECT s.*, u.email as client_email 
-            FROM shipments s 
-            LEFT JOIN users u ON s.client_id = u.id 
+            SELECT s.*, u.email as client_email
+            FROM shipments s
+            LEFT JOIN users u ON s.client_id = u.id
             ORDER BY s.id DESC
         ''', Database._engine)
 
+    def get_shipment_by_number(self, shipment_number):
+        """One shipment with its client email via the shipment_number unique index, or None"""
+        with self.cursor(cursor_factory=RealDictCursor) as cursor:
+            cursor.execute('''
+                SELECT s.*, u.email as client_email
+                FROM shipments s
+                LEFT JOIN users u ON s.client_id = u.id
+                WHERE s.shipment_number = %s
+            ''', (shipment_number,))
+            row = cursor.fetchone()
+        return dict(row) if row else None
+
+    def get_shipment_by_id(self, shipment_id):
+        """One shipment with its client email by primary key, or None"""
+        with self.cursor(cursor_factory=RealDictCursor) as cursor:
+            cursor.execute('''
+                SELECT s.*, u.email as client_email
+                FROM shipments s
+                LEFT JOIN users u ON s.client_id = u.id
+                WHERE s.id = %s
+            ''', (shipment_id,))
+            row = cursor.fetchone()
+        return dict(row) if row else None
+
+    def get_shipment_numbers(self):
+        """Shipment numbers newest first, for pickers that only need the key"""
+        with self.cursor() as cursor:
+            cursor.execute('SELECT shipment_number FROM shipments ORDER BY id DESC')
+            return [row[0] for row in cursor.fetchall()]
+
+    def get_shipments_page(self, cursor=None, limit=50, shipment_type=None, status=None, search=None):
+        extra, params = [], {}
+        if search:
+            extra.append("(s.shipment_number ILIKE %(search)s OR u.email ILIKE %(search)s)")
+            params['search'] = f"%{search}%"
+        return self._read_page(
+            """SELECT s.*, u.email as client_email
+               FROM shipments s
+               LEFT JOIN users u ON s.client_id = u.id""",
+            's.id', {'s.type': shipment_type, 's.status': status}, cursor, limit, extra, params
+        )
+
     def get_shipments_by_client(self, client_id):
         return pd.read_sql_query('''
             SELECT * FROM shipments WHERE client_id=%(client_id)s ORDER BY id DESC
         ''', Database._engine, params={'client_id': client_id})
 
-    def update_shipment_status(self, shipment_id, status, actual_arrival=None):
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        if actual_arrival:
+    def update_shipment(self, shipment_id, shipment_type, origin_country, destination_country,
+                        departure_date, expected_arrival, total_weight, total_value, currency):
+        with self.cursor() as cursor:
             cursor.execute('''
-                UPDATE shipments SET status=%s, actual_arrival=%s, updated_at=CURRENT_TIMESTAMP 
+                UPDATE shipments
+                SET type=%s, origin_country=%s, destination_country=%s,
+                    departure_date=%s, expected_arrival=%s, total_weight=%s,
+                    total_value=%s, currency=%s, updated_at=CURRENT_TIMESTAMP
                 WHERE id=%s
-            ''', (status, actual_arrival, int(shipment_id)))
-        else:
-            cursor.execute('''
-                UPDATE shipments SET status=%s, updated_at=CURRENT_TIMESTAMP WHERE id=%s
-            ''', (status, int(shipment_id)))
-        conn.commit()
-        conn.close()
+            ''', (shipment_type, origin_country, destination_country, departure_date, expected_arrival,
+                  total_weight, total_value, currency, int(shipment_id)))
+
+    def delete_shipment(self, shipment_id):
+        with self.cursor() as cursor:
+            cursor.execute('DELETE FROM shipments WHERE id=%s', (int(shipment_id),))
+
+    def update_shipment_status(self, shipment_id, status, actual_arrival=None):
+        with self.cursor() as cursor:
+            if actual_arrival:
+                cursor.execute('''
+                    UPDATE shipments SET status=%s, actual_arrival=%s, updated_at=CURRENT_TIMESTAMP
+                    WHERE id=%s
+                ''', (status, actual_arrival, int(shipment_id)))
+            else:
+                cursor.execute('''
+                    UPDATE shipments SET status=%s, updated_at=CURRENT_TIMESTAMP WHERE id=%s
+                ''', (status, int(shipment_id)))
 
     def update_customs_status(self, shipment_id, cleared):
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('''
-            UPDATE shipments SET customs_cleared=%s, updated_at=CURRENT_TIMESTAMP WHERE id=%s
-        ''', (1 if cleared else 0, int(shipment_id)))
-        conn.commit()
-        conn.close()
+        with self.cursor() as cursor:
+            cursor.execute('''
+                UPDATE shipments SET customs_cleared=%s, updated_at=CURRENT_TIMESTAMP WHERE id=%s
+            ''', (1 if cleared else 0, int(shipment_id)))
 
     def add_cargo_item(self, shipment_id, item_name, description, quantity, unit, weight, value, hs_code=''):
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('''
-            INSERT INTO cargo_items (shipment_id, item_name, description, quantity, unit, weight, value, hs_code)
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-        ''', (shipment_id, item_name, description, quantity, unit, weight, value, hs_code))
-        conn.commit()
-        conn.close()
+        with self.cursor() as cursor:
+            cursor.execute('''
+                INSERT INTO cargo_items (shipment_id, item_name, description, quantity, unit, weight, value, hs_code)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+            ''', (shipment_id, item_name, description, quantity, unit, weight, value, hs_code))
+
+    def get_all_cargo_items(self):
+        return pd.read_sql_query('SELECT * FROM cargo_items', Database._engine)
 
     def get_cargo_items_by_shipment(self, shipment_id):
         return pd.read_sql_query(
@@ -545,70 +681,153 @@ class Database:
         )
 
     def delete_cargo_item(self, item_id):
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute("DELETE FROM cargo_items WHERE id=%s", (item_id,))
-        conn.commit()
-        conn.close()
+        with self.cursor() as cursor:
+            cursor.execute("DELETE FROM cargo_items WHERE id=%s", (item_id,))
 
     def update_cargo_item(self, item_id, item_name, quantity, weight, unit, value, description='', hs_code=''):
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('''
-            UPDATE cargo_items 
-            SET item_name=%s, description=%s, quantity=%s, unit=%s, weight=%s, value=%s, hs_code=%s
-            WHERE id=%s
-        ''', (item_name, description, quantity, unit, weight, value, hs_code, item_id))
-        conn.commit()
-        conn.close()
+        with self.cursor() as cursor:
+            cursor.execute('''
+                UPDATE cargo_items
+                SET item_name=%s, description=%s, quantity=%s, unit=%s, weight=%s, value=%s, hs_code=%s
+                WHERE id=%s
+            ''', (item_name, description, quantity, unit, weight, value, hs_code, item_id))
+
+    def add_cargo_items_bulk(self, items):
+        """Insert many cargo items (dicts with shipment_id and the item fields) in one
+        transaction; returns the new ids"""
+        return self.save_cargo_items(added=items)['added']
+
+    def update_cargo_items_bulk(self, items):
+        """Update many cargo items (dicts with id and the item fields) in one transaction"""
+        return self.save_cargo_items(updated=items)['updated']
+
+    def delete_cargo_items_bulk(self, item_ids):
+        return self.save_cargo_items(deleted=item_ids)['deleted']
+
+    def save_cargo_items(self, added=(), updated=(), deleted=()):
+        """Apply a batch of cargo item inserts, updates and deletes in one transaction,
+        then recompute total_weight/total_value once for every shipment touched.
+
+        Returns {'added': [new ids], 'updated': count, 'deleted': count}.
+        """
+        shipment_ids = set()
+        result = {'added': [], 'updated': 0, 'deleted': 0}
+        with self.cursor() as cursor:
+            if deleted:
+                cursor.execute(
+                    "DELETE FROM cargo_items WHERE id = ANY(%s) RETURNING shipment_id",
+                    ([int(item_id) for item_id in deleted],)
+                )
+                rows = cursor.fetchall()
+                result['deleted'] = len(rows)
+                shipment_ids.update(row[0] for row in rows)
+            if updated:
+                rows = execute_values(cursor, '''
+                    UPDATE cargo_items AS c
+                    SET item_name = v.item_name, description = v.description, quantity = v.quantity,
+                        unit = v.unit, weight = v.weight, value = v.value, hs_code = v.hs_code
+                    FROM (VALUES %s) AS v(id, item_name, description, quantity, unit, weight, value, hs_code)
+                    WHERE c.id = v.id
+                    RETURNING c.shipment_id
+                ''', [(int(item['id']),) + _cargo_fields(item) for item in updated],
+                    template="(%s::int, %s, %s, %s::int, %s, %s::real, %s::real, %s)", fetch=True)
+                result['updated'] = len(rows)
+                shipment_ids.update(row[0] for row in rows)
+            if added:
+                rows = execute_values(cursor, '''
+                    INSERT INTO cargo_items (shipment_id, item_name, description, quantity, unit, weight, value, hs_code)
+                    VALUES %s
+                    RETURNING id, shipment_id
+                ''', [(int(item['shipment_id']),) + _cargo_fields(item) for item in added], fetch=True)
+                result['added'] = [row[0] for row in rows]
+                shipment_ids.update(row[1] for row in rows)
+            _recompute_shipment_totals(cursor, shipment_ids)
+        return result
 
     def add_tracking_update(self, shipment_id, location, status, notes, update_date, created_by):
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('''
-            INSERT INTO tracking_updates (shipment_id, location, status, notes, update_date, created_by)
-            VALUES (%s, %s, %s, %s, %s, %s)
-        ''', (shipment_id, location, status, notes, update_date, created_by))
-        conn.commit()
-        conn.close()
+        with self.cursor() as cursor:
+            cursor.execute('''
+                INSERT INTO tracking_updates (shipment_id, location, status, notes, update_date, created_by)
+                VALUES (%s, %s, %s, %s, %s, %s)
+            ''', (shipment_id, location, status, notes, update_date, created_by))
 
     def get_tracking_updates(self, shipment_id):
         return pd.read_sql_query('''
-            SELECT t.*, u.email as updated_by_email 
-            FROM tracking_updates t 
-            LEFT JOIN users u ON t.created_by = u.id 
-            WHERE t.shipment_id=%(shipment_id)s 
+            SELECT t.*, u.email as updated_by_email
+            FROM tracking_updates t
+            LEFT JOIN users u ON t.created_by = u.id
+            WHERE t.shipment_id=%(shipment_id)s
             ORDER BY t.update_date DESC, t.id DESC
         ''', Database._engine, params={'shipment_id': int(shipment_id)})
 
     def add_shipment_document(self, shipment_id, document_type, file_path, uploaded_by, notes=''):
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('''
-            INSERT INTO shipment_documents (shipment_id, document_type, file_path, uploaded_by, notes)
-            VALUES (%s, %s, %s, %s, %s)
-        ''', (shipment_id, document_type, file_path, uploaded_by, notes))
-        conn.commit()
-        conn.close()
+        with self.cursor() as cursor:
+            cursor.execute('''
+                INSERT INTO shipment_documents (shipment_id, document_type, file_path, uploaded_by, notes)
+                VALUES (%s, %s, %s, %s, %s)
+            ''', (shipment_id, document_type, file_path, uploaded_by, notes))
 
     def get_shipment_documents(self, shipment_id):
         return pd.read_sql_query('''
-            SELECT d.*, u.email as uploaded_by_email 
-            FROM shipment_documents d 
-            LEFT JOIN users u ON d.uploaded_by = u.id 
-            WHERE d.shipment_id=%(shipment_id)s 
+            SELECT d.*, u.email as uploaded_by_email
+            FROM shipment_documents d
+            LEFT JOIN users u ON d.uploaded_by = u.id
+            WHERE d.shipment_id=%(shipment_id)s
             ORDER BY d.id DESC
         ''', Database._engine, params={'shipment_id': int(shipment_id)})
 
+    def get_shipment_bundle(self, shipment_id):
+        """Shipment header, cargo items, tracking history and documents in one round-trip.
+
+        Each child set is folded into a JSON array server-side so the whole detail
+        view is a single query. The header columns are selected as they are, so
+        'shipment' has the same types as get_shipment_by_id (or is None). The
+        other keys hold the frames described by SHIPMENT_BUNDLE_FRAMES.
+        """
+        with self.cursor(cursor_factory=RealDictCursor) as cursor:
+            # The LEFT JOIN keeps one row, with a NULL header, when the shipment does not exist
+            cursor.execute('''
+                SELECT h.*,
+                    (SELECT COALESCE(json_agg(c ORDER BY c.id), '[]')
+                     FROM cargo_items c
+                     WHERE c.shipment_id = %(id)s) AS bundle_cargo_items,
+                    (SELECT COALESCE(json_agg(tr ORDER BY tr.update_date DESC, tr.id DESC), '[]') FROM (
+                        SELECT t.*, u.email as updated_by_email
+                        FROM tracking_updates t
+                        LEFT JOIN users u ON t.created_by = u.id
+                        WHERE t.shipment_id = %(id)s
+                    ) tr) AS bundle_tracking,
+                    (SELECT COALESCE(json_agg(dd ORDER BY dd.id DESC), '[]') FROM (
+                        SELECT d.*, u.email as uploaded_by_email
+                        FROM shipment_documents d
+                        LEFT JOIN users u ON d.uploaded_by = u.id
+                        WHERE d.shipment_id = %(id)s
+                    ) dd) AS bundle_documents
+                FROM (SELECT 1) one
+                LEFT JOIN (
+                    SELECT s.*, u.email as client_email
+                    FROM shipments s
+                    LEFT JOIN users u ON s.client_id = u.id
+                    WHERE s.id = %(id)s
+                ) h ON TRUE
+            ''', {'id': int(shipment_id)})
+            shipment = dict(cursor.fetchone())
+        cargo_items = shipment.pop('bundle_cargo_items')
+        tracking = shipment.pop('bundle_tracking')
+        documents = shipment.pop('bundle_documents')
+        return {
+            'shipment': shipment if shipment['id'] is not None else None,
+            'cargo_items': _typed_frame(cargo_items, SHIPMENT_BUNDLE_FRAMES['cargo_items']),
+            'tracking': _typed_frame(tracking, SHIPMENT_BUNDLE_FRAMES['tracking']),
+            'documents': _typed_frame(documents, SHIPMENT_BUNDLE_FRAMES['documents']),
+        }
+
     def create_cargo_request(self, cargo_item_id, client_id, request_type, reason=''):
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('''
-            INSERT INTO cargo_requests (cargo_item_id, client_id, request_type, reason)
-            VALUES (%s, %s, %s, %s)
-        ''', (cargo_item_id, client_id, request_type, reason))
-        conn.commit()
-        conn.close()
+        with self.cursor() as cursor:
+            cursor.execute('''
+                INSERT INTO cargo_requests (cargo_item_id, client_id, request_type, reason)
+                VALUES (%s, %s, %s, %s)
+            ''', (cargo_item_id, client_id, request_type, reason))
 
     def get_cargo_requests_by_client(self, client_id):
         return pd.read_sql_query('''
@@ -630,38 +849,52 @@ class Database:
             ORDER BY cr.id DESC
         ''', Database._engine)
 
+    def get_cargo_requests_page(self, cursor=None, limit=50, status=None, request_type=None):
+        return self._read_page(
+            """SELECT cr.*, ci.item_name, ci.shipment_id, s.shipment_number, u.email as client_email
+               FROM cargo_requests cr
+               LEFT JOIN cargo_items ci ON cr.cargo_item_id = ci.id
+               LEFT JOIN shipments s ON ci.shipment_id = s.id
+               LEFT JOIN users u ON cr.client_id = u.id""",
+            'cr.id', {'cr.status': status, 'cr.request_type': request_type}, cursor, limit
+        )
+
     def update_cargo_request_status(self, request_id, status, employee_response=''):
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('''
-            UPDATE cargo_requests 
-            SET status=%s, employee_response=%s, updated_at=CURRENT_TIMESTAMP
-            WHERE id=%s
-        ''', (status, employee_response, request_id))
-        conn.commit()
-        conn.close()
+        with self.cursor() as cursor:
+            cursor.execute('''
+                UPDATE cargo_requests
+                SET status=%s, employee_response=%s, updated_at=CURRENT_TIMESTAMP
+                WHERE id=%s
+            ''', (status, employee_response, request_id))
+
+    def get_shipment_rollup(self):
+        """Per type/status shipment counts and value sums, kept current by triggers"""
+        return pd.read_sql_query(
+            "SELECT type, status, shipment_count, value_sum FROM shipment_rollup ORDER BY type, status",
+            Database._engine
+        )
+
+    def get_recent_shipments(self, limit=10):
+        return pd.read_sql_query('''
+            SELECT s.*, u.email as client_email
+            FROM shipments s
+            LEFT JOIN users u ON s.client_id = u.id
+            ORDER BY s.id DESC
+            LIMIT %(limit)s
+        ''', Database._engine, params={'limit': limit})
 
     def get_shipment_statistics(self):
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute("SELECT COUNT(*) FROM shipments")
-        total_shipments = cursor.fetchone()[0]
-        
-        cursor.execute("SELECT COUNT(*) FROM shipments WHERE type='Import'")
-        total_imports = cursor.fetchone()[0]
-        
-        cursor.execute("SELECT COUNT(*) FROM shipments WHERE type='Export'")
-        total_exports = cursor.fetchone()[0]
-        
-        cursor.execute("SELECT COUNT(*) FROM shipments WHERE status='In Transit'")
-        in_transit = cursor.fetchone()[0]
-        
-        cursor.execute("SELECT SUM(total_value) FROM shipments")
-        total_value = cursor.fetchone()[0] or 0
-        
-        conn.close()
-        
+        with self.cursor() as cursor:
+            cursor.execute("""
+                SELECT COALESCE(SUM(shipment_count), 0),
+                       COALESCE(SUM(shipment_count) FILTER (WHERE type = 'Import'), 0),
+                       COALESCE(SUM(shipment_count) FILTER (WHERE type = 'Export'), 0),
+                       COALESCE(SUM(shipment_count) FILTER (WHERE status = 'In Transit'), 0),
+                       COALESCE(SUM(value_sum), 0)
+                FROM shipment_rollup
+            """)
+            total_shipments, total_imports, total_exports, in_transit, total_value = cursor.fetchone()
+
         return {
             'total_shipments': total_shipments,
             'total_imports': total_imports,
@@ -670,56 +903,192 @@ class Database:
             'total_value': round(total_value, 2)
         }
 
-    def init_messages_table(self):
-        """Initialize messages table for client-employee communication"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS messages (
-                id SERIAL PRIMARY KEY,
-                from_user_id INTEGER NOT NULL,
-                to_user_id INTEGER NOT NULL,
-                subject TEXT NOT NULL,
-                content TEXT NOT NULL,
-                shipment_id INTEGER,
-                is_read INTEGER DEFAULT 0,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY(from_user_id) REFERENCES users(id),
-                FOREIGN KEY(to_user_id) REFERENCES users(id),
-                FOREIGN KEY(shipment_id) REFERENCES shipments(id) ON DELETE SET NULL
+    def export_csv(self, name, out):
+        """Write a whitelisted export as CSV with a header row into the binary file out.
+
+        COPY TO STDOUT hands rows to out as the server produces them, so neither
+        side holds the result set in memory.
+        """
+        query = exports.export_query(name)
+        with self.cursor() as cursor:
+            cursor.copy_expert(f"COPY ({query}) TO STDOUT WITH (FORMAT csv, HEADER)", out)
+
+    def iter_export_rows(self, name, batch_size=exports.EXPORT_BATCH_ROWS):
+        """Yield the column names of a whitelisted export, then its rows in batches.
+
+        A named (server-side) cursor keeps the result on the server, so only one
+        batch is held here at a time.
+        """
+        query = exports.export_query(name)
+        with self.connection() as conn:
+            cursor = conn.cursor(name=f"export_{name}_{uuid.uuid4().hex[:8]}")
+            try:
+                cursor.itersize = batch_size
+                cursor.execute(query)
+                rows = cursor.fetchmany(batch_size)
+                # A named cursor has no description until the first fetch
+                yield [column[0] for column in cursor.description]
+                while rows:
+                    yield rows
+                    rows = cursor.fetchmany(batch_size)
+            finally:
+                cursor.close()
+
+    def create_export_job(self, request_hash, export_format, export_names, requested_by=None):
+        """Queue an export job and return its id, or None if an identical job is already queued or running"""
+        try:
+            with self.cursor() as cursor:
+                cursor.execute('''
+                    INSERT INTO export_jobs (request_hash, export_format, export_names, requested_by)
+                    VALUES (%s, %s, %s, %s)
+                    RETURNING id
+                ''', (request_hash, export_format, ','.join(export_names), requested_by))
+                return cursor.fetchone()[0]
+        except psycopg2.IntegrityError:
+            return None
+
+    def get_export_job(self, job_id):
+        with self.cursor(cursor_factory=RealDictCursor) as cursor:
+            cursor.execute('SELECT * FROM export_jobs WHERE id = %s', (job_id,))
+            row = cursor.fetchone()
+        return dict(row) if row else None
+
+    def find_active_export_job(self, request_hash):
+        """The queued or running job for request_hash, or None"""
+        with self.cursor(cursor_factory=RealDictCursor) as cursor:
+            cursor.execute(
+                "SELECT * FROM export_jobs WHERE request_hash = %s AND status IN ('queued', 'running')",
+                (request_hash,)
             )
-        ''')
-        
-        # Create indexes for faster queries
-        cursor.execute("CREATE INDEX IF NOT EXISTS idx_message_from ON messages(from_user_id)")
-        cursor.execute("CREATE INDEX IF NOT EXISTS idx_message_to ON messages(to_user_id)")
-        cursor.execute("CREATE INDEX IF NOT EXISTS idx_message_shipment ON messages(shipment_id)")
-        
-        conn.commit()
-        conn.close()
+            row = cursor.fetchone()
+        return dict(row) if row else None
+
+    def start_export_job(self, job_id):
+        with self.cursor() as cursor:
+            cursor.execute(
+                "UPDATE export_jobs SET status = 'running', heartbeat_at = CURRENT_TIMESTAMP WHERE id = %s",
+                (job_id,)
+            )
+
+    def update_export_job_progress(self, job_id, progress, detail=''):
+        with self.cursor() as cursor:
+            cursor.execute(
+                "UPDATE export_jobs SET progress = %s, detail = %s, heartbeat_at = CURRENT_TIMESTAMP WHERE id = %s",
+                (progress, detail, job_id)
+            )
+
+    def heartbeat_export_job(self, job_id):
+        """Show the job is still alive when its writer reports no progress"""
+        with self.cursor() as cursor:
+            cursor.execute("UPDATE export_jobs SET heartbeat_at = CURRENT_TIMESTAMP WHERE id = %s", (job_id,))
+
+    def claim_export_file(self, job_id, file_path):
+        """Point a running job at its output file before the file is stored, so sweeps keep it"""
+        with self.cursor() as cursor:
+            cursor.execute("UPDATE export_jobs SET file_path = %s WHERE id = %s", (file_path, job_id))
+
+    def finish_export_job(self, job_id, file_path, ttl_seconds):
+        with self.cursor() as cursor:
+            cursor.execute('''
+                UPDATE export_jobs
+                SET status = 'done', progress = 1, file_path = %s, finished_at = CURRENT_TIMESTAMP,
+                    expires_at = CURRENT_TIMESTAMP + make_interval(secs => %s)
+                WHERE id = %s
+            ''', (file_path, ttl_seconds, job_id))
+
+    def fail_export_job(self, job_id, error):
+        with self.cursor() as cursor:
+            cursor.execute(
+                "UPDATE export_jobs SET status = 'failed', error = %s, finished_at = CURRENT_TIMESTAMP WHERE id = %s",
+                (error, job_id)
+            )
+
+    def fail_stale_export_jobs(self, stale_seconds):
+        """Fail queued or running jobs with no heartbeat for stale_seconds, e.g. after a
+        restart killed their worker; returns how many were failed"""
+        with self.cursor() as cursor:
+            cursor.execute('''
+                UPDATE export_jobs
+                SET status = 'failed', error = 'Interrupted', finished_at = CURRENT_TIMESTAMP
+                WHERE status IN ('queued', 'running')
+                  AND heartbeat_at < CURRENT_TIMESTAMP - make_interval(secs => %s)
+            ''', (stale_seconds,))
+            return cursor.rowcount
+
+    def expire_export_jobs(self):
+        """Mark finished jobs past their expiry as expired and return the files that
+        no unexpired job still points at, for the caller to delete"""
+        with self.cursor() as cursor:
+            cursor.execute('''
+                UPDATE export_jobs SET status = 'expired'
+                WHERE status = 'done' AND expires_at < CURRENT_TIMESTAMP
+                RETURNING file_path
+            ''')
+            paths = {row[0] for row in cursor.fetchall() if row[0]}
+            if not paths:
+                return []
+            # Output files are content-addressed, so several jobs may share one, and a
+            # running job may have claimed one it is about to reuse
+            cursor.execute('''
+                SELECT DISTINCT file_path FROM export_jobs
+                WHERE status IN ('queued', 'running', 'done') AND file_path = ANY(%s)
+            ''', (list(paths),))
+            return sorted(paths - {row[0] for row in cursor.fetchall()})
+
+    def import_rows(self, target_name, rows):
+        """Merge validated import rows (see bulk_import.validate) into their table in one
+        transaction; returns {'inserted', 'updated', 'errors': [(row, message), ...]}"""
+        target = bulk_import.IMPORT_TARGETS[target_name]
+        columns = bulk_import.staging_columns(target_name)
+        buffer = io.StringIO()
+        rows[columns].to_csv(buffer, index=False, header=False)
+        buffer.seek(0)
+        with self.cursor() as cursor:
+            cursor.execute(bulk_import.staging_table_sql(target_name) + " ON COMMIT DROP")
+            cursor.copy_expert(
+                f"COPY import_{target_name} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)", buffer
+            )
+            errors = []
+            if target['unresolved']:
+                cursor.execute(target['unresolved'])
+                errors = cursor.fetchall()
+            shipment_ids = []
+            if target['shipments_touched']:
+                cursor.execute(target['shipments_touched'])
+                shipment_ids = [row[0] for row in cursor.fetchall()]
+            cursor.execute(target['existing'])
+            updated = cursor.fetchone()[0]
+            merged = 0
+            for statement in target['merge']:
+                cursor.execute(statement)
+                merged += cursor.rowcount
+            _recompute_shipment_totals(cursor, shipment_ids)
+            if target['key'] == 'id':
+                # Imported rows may carry ids past the sequence; move it beyond them
+                cursor.execute(f'''
+                    SELECT setval(pg_get_serial_sequence('{target['table']}', 'id'),
+                                  (SELECT COALESCE(MAX(id), 0) + 1 FROM {target['table']}), false)
+                ''')
+        return {'inserted': merged - updated, 'updated': updated, 'errors': errors}
 
     def send_message(self, from_user_id, to_user_id, subject, content, shipment_id=None):
         """Send a message from one user to another"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
         try:
-            cursor.execute('''
-                INSERT INTO messages (from_user_id, to_user_id, subject, content, shipment_id)
-                VALUES (%s, %s, %s, %s, %s)
-            ''', (from_user_id, to_user_id, subject, content, shipment_id))
-            conn.commit()
+            with self.cursor() as cursor:
+                cursor.execute('''
+                    INSERT INTO messages (from_user_id, to_user_id, subject, content, shipment_id)
+                    VALUES (%s, %s, %s, %s, %s)
+                ''', (from_user_id, to_user_id, subject, content, shipment_id))
             return True
         except Exception as e:
             print(f"Error sending message: {e}")
             return False
-        finally:
-            conn.close()
 
     def get_user_messages(self, user_id):
         """Get all messages for a user (sent and received)"""
         query = """
-            SELECT m.*, 
-                   u_from.email as from_email, 
+            SELECT m.*,
+                   u_from.email as from_email,
                    u_to.email as to_email,
                    s.shipment_number
             FROM messages m
@@ -733,17 +1102,11 @@ class Database:
 
     def mark_message_read(self, message_id):
         """Mark a message as read"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('UPDATE messages SET is_read=1 WHERE id=%s', (message_id,))
-        conn.commit()
-        conn.close()
+        with self.cursor() as cursor:
+            cursor.execute('UPDATE messages SET is_read=1 WHERE id=%s', (message_id,))
 
     def get_unread_count(self, user_id):
         """Get count of unread messages for a user"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('SELECT COUNT(*) FROM messages WHERE to_user_id=%s AND is_read=0', (user_id,))
-        count = cursor.fetchone()[0]
-        conn.close()
-        return count
+        with self.cursor() as cursor:
+            cursor.execute('SELECT COUNT(*) FROM messages WHERE to_user_id=%s AND is_read=0', (user_id,))
+            return cursor.fetchone()[0]
@@ -0,0 +1,173 @@
+"""Background export jobs.
+
+Exports run on a small thread pool instead of the Streamlit script thread, so
+they survive reruns and page changes. Every job is a row in export_jobs (see
+migration 7) that pages poll for status and progress. Requests are identified
+by a hash of format and exports; an identical request made while one is queued
+or running joins that job instead of starting another. Finished files are
+stored under the SHA-256 of their content, so identical outputs share one file,
+and are deleted once every job pointing at them has expired. A job claims its
+file in the database before reusing it, and touches it, so a sweep running at
+the same time (here or in another replica) leaves it alone. Running jobs
+heartbeat on a timer, so a long export whose writer reports no progress (CSV
+is streamed by COPY) is not taken for one left behind by a dead process.
+"""
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+import exports
+
+logger = logging.getLogger(__name__)
+
+# Outside the working tree by default; point every replica at the same EXPORT_DIR to share files
+EXPORT_DIR = os.getenv('EXPORT_DIR', os.path.join(tempfile.gettempdir(), 'eims_exports'))
+
+# format -> (file suffix, writer(data_manager, names, progress) returning a temp file path)
+EXPORT_WRITERS = {
+    'csv': ('.csv', lambda data_manager, names, progress: data_manager.export_table_csv(names[0])),
+    'xlsx': ('.xlsx', lambda data_manager, names, progress: data_manager.export_tables_excel(names, progress)),
+    'parquet': ('.parquet', lambda data_manager, names, progress: data_manager.export_table_parquet(names[0], progress)),
+    'arrow': ('.arrow', lambda data_manager, names, progress: data_manager.export_table_arrow(names[0], progress)),
+}
+
+# Formats that hold exactly one export per file
+SINGLE_EXPORT_FORMATS = {'csv', 'parquet', 'arrow'}
+
+
+def request_hash(export_format, names):
+    """Stable identity of an export request, used to join identical ones"""
+    request = json.dumps({'format': export_format, 'exports': list(names)}, sort_keys=True)
+    return hashlib.sha256(request.encode('utf-8')).hexdigest()
+
+
+class ExportJobQueue:
+    def __init__(self, db, data_manager, output_dir=EXPORT_DIR, workers=2,
+                 ttl=timedelta(hours=1), stale_after=timedelta(minutes=10), progress_interval=1.0):
+        self.db = db
+        self.data_manager = data_manager
+        self.output_dir = output_dir
+        self.ttl = ttl
+        self.progress_interval = progress_interval
+        # Several beats per stale_after, so one slow UPDATE does not get a live job failed
+        self.heartbeat_interval = stale_after.total_seconds() / 4
+        os.makedirs(output_dir, exist_ok=True)
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='export-job')
+        self._sweep_lock = threading.Lock()
+        # Held while a file is reused or deleted, so the two never interleave in this process
+        self._files_lock = threading.Lock()
+        # Jobs left behind by a process that died no longer heartbeat
+        failed = db.fail_stale_export_jobs(stale_after.total_seconds())
+        if failed:
+            logger.warning(f"Marked {failed} interrupted export job(s) as failed")
+        self.sweep()
+
+    def submit(self, export_format, names, requested_by=None):
+        """Queue an export, or join the identical one already queued or running; returns the job id"""
+        if export_format not in EXPORT_WRITERS:
+            raise ValueError(f"Unknown export format: {export_format}")
+        if not names:
+            raise ValueError("Nothing to export")
+        if export_format in SINGLE_EXPORT_FORMATS and len(names) != 1:
+            raise ValueError(f"A {export_format} export holds exactly one table")
+        for name in names:
+            exports.export_query(name)
+
+        key = request_hash(export_format, names)
+        # The unique index on active jobs makes this safe across sessions and processes
+        for _ in range(2):
+            job_id = self.db.create_export_job(key, export_format, names, requested_by)
+            if job_id is not None:
+                self._executor.submit(self._run, job_id, export_format, list(names))
+                self.sweep()
+                return job_id
+            existing = self.db.find_active_export_job(key)
+            if existing:
+                return existing['id']
+            # The identical job finished between the insert and the lookup; queue a fresh one
+        raise RuntimeError("Could not queue the export, please try again")
+
+    def status(self, job_id):
+        """The job's row as a dict (status, progress, detail, file_path, error, ...), or None"""
+        return self.db.get_export_job(job_id)
+
+    def sweep(self):
+        """Expire finished jobs past their TTL and delete files no job still uses"""
+        if not self._sweep_lock.acquire(blocking=False):
+            return
+        try:
+            expired_at = time.time()
+            for path in self.db.expire_export_jobs():
+                with self._files_lock:
+                    try:
+                        # A job that reused the file after the expiry check has touched it since
+                        if os.path.getmtime(path) < expired_at:
+                            os.remove(path)
+                    except FileNotFoundError:
+                        pass
+        except Exception as e:
+            logger.warning(f"Export cleanup failed: {e}")
+        finally:
+            self._sweep_lock.release()
+
+    def _run(self, job_id, export_format, names):
+        suffix, writer = EXPORT_WRITERS[export_format]
+        last_report = 0.0
+
+        def report(name, rows_written, done, total):
+            nonlocal last_report
+            now = time.monotonic()
+            if now - last_report >= self.progress_interval:
+                last_report = now
+                label = exports.EXPORT_LABELS[name]
+                self.db.update_export_job_progress(job_id, done / total, f"{label}: {rows_written:,} rows")
+
+        stopped = threading.Event()
+        heartbeat = threading.Thread(target=self._heartbeat, args=(job_id, stopped),
+                                     name=f'export-heartbeat-{job_id}', daemon=True)
+        try:
+            self.db.start_export_job(job_id)
+            heartbeat.start()
+            path = writer(self.data_manager, names, report)
+            self.db.finish_export_job(job_id, self._store(job_id, path, suffix), self.ttl.total_seconds())
+        except Exception as e:
+            logger.exception(f"Export job {job_id} failed")
+            try:
+                self.db.fail_export_job(job_id, str(e))
+            except Exception:
+                logger.exception(f"Could not record the failure of export job {job_id}")
+        finally:
+            stopped.set()
+
+    def _heartbeat(self, job_id, stopped):
+        """Touch the job's heartbeat every heartbeat_interval until stopped is set"""
+        while not stopped.wait(self.heartbeat_interval):
+            try:
+                self.db.heartbeat_export_job(job_id)
+            except Exception as e:
+                logger.warning(f"Could not heartbeat export job {job_id}: {e}")
+
+    def _store(self, job_id, path, suffix):
+        """Move a finished temp file to its content address under output_dir"""
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                digest.update(chunk)
+        target = os.path.join(self.output_dir, digest.hexdigest() + suffix)
+        # From here on expire_export_jobs no longer hands the target out for deletion
+        self.db.claim_export_file(job_id, target)
+        with self._files_lock:
+            try:
+                # Sweeps that picked the file before the claim skip it once it is touched
+                os.utime(target)
+                os.remove(path)
+            except FileNotFoundError:
+                shutil.move(path, target)
+        return target
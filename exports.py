@@ -0,0 +1,102 @@
+"""Whitelisted export queries shared by both database backends.
+
+Exports stream straight from the database into a per-request temporary file
+instead of materialising a DataFrame, so memory stays flat however many rows a
+table has. Only the queries named here can be exported; callers pass the name,
+never SQL. Each query is plain SQL that runs unchanged on Postgres and SQLite,
+and leaves out secrets such as company_records.password.
+"""
+import os
+import tempfile
+
+EXPORT_QUERIES = {
+    'records': '''
+        SELECT cr.id, cr.employee_name, cr.department, cr.position, cr.salary, cr.hire_date,
+               cr.email, cr.phone, cr.status, u.role, cr.created_at, cr.updated_at
+        FROM company_records cr
+        LEFT JOIN users u ON cr.email = u.email
+        ORDER BY cr.id
+    ''',
+    'shipments': '''
+        SELECT s.id, s.shipment_number, u.email AS client_email, s.type, s.origin_country,
+               s.destination_country, s.departure_date, s.expected_arrival, s.actual_arrival,
+               s.status, s.total_weight, s.total_value, s.currency, s.customs_cleared, s.notes,
+               s.created_at, s.updated_at
+        FROM shipments s
+        LEFT JOIN users u ON s.client_id = u.id
+        ORDER BY s.id
+    ''',
+    'cargo_items': '''
+        SELECT c.id, s.shipment_number, c.item_name, c.description, c.quantity, c.unit,
+               c.weight, c.value, c.hs_code, c.created_at
+        FROM cargo_items c
+        JOIN shipments s ON s.id = c.shipment_id
+        ORDER BY c.id
+    ''',
+    'tracking': '''
+        SELECT t.id, s.shipment_number, t.location, t.status, t.notes, t.update_date,
+               u.email AS updated_by_email, t.created_at
+        FROM tracking_updates t
+        JOIN shipments s ON s.id = t.shipment_id
+        LEFT JOIN users u ON u.id = t.created_by
+        ORDER BY t.id
+    ''',
+}
+
+EXPORT_LABELS = {
+    'records': 'Employee records',
+    'shipments': 'Shipments',
+    'cargo_items': 'Cargo items',
+    'tracking': 'Tracking updates',
+}
+
+# Logical type of every exported column, for formats that keep types (Parquet,
+# Arrow). SQLite hands dates back as text, so the type comes from here rather
+# than from the driver. 'category' marks low-cardinality text.
+EXPORT_COLUMN_TYPES = {
+    'records': {
+        'id': 'int', 'employee_name': 'text', 'department': 'category', 'position': 'category',
+        'salary': 'float', 'hire_date': 'date', 'email': 'text', 'phone': 'text',
+        'status': 'category', 'role': 'category', 'created_at': 'timestamp', 'updated_at': 'timestamp',
+    },
+    'shipments': {
+        'id': 'int', 'shipment_number': 'text', 'client_email': 'text', 'type': 'category',
+        'origin_country': 'category', 'destination_country': 'category', 'departure_date': 'date',
+        'expected_arrival': 'date', 'actual_arrival': 'date', 'status': 'category',
+        'total_weight': 'float', 'total_value': 'float', 'currency': 'category',
+        'customs_cleared': 'bool', 'notes': 'text', 'created_at': 'timestamp', 'updated_at': 'timestamp',
+    },
+    'cargo_items': {
+        'id': 'int', 'shipment_number': 'text', 'item_name': 'text', 'description': 'text',
+        'quantity': 'int', 'unit': 'category', 'weight': 'float', 'value': 'float',
+        'hs_code': 'text', 'created_at': 'timestamp',
+    },
+    'tracking': {
+        'id': 'int', 'shipment_number': 'text', 'location': 'text', 'status': 'category',
+        'notes': 'text', 'update_date': 'date', 'updated_by_email': 'text', 'created_at': 'timestamp',
+    },
+}
+
+# Rows fetched per round trip when iterating a cursor
+EXPORT_BATCH_ROWS = 5000
+
+# Rows per Parquet row group / Arrow record batch
+COLUMNAR_BATCH_ROWS = 100000
+
+
+def export_query(name):
+    """SQL for a whitelisted export, or ValueError for anything else"""
+    try:
+        return EXPORT_QUERIES[name]
+    except KeyError:
+        raise ValueError(f"Unknown export: {name}") from None
+
+
+def temp_export_file(name, suffix):
+    """Open a new private temp file for one export; returns (binary file, path).
+
+    Each request gets its own file, so concurrent exports never overwrite each
+    other. The caller removes the path once the download has been handed off.
+    """
+    fd, path = tempfile.mkstemp(prefix=f"eims_{name}_", suffix=suffix)
+    return os.fdopen(fd, 'wb'), path
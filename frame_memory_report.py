@@ -0,0 +1,96 @@
+"""Compare the memory of cached frames before and after compact_frame().
+
+Builds synthetic company_records and shipments frames shaped like the query
+results (object strings, TEXT dates, 64-bit numbers) and prints their deep
+memory usage with and without the compact schema.
+
+    python frame_memory_report.py [rows]
+"""
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from frame_schema import compact_frame, memory_usage, RECORD_SCHEMA, SHIPMENT_SCHEMA, STRING_DTYPE
+
+DEPARTMENTS = ['IT', 'HR', 'Sales', 'Marketing', 'Finance', 'Operations', 'Logistics', 'Legal']
+POSITIONS = ['Software Developer', 'HR Manager', 'Sales Representative', 'Marketing Specialist',
+             'Accountant', 'Operations Manager', 'Logistics Coordinator', 'Legal Advisor']
+COUNTRIES = ['Saudi Arabia', 'United Arab Emirates', 'China', 'India', 'Germany', 'United States',
+             'Egypt', 'Turkey', 'Japan', 'Brazil']
+
+
+def _dates(rng, rows, with_time=False):
+    stamps = pd.Timestamp('2015-01-01') + pd.to_timedelta(rng.integers(0, 10 * 365 * 86400, rows), unit='s')
+    return stamps.strftime('%Y-%m-%d %H:%M:%S' if with_time else '%Y-%m-%d').tolist()
+
+
+def synthetic_records(rows, seed=0):
+    rng = np.random.default_rng(seed)
+    ids = np.arange(rows, 0, -1)
+    return pd.DataFrame({
+        'id': ids,
+        'employee_name': [f'Employee {i}' for i in ids],
+        'department': rng.choice(DEPARTMENTS, rows).astype(object),
+        'position': rng.choice(POSITIONS, rows).astype(object),
+        'salary': rng.integers(3000, 20000, rows).astype('float64'),
+        'hire_date': _dates(rng, rows),
+        'email': [f'employee{i}@company.com' for i in ids],
+        'phone': [f'05{n:08d}' for n in rng.integers(0, 10 ** 8, rows)],
+        'status': rng.choice(['Active', 'Inactive', 'On Leave'], rows, p=[0.85, 0.1, 0.05]).astype(object),
+        'password': [''] * rows,
+        'created_at': _dates(rng, rows, with_time=True),
+        'updated_at': _dates(rng, rows, with_time=True),
+        'role': rng.choice(['employee', 'manager', 'client', None], rows, p=[0.7, 0.05, 0.2, 0.05]),
+    })
+
+
+def synthetic_shipments(rows, seed=1):
+    rng = np.random.default_rng(seed)
+    ids = np.arange(rows, 0, -1)
+    return pd.DataFrame({
+        'id': ids,
+        'shipment_number': [f'SHP-{i:08d}' for i in ids],
+        'client_id': rng.integers(1, 5000, rows),
+        'type': rng.choice(['Import', 'Export'], rows).astype(object),
+        'origin_country': rng.choice(COUNTRIES, rows).astype(object),
+        'destination_country': rng.choice(COUNTRIES, rows).astype(object),
+        'departure_date': _dates(rng, rows),
+        'expected_arrival': _dates(rng, rows),
+        'actual_arrival': _dates(rng, rows),
+        'status': rng.choice(['Pending', 'In Transit', 'Customs', 'Delivered', 'Cancelled'], rows).astype(object),
+        'total_weight': rng.integers(10, 50000, rows).astype('float64'),
+        'total_value': rng.integers(100, 10 ** 6, rows) / 100,
+        'currency': rng.choice(['USD', 'EUR', 'SAR', 'AED', 'CNY'], rows).astype(object),
+        'customs_cleared': rng.integers(0, 2, rows),
+        'notes': rng.choice(['', 'Fragile', 'Keep dry', 'Priority'], rows).astype(object),
+        'created_at': _dates(rng, rows, with_time=True),
+        'updated_at': _dates(rng, rows, with_time=True),
+        'client_email': [f'client{n}@example.com' for n in rng.integers(1, 5000, rows)],
+    })
+
+
+def report(name, df, schema):
+    before = memory_usage(df)
+    started = time.perf_counter()
+    compact = compact_frame(df, schema)
+    elapsed = time.perf_counter() - started
+    after = memory_usage(compact)
+    print(f"\n{name}: {len(df):,} rows")
+    print(f"  before  {before / 2 ** 20:10.1f} MiB")
+    print(f"  after   {after / 2 ** 20:10.1f} MiB  ({after / before:.0%} of before, compacted in {elapsed:.1f}s)")
+    per_column = pd.DataFrame({
+        'before': df.memory_usage(deep=True, index=False),
+        'after': compact.memory_usage(deep=True, index=False),
+        'dtype': compact.dtypes.astype(str),
+    })
+    per_column[['before', 'after']] = (per_column[['before', 'after']] / 2 ** 20).round(1)
+    print(per_column.to_string())
+
+
+if __name__ == '__main__':
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    print(f"Arrow-backed strings: {'yes' if STRING_DTYPE else 'no (install pyarrow)'}")
+    report('company_records', synthetic_records(rows), RECORD_SCHEMA)
+    report('shipments', synthetic_shipments(rows), SHIPMENT_SCHEMA)
@@ -0,0 +1,91 @@
+"""Compact dtypes for the DataFrames the app keeps cached in memory.
+
+Query results arrive with every text column as Python object strings, TEXT dates
+as strings and every number as 64-bit. compact_frame() converts them according
+to a schema: low-cardinality text becomes categorical, free text becomes
+Arrow-backed strings when pyarrow is installed, dates are parsed, and numbers
+are narrowed only when the narrower type holds every value exactly. Ids never
+go below int32, so a frame's id dtype does not depend on how many rows it has
+and frames merged from deltas keep one dtype.
+"""
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow  # noqa: F401
+    STRING_DTYPE = 'string[pyarrow]'
+except ImportError:
+    STRING_DTYPE = None
+
+RECORD_SCHEMA = {
+    'categories': ('department', 'position', 'status', 'role'),
+    'strings': ('employee_name', 'email', 'phone', 'password'),
+    'dates': ('hire_date', 'created_at', 'updated_at'),
+    'floats': ('salary',),
+    'ids': ('id',),
+}
+
+SHIPMENT_SCHEMA = {
+    'categories': ('type', 'status', 'currency', 'origin_country', 'destination_country'),
+    'strings': ('shipment_number', 'notes', 'client_email'),
+    'dates': ('departure_date', 'expected_arrival', 'actual_arrival', 'created_at', 'updated_at'),
+    'floats': ('total_weight', 'total_value'),
+    'ids': ('id', 'client_id'),
+    'ints': ('customs_cleared',),
+}
+
+
+def compact_frame(df, schema):
+    """Return df with the schema's dtypes applied; columns it lacks are skipped.
+
+    Safe to call again on an already compacted frame, e.g. after pd.concat has
+    turned categoricals with different categories back into object columns.
+    """
+    df = df.copy(deep=False)
+
+    def present(kind):
+        return [column for column in schema.get(kind, ()) if column in df.columns]
+
+    for column in present('categories'):
+        if not isinstance(df[column].dtype, pd.CategoricalDtype):
+            df[column] = df[column].astype('category')
+    if STRING_DTYPE:
+        for column in present('strings'):
+            if df[column].dtype == object:
+                df[column] = df[column].astype(STRING_DTYPE)
+    for column in present('dates'):
+        if not pd.api.types.is_datetime64_any_dtype(df[column]):
+            df[column] = pd.to_datetime(df[column], errors='coerce')
+    for column in present('floats'):
+        df[column] = _narrow_float(df[column])
+    for column in present('ints'):
+        if pd.api.types.is_integer_dtype(df[column]):
+            df[column] = pd.to_numeric(df[column], downcast='integer')
+    for column in present('ids'):
+        df[column] = _narrow_id(df[column])
+    return df
+
+
+def _narrow_id(values):
+    # int32 whatever the values, int64 only once an id outgrows it
+    if not (isinstance(values.dtype, np.dtype) and values.dtype.kind in 'iu') or values.dtype == 'int32':
+        return values
+    info = np.iinfo('int32')
+    if values.empty or (values.min() >= info.min and values.max() <= info.max):
+        return values.astype('int32')
+    return values
+
+
+def _narrow_float(values):
+    # float32 keeps ~7 significant digits; only switch when that loses nothing
+    if values.dtype != 'float64':
+        return values
+    narrowed = values.astype('float32')
+    if narrowed.astype('float64').equals(values):
+        return narrowed
+    return values
+
+
+def memory_usage(df):
+    """Bytes held by df, counting the Python string objects behind object columns"""
+    return int(df.memory_usage(deep=True).sum())
@@ -0,0 +1,140 @@
+"""Prometheus text exposition of this process's metrics.
+
+start() serves GET /metrics from a daemon thread, so a scraper running on the
+same host can read it while Streamlit keeps the main port. It binds to
+127.0.0.1 by default and never serves anything but the metrics. Every replica
+is its own process with its own numbers, so give each one its own
+EIMS_METRICS_PORT and scrape them all.
+
+Exposed: the shared pool's connections and blocked checkouts, per-method database call
+histograms (query_metrics), hits and misses of the cached loaders (cache_sync)
+and per-page rerun histograms (rerun_profiler).
+"""
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import query_metrics
+import rerun_profiler
+from cache_sync import CACHE_STATS
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def render(pool_stats=None):
+    """Every metric as Prometheus text; pool_stats() returns Database.pool_stats() or is None"""
+    lines = []
+
+    def family(name, kind, help_text):
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+
+    def sample(name, value, **labels):
+        label_text = ','.join(f'{key}="{_escape(value)}"' for key, value in labels.items())
+        lines.append(f"{name}{{{label_text}}} {_number(value)}" if labels else f"{name} {_number(value)}")
+
+    def histogram(name, bounds, buckets, total, **labels):
+        cumulative = 0
+        for bound, count in zip(bounds, buckets):
+            cumulative += count
+            sample(f"{name}_bucket", cumulative, **labels, le=_number(bound))
+        cumulative += buckets[-1]
+        sample(f"{name}_bucket", cumulative, **labels, le='+Inf')
+        sample(f"{name}_sum", total, **labels)
+        sample(f"{name}_count", cumulative, **labels)
+
+    if pool_stats is not None:
+        pool = pool_stats()
+        family('eims_db_pool_connections', 'gauge', 'Connections of the shared pool by state')
+        sample('eims_db_pool_connections', pool['checked_out'], state='in_use')
+        sample('eims_db_pool_connections', pool['idle'], state='idle')
+        family('eims_db_pool_size', 'gauge', 'Configured pool size, not counting overflow')
+        sample('eims_db_pool_size', pool['size'])
+        family('eims_db_pool_overflow', 'gauge', 'Connections open beyond the pool size')
+        sample('eims_db_pool_overflow', pool['overflow'])
+        family('eims_db_pool_waiters', 'gauge', 'Threads blocked on a checkout because every connection is in use')
+        sample('eims_db_pool_waiters', pool['waiting'])
+
+    queries = query_metrics.METRICS.snapshot()
+    family('eims_db_pool_checkouts_total', 'counter', 'Connections checked out of the pool')
+    sample('eims_db_pool_checkouts_total', queries['checkouts'])
+    family('eims_db_pool_checkout_wait_seconds_total', 'counter',
+           'Time spent checking out connections, waiting for one or opening a new one')
+    sample('eims_db_pool_checkout_wait_seconds_total', queries['checkout_wait_seconds'])
+
+    methods = queries['methods']
+    family('eims_db_call_duration_seconds', 'histogram', 'Latency of Database method calls')
+    for method in methods:
+        histogram('eims_db_call_duration_seconds', query_metrics.METRICS.bucket_bounds, method['buckets'],
+                  method['total_ms'] / 1000, method=method['method'])
+    for name, key, scale, help_text in (
+        ('eims_db_call_errors_total', 'errors', 1, 'Database method calls that raised'),
+        ('eims_db_slow_calls_total', 'slow', 1, 'Database method calls over DB_SLOW_QUERY_MS'),
+        ('eims_db_call_rows_total', 'rows', 1, 'Rows returned by Database method calls'),
+        ('eims_db_call_pool_wait_seconds_total', 'pool_wait_ms', 1000, 'Connection checkout time charged to Database methods'),
+    ):
+        family(name, 'counter', help_text)
+        for method in methods:
+            sample(name, method[key] / scale if scale != 1 else method[key], method=method['method'])
+
+    caches = CACHE_STATS.snapshot()
+    family('eims_cache_requests_total', 'counter', 'Cache lookups by result (hit, miss, delta)')
+    for cache, stats in caches.items():
+        for result, count in stats['results'].items():
+            sample('eims_cache_requests_total', count, cache=cache, result=result)
+    family('eims_cache_load_seconds_total', 'counter', 'Time spent loading cache misses and deltas')
+    for cache, stats in caches.items():
+        sample('eims_cache_load_seconds_total', stats['load_seconds'], cache=cache)
+
+    pages = rerun_profiler.snapshot()
+    family('eims_rerun_duration_seconds', 'histogram', 'Duration of App.py reruns by page')
+    for page in pages:
+        histogram('eims_rerun_duration_seconds', rerun_profiler.RERUN_BUCKETS, page['buckets'],
+                  page['total_ms'] / 1000, page=page['page'])
+    family('eims_reruns_total', 'counter', 'App.py reruns by page and how they ended')
+    for page in pages:
+        for status, count in page['statuses'].items():
+            sample('eims_reruns_total', count, page=page['page'], status=status)
+
+    return '\n'.join(lines) + '\n'
+
+
+def start(port, host='127.0.0.1', pool_stats=None):
+    """Serve /metrics on host:port from a daemon thread; returns the server"""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?', 1)[0] != '/metrics':
+                self.send_error(404)
+                return
+            try:
+                body = render(pool_stats).encode('utf-8')
+            except Exception:
+                logger.exception("Could not render metrics")
+                self.send_error(500)
+                return
+            self.send_response(200)
+            self.send_header('Content-Type', CONTENT_TYPE)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            # Scrapes every few seconds would flood eims_app.log at INFO
+            logger.debug(format % args)
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='metrics-server', daemon=True).start()
+    logger.info(f"Serving metrics on http://{host}:{server.server_port}/metrics")
+    return server
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
@@ -0,0 +1,961 @@
+"""Versioned schema migrations shared by the Postgres and SQLite backends.
+
+Every migration is applied exactly once, in version order, and recorded in
+schema_migrations together with a checksum of its statements. Startup only
+reads MAX(version); the catalog is touched again only when a newer migration
+ships. Appended migrations must never be edited once released - add a new
+one instead, otherwise the checksum check refuses to start.
+"""
+import hashlib
+import inspect
+
+POSTGRES = 'postgres'
+SQLITE = 'sqlite'
+
+# Arbitrary constant shared by every process that migrates this database
+ADVISORY_LOCK_KEY = 724511
+
+
+class MigrationError(RuntimeError):
+    pass
+
+
+class Migration:
+    def __init__(self, version, name, postgres, sqlite):
+        self.version = version
+        self.name = name
+        self.statements = {POSTGRES: postgres, SQLITE: sqlite}
+
+    def checksum(self, backend, by_name=False):
+        # Callable steps count by their source, so editing one's body is caught like editing SQL.
+        # by_name gives the checksum recorded before that, when only their names were hashed.
+        parts = [s if isinstance(s, str) else s.__name__ if by_name else inspect.getsource(s)
+                 for s in self.statements[backend]]
+        return hashlib.sha256('\n;\n'.join(parts).encode('utf-8')).hexdigest()
+
+
+def _sqlite_add_missing_columns(cursor):
+    """Bring pre-migration SQLite files up to the baseline column set"""
+    wanted = {
+        'users': [('role', "TEXT DEFAULT 'user'")],
+        'company_records': [('password', "TEXT DEFAULT ''")],
+        'leave_requests': [
+            ('leave_type', "TEXT DEFAULT 'Other'"),
+            ('attachment', "TEXT DEFAULT ''"),
+            ('admin_response', "TEXT DEFAULT ''"),
+        ],
+    }
+    for table, columns in wanted.items():
+        cursor.execute(f"PRAGMA table_info({table})")
+        existing = {r[1] for r in cursor.fetchall()}
+        for column, ddl in columns:
+            if column not in existing:
+                cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}")
+
+
+def _sqlite_add_updated_at(cursor):
+    """SQLite has no ADD COLUMN IF NOT EXISTS"""
+    cursor.execute("PRAGMA table_info(company_records)")
+    if 'updated_at' not in {r[1] for r in cursor.fetchall()}:
+        cursor.execute("ALTER TABLE company_records ADD COLUMN updated_at TEXT")
+
+
+# search_records must use this exact expression for Postgres to pick the trigram index
+RECORD_SEARCH_EXPRESSION = (
+    "lower(employee_name || ' ' || department || ' ' || position || ' ' || COALESCE(email, ''))"
+)
+
+
+# Tables whose changes invalidate cached frames, see cache_sync.TableVersionWatcher.
+# Migration 5 is generated from this tuple, so track new tables in a new migration
+# rather than by editing it.
+VERSIONED_TABLES = ('company_records', 'users', 'shipments')
+TABLE_VERSION_CHANNEL = 'table_versions'
+
+# Tombstones in deleted_rows are kept this long; a delta cache that has not synced
+# within the window must reload in full
+TOMBSTONE_RETENTION_DAYS = 7
+
+
+_SAMPLE_RECORDS = '''
+    ('Ahmed Mohammed', 'IT', 'Software Developer', 5000, '2023-01-15', 'ahmed@company.com', '0501234567', 'Active'),
+    ('Fatima Ali', 'HR', 'HR Manager', 6000, '2022-06-10', 'fatima@company.com', '0507654321', 'Active'),
+    ('Mohammed Khalid', 'Sales', 'Sales Representative', 4500, '2023-03-20', 'mohammed@company.com', '0509876543', 'Active'),
+    ('Sara Ahmed', 'Marketing', 'Marketing Specialist', 4800, '2023-02-01', 'sara@company.com', '0502345678', 'Active'),
+    ('Abdullah Youssef', 'Finance', 'Accountant', 5200, '2022-09-15', 'abdullah@company.com', '0508765432', 'Active')
+'''
+
+
+MIGRATIONS = [
+    Migration(1, 'baseline schema', postgres=[
+        '''
+        CREATE TABLE IF NOT EXISTS company_records (
+            id SERIAL PRIMARY KEY,
+            employee_name TEXT NOT NULL,
+            department TEXT NOT NULL,
+            position TEXT NOT NULL,
+            salary REAL NOT NULL,
+            hire_date TEXT NOT NULL,
+            email TEXT,
+            phone TEXT,
+            status TEXT DEFAULT 'Active',
+            password TEXT DEFAULT '',
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        "ALTER TABLE company_records ADD COLUMN IF NOT EXISTS password TEXT DEFAULT ''",
+        "CREATE INDEX IF NOT EXISTS idx_department ON company_records(department)",
+        "CREATE INDEX IF NOT EXISTS idx_status ON company_records(status)",
+        "CREATE INDEX IF NOT EXISTS idx_email ON company_records(email)",
+        f'''
+        INSERT INTO company_records (employee_name, department, position, salary, hire_date, email, phone, status)
+        SELECT * FROM (VALUES {_SAMPLE_RECORDS}) AS sample
+        WHERE NOT EXISTS (SELECT 1 FROM company_records)
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS users (
+            id SERIAL PRIMARY KEY,
+            email TEXT UNIQUE NOT NULL,
+            password_hash TEXT NOT NULL,
+            salt TEXT NOT NULL,
+            role TEXT DEFAULT 'user',
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        "CREATE INDEX IF NOT EXISTS idx_user_email ON users(email)",
+        "CREATE INDEX IF NOT EXISTS idx_user_role ON users(role)",
+        '''
+        CREATE TABLE IF NOT EXISTS leave_requests (
+            id SERIAL PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            start_date TEXT NOT NULL,
+            end_date TEXT NOT NULL,
+            reason TEXT,
+            leave_type TEXT DEFAULT 'Other',
+            attachment TEXT DEFAULT '',
+            status TEXT DEFAULT 'Pending',
+            admin_response TEXT DEFAULT '',
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY(user_id) REFERENCES users(id)
+        )
+        ''',
+        "CREATE INDEX IF NOT EXISTS idx_leave_user ON leave_requests(user_id)",
+        "CREATE INDEX IF NOT EXISTS idx_leave_status ON leave_requests(status)",
+        '''
+        CREATE TABLE IF NOT EXISTS shipments (
+            id SERIAL PRIMARY KEY,
+            shipment_number TEXT UNIQUE NOT NULL,
+            client_id INTEGER NOT NULL,
+            type TEXT NOT NULL,
+            origin_country TEXT,
+            destination_country TEXT,
+            departure_date TEXT,
+            expected_arrival TEXT,
+            actual_arrival TEXT,
+            status TEXT DEFAULT 'Pending',
+            total_weight REAL,
+            total_value REAL,
+            currency TEXT DEFAULT 'USD',
+            customs_cleared INTEGER DEFAULT 0,
+            notes TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY(client_id) REFERENCES users(id)
+        )
+        ''',
+        "CREATE INDEX IF NOT EXISTS idx_shipment_number ON shipments(shipment_number)",
+        "CREATE INDEX IF NOT EXISTS idx_shipment_client ON shipments(client_id)",
+        "CREATE INDEX IF NOT EXISTS idx_shipment_status ON shipments(status)",
+        '''
+        CREATE TABLE IF NOT EXISTS cargo_items (
+            id SERIAL PRIMARY KEY,
+            shipment_id INTEGER NOT NULL,
+            item_name TEXT NOT NULL,
+            description TEXT,
+            quantity INTEGER NOT NULL,
+            unit TEXT DEFAULT 'pcs',
+            weight REAL,
+            value REAL,
+            hs_code TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY(shipment_id) REFERENCES shipments(id) ON DELETE CASCADE
+        )
+        ''',
+        "CREATE INDEX IF NOT EXISTS idx_cargo_shipment ON cargo_items(shipment_id)",
+        '''
+        CREATE TABLE IF NOT EXISTS tracking_updates (
+            id SERIAL PRIMARY KEY,
+            shipment_id INTEGER NOT NULL,
+            location TEXT NOT NULL,
+            status TEXT NOT NULL,
+            notes TEXT,
+            update_date TEXT NOT NULL,
+            created_by INTEGER,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY(shipment_id) REFERENCES shipments(id) ON DELETE CASCADE,
+            FOREIGN KEY(created_by) REFERENCES users(id)
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS shipment_documents (
+            id SERIAL PRIMARY KEY,
+            shipment_id INTEGER NOT NULL,
+            document_type TEXT NOT NULL,
+            file_path TEXT NOT NULL,
+            uploaded_by INTEGER,
+            notes TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY(shipment_id) REFERENCES shipments(id) ON DELETE CASCADE,
+            FOREIGN KEY(uploaded_by) REFERENCES users(id)
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS cargo_requests (
+            id SERIAL PRIMARY KEY,
+            cargo_item_id INTEGER NOT NULL,
+            client_id INTEGER NOT NULL,
+            request_type TEXT NOT NULL,
+            reason TEXT,
+            status TEXT DEFAULT 'Pending',
+            employee_response TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY(cargo_item_id) REFERENCES cargo_items(id) ON DELETE CASCADE,
+            FOREIGN KEY(client_id) REFERENCES users(id)
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS messages (
+            id SERIAL PRIMARY KEY,
+            from_user_id INTEGER NOT NULL,
+            to_user_id INTEGER NOT NULL,
+            subject TEXT NOT NULL,
+            content TEXT NOT NULL,
+            shipment_id INTEGER,
+            is_read INTEGER DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY(from_user_id) REFERENCES users(id),
+            FOREIGN KEY(to_user_id) REFERENCES users(id),
+            FOREIGN KEY(shipment_id) REFERENCES shipments(id) ON DELETE SET NULL
+        )
+        ''',
+        "CREATE INDEX IF NOT EXISTS idx_message_from ON messages(from_user_id)",
+        "CREATE INDEX IF NOT EXISTS idx_message_to ON messages(to_user_id)",
+        "CREATE INDEX IF NOT EXISTS idx_message_shipment ON messages(shipment_id)",
+    ], sqlite=[
+        '''
+        CREATE TABLE IF NOT EXISTS company_records (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            employee_name TEXT NOT NULL,
+            department TEXT NOT NULL,
+            position TEXT NOT NULL,
+            salary REAL NOT NULL,
+            hire_date TEXT NOT NULL,
+            email TEXT,
+            phone TEXT,
+            status TEXT DEFAULT 'Active',
+            password TEXT DEFAULT '',
+            created_at TEXT DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            email TEXT UNIQUE NOT NULL,
+            password_hash TEXT NOT NULL,
+            salt TEXT NOT NULL,
+            role TEXT DEFAULT 'user',
+            created_at TEXT DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS leave_requests (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            start_date TEXT NOT NULL,
+            end_date TEXT NOT NULL,
+            reason TEXT,
+            leave_type TEXT DEFAULT 'Other',
+            attachment TEXT DEFAULT '',
+            status TEXT DEFAULT 'Pending',
+            admin_response TEXT DEFAULT '',
+            created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY(user_id) REFERENCES users(id)
+        )
+        ''',
+        _sqlite_add_missing_columns,
+        "CREATE INDEX IF NOT EXISTS idx_department ON company_records(department)",
+        "CREATE INDEX IF NOT EXISTS idx_status ON company_records(status)",
+        "CREATE INDEX IF NOT EXISTS idx_email ON company_records(email)",
+        f'''
+        INSERT INTO company_records (employee_name, department, position, salary, hire_date, email, phone, status)
+        SELECT * FROM (VALUES {_SAMPLE_RECORDS})
+        WHERE NOT EXISTS (SELECT 1 FROM company_records)
+        ''',
+        "CREATE INDEX IF NOT EXISTS idx_user_email ON users(email)",
+        "CREATE INDEX IF NOT EXISTS idx_user_role ON users(role)",
+        "CREATE INDEX IF NOT EXISTS idx_leave_user ON leave_requests(user_id)",
+        "CREATE INDEX IF NOT EXISTS idx_leave_status ON leave_requests(status)",
+        '''
+        CREATE TABLE IF NOT EXISTS shipments (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            shipment_number TEXT UNIQUE NOT NULL,
+            client_id INTEGER NOT NULL,
+            type TEXT NOT NULL,
+            origin_country TEXT,
+            destination_country TEXT,
+            departure_date TEXT,
+            expected_arrival TEXT,
+            actual_arrival TEXT,
+            status TEXT DEFAULT 'Pending',
+            total_weight REAL,
+            total_value REAL,
+            currency TEXT DEFAULT 'USD',
+            customs_cleared INTEGER DEFAULT 0,
+            notes TEXT,
+            created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+            updated_at TEXT DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY(client_id) REFERENCES users(id)
+        )
+        ''',
+        "CREATE INDEX IF NOT EXISTS idx_shipment_client ON shipments(client_id)",
+        "CREATE INDEX IF NOT EXISTS idx_shipment_status ON shipments(status)",
+        '''
+        CREATE TABLE IF NOT EXISTS cargo_items (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            shipment_id INTEGER NOT NULL,
+            item_name TEXT NOT NULL,
+            description TEXT,
+            quantity INTEGER NOT NULL,
+            unit TEXT DEFAULT 'pcs',
+            weight REAL,
+            value REAL,
+            hs_code TEXT,
+            created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY(shipment_id) REFERENCES shipments(id) ON DELETE CASCADE
+        )
+        ''',
+        "CREATE INDEX IF NOT EXISTS idx_cargo_shipment ON cargo_items(shipment_id)",
+        '''
+        CREATE TABLE IF NOT EXISTS tracking_updates (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            shipment_id INTEGER NOT NULL,
+            location TEXT NOT NULL,
+            status TEXT NOT NULL,
+            notes TEXT,
+            update_date TEXT NOT NULL,
+            created_by INTEGER,
+            created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY(shipment_id) REFERENCES shipments(id) ON DELETE CASCADE,
+            FOREIGN KEY(created_by) REFERENCES users(id)
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS shipment_documents (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            shipment_id INTEGER NOT NULL,
+            document_type TEXT NOT NULL,
+            file_path TEXT NOT NULL,
+            uploaded_by INTEGER,
+            notes TEXT,
+            created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY(shipment_id) REFERENCES shipments(id) ON DELETE CASCADE,
+            FOREIGN KEY(uploaded_by) REFERENCES users(id)
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS cargo_requests (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            cargo_item_id INTEGER NOT NULL,
+            client_id INTEGER NOT NULL,
+            request_type TEXT NOT NULL,
+            reason TEXT,
+            status TEXT DEFAULT 'Pending',
+            employee_response TEXT,
+            created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+            updated_at TEXT DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY(cargo_item_id) REFERENCES cargo_items(id) ON DELETE CASCADE,
+            FOREIGN KEY(client_id) REFERENCES users(id)
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS messages (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            from_user_id INTEGER NOT NULL,
+            to_user_id INTEGER NOT NULL,
+            subject TEXT NOT NULL,
+            content TEXT NOT NULL,
+            shipment_id INTEGER,
+            is_read INTEGER DEFAULT 0,
+            created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY(from_user_id) REFERENCES users(id),
+            FOREIGN KEY(to_user_id) REFERENCES users(id),
+            FOREIGN KEY(shipment_id) REFERENCES shipments(id) ON DELETE SET NULL
+        )
+        ''',
+        "CREATE INDEX IF NOT EXISTS idx_message_from ON messages(from_user_id)",
+        "CREATE INDEX IF NOT EXISTS idx_message_to ON messages(to_user_id)",
+        "CREATE INDEX IF NOT EXISTS idx_message_shipment ON messages(shipment_id)",
+    ]),
+    Migration(2, 'dashboard rollups', postgres=[
+        '''
+        CREATE TABLE IF NOT EXISTS department_rollup (
+            department TEXT NOT NULL,
+            status TEXT NOT NULL,
+            employee_count INTEGER NOT NULL DEFAULT 0,
+            salary_sum DOUBLE PRECISION NOT NULL DEFAULT 0,
+            PRIMARY KEY (department, status)
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS shipment_rollup (
+            type TEXT NOT NULL,
+            status TEXT NOT NULL,
+            shipment_count INTEGER NOT NULL DEFAULT 0,
+            value_sum DOUBLE PRECISION NOT NULL DEFAULT 0,
+            PRIMARY KEY (type, status)
+        )
+        ''',
+        '''
+        CREATE OR REPLACE FUNCTION department_rollup_apply() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                UPDATE department_rollup
+                SET employee_count = employee_count - 1, salary_sum = salary_sum - OLD.salary
+                WHERE department = OLD.department AND status = COALESCE(OLD.status, '');
+            END IF;
+            IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                INSERT INTO department_rollup (department, status, employee_count, salary_sum)
+                VALUES (NEW.department, COALESCE(NEW.status, ''), 1, NEW.salary)
+                ON CONFLICT (department, status) DO UPDATE
+                SET employee_count = department_rollup.employee_count + 1,
+                    salary_sum = department_rollup.salary_sum + EXCLUDED.salary_sum;
+            END IF;
+            IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                DELETE FROM department_rollup
+                WHERE department = OLD.department AND status = COALESCE(OLD.status, '')
+                  AND employee_count <= 0;
+            END IF;
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql
+        ''',
+        '''
+        CREATE OR REPLACE FUNCTION shipment_rollup_apply() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                UPDATE shipment_rollup
+                SET shipment_count = shipment_count - 1, value_sum = value_sum - COALESCE(OLD.total_value, 0)
+                WHERE type = OLD.type AND status = COALESCE(OLD.status, '');
+            END IF;
+            IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                INSERT INTO shipment_rollup (type, status, shipment_count, value_sum)
+                VALUES (NEW.type, COALESCE(NEW.status, ''), 1, COALESCE(NEW.total_value, 0))
+                ON CONFLICT (type, status) DO UPDATE
+                SET shipment_count = shipment_rollup.shipment_count + 1,
+                    value_sum = shipment_rollup.value_sum + EXCLUDED.value_sum;
+            END IF;
+            IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                DELETE FROM shipment_rollup
+                WHERE type = OLD.type AND status = COALESCE(OLD.status, '')
+                  AND shipment_count <= 0;
+            END IF;
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql
+        ''',
+        # Hold off writers so the backfill below and the new triggers see the same rows
+        "LOCK TABLE company_records, shipments IN SHARE ROW EXCLUSIVE MODE",
+        "DROP TRIGGER IF EXISTS trg_department_rollup ON company_records",
+        '''
+        CREATE TRIGGER trg_department_rollup
+        AFTER INSERT OR DELETE OR UPDATE OF department, status, salary ON company_records
+        FOR EACH ROW EXECUTE FUNCTION department_rollup_apply()
+        ''',
+        "DROP TRIGGER IF EXISTS trg_shipment_rollup ON shipments",
+        '''
+        CREATE TRIGGER trg_shipment_rollup
+        AFTER INSERT OR DELETE OR UPDATE OF type, status, total_value ON shipments
+        FOR EACH ROW EXECUTE FUNCTION shipment_rollup_apply()
+        ''',
+        "DELETE FROM department_rollup",
+        '''
+        INSERT INTO department_rollup (department, status, employee_count, salary_sum)
+        SELECT department, COALESCE(status, ''), COUNT(*), COALESCE(SUM(salary), 0)
+        FROM company_records
+        GROUP BY department, COALESCE(status, '')
+        ''',
+        "DELETE FROM shipment_rollup",
+        '''
+        INSERT INTO shipment_rollup (type, status, shipment_count, value_sum)
+        SELECT type, COALESCE(status, ''), COUNT(*), COALESCE(SUM(total_value), 0)
+        FROM shipments
+        GROUP BY type, COALESCE(status, '')
+        ''',
+    ], sqlite=[
+        '''
+        CREATE TABLE IF NOT EXISTS department_rollup (
+            department TEXT NOT NULL,
+            status TEXT NOT NULL,
+            employee_count INTEGER NOT NULL DEFAULT 0,
+            salary_sum REAL NOT NULL DEFAULT 0,
+            PRIMARY KEY (department, status)
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS shipment_rollup (
+            type TEXT NOT NULL,
+            status TEXT NOT NULL,
+            shipment_count INTEGER NOT NULL DEFAULT 0,
+            value_sum REAL NOT NULL DEFAULT 0,
+            PRIMARY KEY (type, status)
+        )
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_department_rollup_insert
+        AFTER INSERT ON company_records
+        BEGIN
+            INSERT INTO department_rollup (department, status, employee_count, salary_sum)
+            VALUES (NEW.department, COALESCE(NEW.status, ''), 1, NEW.salary)
+            ON CONFLICT (department, status) DO UPDATE
+            SET employee_count = employee_count + 1, salary_sum = salary_sum + excluded.salary_sum;
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_department_rollup_update
+        AFTER UPDATE OF department, status, salary ON company_records
+        BEGIN
+            UPDATE department_rollup
+            SET employee_count = employee_count - 1, salary_sum = salary_sum - OLD.salary
+            WHERE department = OLD.department AND status = COALESCE(OLD.status, '');
+            INSERT INTO department_rollup (department, status, employee_count, salary_sum)
+            VALUES (NEW.department, COALESCE(NEW.status, ''), 1, NEW.salary)
+            ON CONFLICT (department, status) DO UPDATE
+            SET employee_count = employee_count + 1, salary_sum = salary_sum + excluded.salary_sum;
+            DELETE FROM department_rollup
+            WHERE department = OLD.department AND status = COALESCE(OLD.status, '')
+              AND employee_count <= 0;
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_department_rollup_delete
+        AFTER DELETE ON company_records
+        BEGIN
+            UPDATE department_rollup
+            SET employee_count = employee_count - 1, salary_sum = salary_sum - OLD.salary
+            WHERE department = OLD.department AND status = COALESCE(OLD.status, '');
+            DELETE FROM department_rollup
+            WHERE department = OLD.department AND status = COALESCE(OLD.status, '')
+              AND employee_count <= 0;
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_shipment_rollup_insert
+        AFTER INSERT ON shipments
+        BEGIN
+            INSERT INTO shipment_rollup (type, status, shipment_count, value_sum)
+            VALUES (NEW.type, COALESCE(NEW.status, ''), 1, COALESCE(NEW.total_value, 0))
+            ON CONFLICT (type, status) DO UPDATE
+            SET shipment_count = shipment_count + 1, value_sum = value_sum + excluded.value_sum;
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_shipment_rollup_update
+        AFTER UPDATE OF type, status, total_value ON shipments
+        BEGIN
+            UPDATE shipment_rollup
+            SET shipment_count = shipment_count - 1, value_sum = value_sum - COALESCE(OLD.total_value, 0)
+            WHERE type = OLD.type AND status = COALESCE(OLD.status, '');
+            INSERT INTO shipment_rollup (type, status, shipment_count, value_sum)
+            VALUES (NEW.type, COALESCE(NEW.status, ''), 1, COALESCE(NEW.total_value, 0))
+            ON CONFLICT (type, status) DO UPDATE
+            SET shipment_count = shipment_count + 1, value_sum = value_sum + excluded.value_sum;
+            DELETE FROM shipment_rollup
+            WHERE type = OLD.type AND status = COALESCE(OLD.status, '')
+              AND shipment_count <= 0;
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_shipment_rollup_delete
+        AFTER DELETE ON shipments
+        BEGIN
+            UPDATE shipment_rollup
+            SET shipment_count = shipment_count - 1, value_sum = value_sum - COALESCE(OLD.total_value, 0)
+            WHERE type = OLD.type AND status = COALESCE(OLD.status, '');
+            DELETE FROM shipment_rollup
+            WHERE type = OLD.type AND status = COALESCE(OLD.status, '')
+              AND shipment_count <= 0;
+        END
+        ''',
+        "DELETE FROM department_rollup",
+        '''
+        INSERT INTO department_rollup (department, status, employee_count, salary_sum)
+        SELECT department, COALESCE(status, ''), COUNT(*), COALESCE(SUM(salary), 0)
+        FROM company_records
+        GROUP BY department, COALESCE(status, '')
+        ''',
+        "DELETE FROM shipment_rollup",
+        '''
+        INSERT INTO shipment_rollup (type, status, shipment_count, value_sum)
+        SELECT type, COALESCE(status, ''), COUNT(*), COALESCE(SUM(total_value), 0)
+        FROM shipments
+        GROUP BY type, COALESCE(status, '')
+        ''',
+    ]),
+    # (department, id) and (status, id) serve both the equality filter and the
+    # keyset ORDER BY id DESC, so a filtered page is an index range scan with no
+    # sort. They start with the same column as idx_department/idx_status, which
+    # are dropped as redundant.
+    Migration(3, 'record filter indexes', postgres=[
+        "CREATE INDEX IF NOT EXISTS idx_records_department_id ON company_records(department, id)",
+        "CREATE INDEX IF NOT EXISTS idx_records_status_id ON company_records(status, id)",
+        "DROP INDEX IF EXISTS idx_department",
+        "DROP INDEX IF EXISTS idx_status",
+    ], sqlite=[
+        "CREATE INDEX IF NOT EXISTS idx_records_department_id ON company_records(department, id)",
+        "CREATE INDEX IF NOT EXISTS idx_records_status_id ON company_records(status, id)",
+        "DROP INDEX IF EXISTS idx_department",
+        "DROP INDEX IF EXISTS idx_status",
+    ]),
+    Migration(4, 'record search index', postgres=[
+        "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+        f"CREATE INDEX IF NOT EXISTS idx_records_search_trgm ON company_records USING gin (({RECORD_SEARCH_EXPRESSION}) gin_trgm_ops)",
+    ], sqlite=[
+        # External-content FTS5 table: stores only the trigram index, rows stay in company_records
+        '''
+        CREATE VIRTUAL TABLE IF NOT EXISTS company_records_fts USING fts5(
+            employee_name, department, position, email,
+            content='company_records', content_rowid='id', tokenize='trigram'
+        )
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_records_fts_insert
+        AFTER INSERT ON company_records
+        BEGIN
+            INSERT INTO company_records_fts (rowid, employee_name, department, position, email)
+            VALUES (NEW.id, NEW.employee_name, NEW.department, NEW.position, NEW.email);
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_records_fts_update
+        AFTER UPDATE OF employee_name, department, position, email ON company_records
+        BEGIN
+            INSERT INTO company_records_fts (company_records_fts, rowid, employee_name, department, position, email)
+            VALUES ('delete', OLD.id, OLD.employee_name, OLD.department, OLD.position, OLD.email);
+            INSERT INTO company_records_fts (rowid, employee_name, department, position, email)
+            VALUES (NEW.id, NEW.employee_name, NEW.department, NEW.position, NEW.email);
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_records_fts_delete
+        AFTER DELETE ON company_records
+        BEGIN
+            INSERT INTO company_records_fts (company_records_fts, rowid, employee_name, department, position, email)
+            VALUES ('delete', OLD.id, OLD.employee_name, OLD.department, OLD.position, OLD.email);
+        END
+        ''',
+        "INSERT INTO company_records_fts (company_records_fts) VALUES ('rebuild')",
+    ]),
+    Migration(5, 'table versions', postgres=[
+        '''
+        CREATE TABLE IF NOT EXISTS table_versions (
+            table_name TEXT PRIMARY KEY,
+            version BIGINT NOT NULL DEFAULT 0
+        )
+        ''',
+        f'''
+        INSERT INTO table_versions (table_name)
+        SELECT unnest(ARRAY[{', '.join(repr(t) for t in VERSIONED_TABLES)}])
+        ON CONFLICT (table_name) DO NOTHING
+        ''',
+        f'''
+        CREATE OR REPLACE FUNCTION bump_table_version() RETURNS trigger AS $$
+        DECLARE
+            new_version BIGINT;
+        BEGIN
+            UPDATE table_versions SET version = version + 1
+            WHERE table_name = TG_TABLE_NAME
+            RETURNING version INTO new_version;
+            -- Delivered to listeners only if the writing transaction commits
+            PERFORM pg_notify('{TABLE_VERSION_CHANNEL}', TG_TABLE_NAME || ':' || new_version);
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql
+        ''',
+    ] + [
+        statement
+        for table in VERSIONED_TABLES
+        for statement in (
+            f"DROP TRIGGER IF EXISTS trg_{table}_version ON {table}",
+            f'''
+            CREATE TRIGGER trg_{table}_version
+            AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON {table}
+            FOR EACH STATEMENT EXECUTE FUNCTION bump_table_version()
+            ''',
+        )
+    ], sqlite=[
+        '''
+        CREATE TABLE IF NOT EXISTS table_versions (
+            table_name TEXT PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0
+        )
+        ''',
+        f'''
+        INSERT OR IGNORE INTO table_versions (table_name)
+        VALUES {', '.join(f"('{t}')" for t in VERSIONED_TABLES)}
+        ''',
+    ] + [
+        # SQLite has no statement-level triggers, so every changed row bumps the version
+        f'''
+        CREATE TRIGGER IF NOT EXISTS trg_{table}_version_{event.lower()}
+        AFTER {event} ON {table}
+        BEGIN
+            UPDATE table_versions SET version = version + 1 WHERE table_name = '{table}';
+        END
+        '''
+        for table in VERSIONED_TABLES
+        for event in ('INSERT', 'UPDATE', 'DELETE')
+    ]),
+    Migration(6, 'record change tracking', postgres=[
+        "ALTER TABLE company_records ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP",
+        "UPDATE company_records SET updated_at = COALESCE(created_at, CURRENT_TIMESTAMP) WHERE updated_at IS NULL",
+        "ALTER TABLE company_records ALTER COLUMN updated_at SET DEFAULT CURRENT_TIMESTAMP",
+        "ALTER TABLE company_records ALTER COLUMN updated_at SET NOT NULL",
+        "CREATE INDEX IF NOT EXISTS idx_records_updated_at ON company_records(updated_at)",
+        '''
+        CREATE OR REPLACE FUNCTION touch_updated_at() RETURNS trigger AS $$
+        BEGIN
+            -- clock_timestamp() rather than now() keeps the stamp close to commit time
+            NEW.updated_at = clock_timestamp();
+            RETURN NEW;
+        END
+        $$ LANGUAGE plpgsql
+        ''',
+        "DROP TRIGGER IF EXISTS trg_records_touch ON company_records",
+        '''
+        CREATE TRIGGER trg_records_touch
+        BEFORE UPDATE ON company_records
+        FOR EACH ROW EXECUTE FUNCTION touch_updated_at()
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS deleted_rows (
+            id BIGSERIAL PRIMARY KEY,
+            table_name TEXT NOT NULL,
+            row_id BIGINT NOT NULL,
+            deleted_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        "CREATE INDEX IF NOT EXISTS idx_deleted_rows_table_time ON deleted_rows(table_name, deleted_at)",
+        '''
+        CREATE OR REPLACE FUNCTION record_tombstone() RETURNS trigger AS $$
+        BEGIN
+            INSERT INTO deleted_rows (table_name, row_id, deleted_at)
+            VALUES (TG_TABLE_NAME, OLD.id, clock_timestamp());
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql
+        ''',
+        f'''
+        CREATE OR REPLACE FUNCTION prune_tombstones() RETURNS trigger AS $$
+        BEGIN
+            DELETE FROM deleted_rows
+            WHERE table_name = TG_TABLE_NAME
+              AND deleted_at < now() - interval '{TOMBSTONE_RETENTION_DAYS} days';
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql
+        ''',
+        "DROP TRIGGER IF EXISTS trg_records_tombstone ON company_records",
+        '''
+        CREATE TRIGGER trg_records_tombstone
+        AFTER DELETE ON company_records
+        FOR EACH ROW EXECUTE FUNCTION record_tombstone()
+        ''',
+        "DROP TRIGGER IF EXISTS trg_records_tombstone_prune ON company_records",
+        '''
+        CREATE TRIGGER trg_records_tombstone_prune
+        AFTER DELETE ON company_records
+        FOR EACH STATEMENT EXECUTE FUNCTION prune_tombstones()
+        ''',
+    ], sqlite=[
+        _sqlite_add_updated_at,
+        "UPDATE company_records SET updated_at = COALESCE(created_at, CURRENT_TIMESTAMP) WHERE updated_at IS NULL",
+        "CREATE INDEX IF NOT EXISTS idx_records_updated_at ON company_records(updated_at)",
+        # ADD COLUMN cannot take a CURRENT_TIMESTAMP default, so inserts are stamped here
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_records_stamp_insert
+        AFTER INSERT ON company_records
+        WHEN NEW.updated_at IS NULL
+        BEGIN
+            UPDATE company_records SET updated_at = COALESCE(NEW.created_at, CURRENT_TIMESTAMP) WHERE id = NEW.id;
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_records_touch
+        AFTER UPDATE OF employee_name, department, position, salary, hire_date, email, phone, status, password
+        ON company_records
+        BEGIN
+            UPDATE company_records SET updated_at = CURRENT_TIMESTAMP WHERE id = NEW.id;
+        END
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS deleted_rows (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            table_name TEXT NOT NULL,
+            row_id INTEGER NOT NULL,
+            deleted_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        "CREATE INDEX IF NOT EXISTS idx_deleted_rows_table_time ON deleted_rows(table_name, deleted_at)",
+        f'''
+        CREATE TRIGGER IF NOT EXISTS trg_records_tombstone
+        AFTER DELETE ON company_records
+        BEGIN
+            INSERT INTO deleted_rows (table_name, row_id) VALUES ('company_records', OLD.id);
+            DELETE FROM deleted_rows
+            WHERE table_name = 'company_records'
+              AND deleted_at < datetime('now', '-{TOMBSTONE_RETENTION_DAYS} days');
+        END
+        ''',
+    ]),
+    Migration(7, 'export jobs', postgres=[
+        '''
+        CREATE TABLE IF NOT EXISTS export_jobs (
+            id SERIAL PRIMARY KEY,
+            request_hash TEXT NOT NULL,
+            export_format TEXT NOT NULL,
+            export_names TEXT NOT NULL,
+            requested_by INTEGER REFERENCES users(id) ON DELETE SET NULL,
+            status TEXT NOT NULL DEFAULT 'queued',
+            progress REAL NOT NULL DEFAULT 0,
+            detail TEXT DEFAULT '',
+            file_path TEXT,
+            error TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            heartbeat_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            finished_at TIMESTAMP,
+            expires_at TIMESTAMP
+        )
+        ''',
+        # At most one queued or running job per request; identical requests join it
+        '''
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_export_jobs_active
+        ON export_jobs(request_hash) WHERE status IN ('queued', 'running')
+        ''',
+        "CREATE INDEX IF NOT EXISTS idx_export_jobs_expiry ON export_jobs(expires_at) WHERE status = 'done'",
+    ], sqlite=[
+        '''
+        CREATE TABLE IF NOT EXISTS export_jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            request_hash TEXT NOT NULL,
+            export_format TEXT NOT NULL,
+            export_names TEXT NOT NULL,
+            requested_by INTEGER REFERENCES users(id) ON DELETE SET NULL,
+            status TEXT NOT NULL DEFAULT 'queued',
+            progress REAL NOT NULL DEFAULT 0,
+            detail TEXT DEFAULT '',
+            file_path TEXT,
+            error TEXT,
+            created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+            heartbeat_at TEXT DEFAULT CURRENT_TIMESTAMP,
+            finished_at TEXT,
+            expires_at TEXT
+        )
+        ''',
+        '''
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_export_jobs_active
+        ON export_jobs(request_hash) WHERE status IN ('queued', 'running')
+        ''',
+        "CREATE INDEX IF NOT EXISTS idx_export_jobs_expiry ON export_jobs(expires_at) WHERE status = 'done'",
+    ]),
+]
+
+LATEST_VERSION = MIGRATIONS[-1].version
+
+
+def current_version(conn):
+    """Highest applied migration, or 0 when schema_migrations does not exist yet"""
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT COALESCE(MAX(version), 0) FROM schema_migrations")
+        return cursor.fetchone()[0]
+    except Exception:
+        conn.rollback()
+        return 0
+    finally:
+        cursor.close()
+
+
+def migrate(conn, backend):
+    """Apply pending migrations on conn; returns how many were applied.
+
+    The common case - an up-to-date database - costs one SELECT. Otherwise the
+    work runs under a Postgres advisory lock (one transaction per migration) or
+    a single SQLite write transaction, so processes starting together apply
+    each migration once.
+    """
+    if current_version(conn) >= LATEST_VERSION:
+        return 0
+
+    param = '%s' if backend == POSTGRES else '?'
+    cursor = conn.cursor()
+    try:
+        if backend == POSTGRES:
+            cursor.execute("SELECT pg_advisory_lock(%s)", (ADVISORY_LOCK_KEY,))
+        else:
+            cursor.execute("BEGIN IMMEDIATE")
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS schema_migrations (
+                version INTEGER PRIMARY KEY,
+                name TEXT NOT NULL,
+                checksum TEXT NOT NULL,
+                applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        cursor.execute("SELECT version, checksum FROM schema_migrations")
+        applied = dict(cursor.fetchall())
+        if backend == POSTGRES:
+            conn.commit()
+
+        for version, checksum in applied.items():
+            known = next((m for m in MIGRATIONS if m.version == version), None)
+            if known is None or known.checksum(backend) == checksum:
+                continue
+            if checksum == known.checksum(backend, by_name=True):
+                cursor.execute(
+                    f"UPDATE schema_migrations SET checksum = {param} WHERE version = {param}",
+                    (known.checksum(backend), version)
+                )
+            else:
+                raise MigrationError(
+                    f"Migration {version} ({known.name}) was changed after it was applied; "
+                    "add a new migration instead of editing a released one"
+                )
+
+        count = 0
+        for migration in MIGRATIONS:
+            if migration.version in applied:
+                continue
+            for statement in migration.statements[backend]:
+                if isinstance(statement, str):
+                    cursor.execute(statement)
+                else:
+                    statement(cursor)
+            cursor.execute(
+                f"INSERT INTO schema_migrations (version, name, checksum) VALUES ({param}, {param}, {param})",
+                (migration.version, migration.name, migration.checksum(backend))
+            )
+            if backend == POSTGRES:
+                conn.commit()
+            count += 1
+        # SQLite applies everything inside the single BEGIN IMMEDIATE taken above
+        conn.commit()
+        return count
+    except BaseException:
+        conn.rollback()
+        raise
+    finally:
+        if backend == POSTGRES:
+            cursor.execute("SELECT pg_advisory_unlock(%s)", (ADVISORY_LOCK_KEY,))
+            conn.commit()
+        cursor.close()
@@ -0,0 +1,234 @@
+"""Per-method metrics for the database layer.
+
+instrument() wraps every public method of a Database class so each call records
+its latency, the rows it returned and how long it waited for a pooled
+connection, keyed by method name. Only the outermost call is recorded: when
+add_cargo_items_bulk runs save_cargo_items, the time counts once, against
+add_cargo_items_bulk. Latencies go into fixed buckets, so memory stays constant
+however many calls are made and percentiles are estimated from the buckets.
+
+Calls slower than the threshold are logged as warnings, which App.py's logging
+setup writes to eims_app.log. Metrics are per process; every replica keeps its own.
+"""
+import functools
+import inspect
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds of the latency buckets in seconds; one more bucket catches everything slower
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_local = threading.local()
+
+
+class _MethodStats:
+    __slots__ = ('calls', 'errors', 'slow', 'rows', 'seconds', 'max_seconds', 'pool_wait', 'max_pool_wait', 'buckets')
+
+    def __init__(self, bucket_count):
+        self.calls = self.errors = self.slow = self.rows = 0
+        self.seconds = self.max_seconds = self.pool_wait = self.max_pool_wait = 0.0
+        self.buckets = [0] * bucket_count
+
+
+class QueryMetrics:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.bucket_bounds = tuple(buckets)
+        self._lock = threading.Lock()
+        self._methods = {}
+        self._checkouts = 0
+        self._checkout_wait = 0.0
+
+    def record(self, name, seconds, rows, pool_wait, error=False, slow=False):
+        index = next((i for i, bound in enumerate(self.bucket_bounds) if seconds <= bound), len(self.bucket_bounds))
+        with self._lock:
+            stats = self._methods.get(name)
+            if stats is None:
+                stats = self._methods[name] = _MethodStats(len(self.bucket_bounds) + 1)
+            stats.calls += 1
+            stats.errors += error
+            stats.slow += slow
+            stats.rows += rows
+            stats.seconds += seconds
+            stats.max_seconds = max(stats.max_seconds, seconds)
+            stats.pool_wait += pool_wait
+            stats.max_pool_wait = max(stats.max_pool_wait, pool_wait)
+            stats.buckets[index] += 1
+
+    def record_checkout(self, seconds):
+        """Count one pool checkout, whichever code path made it"""
+        with self._lock:
+            self._checkouts += 1
+            self._checkout_wait += seconds
+
+    def snapshot(self):
+        """One dict per method, slowest total first, plus pool checkout totals.
+
+        Returns {'methods': [...], 'checkouts': n, 'checkout_wait_seconds': s}.
+        Each method dict has calls, errors, slow, rows, the latency sum, mean,
+        p50/p95/p99 and max in milliseconds, pool wait totals, and the raw
+        per-bucket counts (not cumulative) matching bucket_bounds.
+        """
+        with self._lock:
+            methods = {name: (stats.calls, stats.errors, stats.slow, stats.rows, stats.seconds, stats.max_seconds,
+                              stats.pool_wait, stats.max_pool_wait, list(stats.buckets))
+                       for name, stats in self._methods.items()}
+            checkouts, checkout_wait = self._checkouts, self._checkout_wait
+
+        rows = []
+        for name, (calls, errors, slow, row_count, seconds, max_seconds, pool_wait, max_pool_wait, buckets) in methods.items():
+            rows.append({
+                'method': name,
+                'calls': calls,
+                'errors': errors,
+                'slow': slow,
+                'rows': row_count,
+                'total_ms': seconds * 1000,
+                'mean_ms': seconds * 1000 / calls,
+                'p50_ms': self._percentile(buckets, 0.50, max_seconds) * 1000,
+                'p95_ms': self._percentile(buckets, 0.95, max_seconds) * 1000,
+                'p99_ms': self._percentile(buckets, 0.99, max_seconds) * 1000,
+                'max_ms': max_seconds * 1000,
+                'pool_wait_ms': pool_wait * 1000,
+                'max_pool_wait_ms': max_pool_wait * 1000,
+                'buckets': buckets,
+            })
+        rows.sort(key=lambda row: row['total_ms'], reverse=True)
+        return {'methods': rows, 'checkouts': checkouts, 'checkout_wait_seconds': checkout_wait}
+
+    def reset(self):
+        with self._lock:
+            self._methods.clear()
+            self._checkouts = 0
+            self._checkout_wait = 0.0
+
+    def _percentile(self, buckets, quantile, max_seconds):
+        # Interpolate inside the bucket holding the quantile; never report more than was observed
+        rank = quantile * sum(buckets)
+        seen = 0
+        for i, count in enumerate(buckets):
+            if count and seen + count >= rank:
+                if i == len(self.bucket_bounds):
+                    return max_seconds
+                lower = self.bucket_bounds[i - 1] if i else 0.0
+                estimate = lower + (self.bucket_bounds[i] - lower) * (rank - seen) / count
+                return min(estimate, max_seconds)
+            seen += count
+        return 0.0
+
+
+METRICS = QueryMetrics()
+
+
+def add_pool_wait(seconds, metrics=METRICS):
+    """Report time spent checking out a pooled connection.
+
+    Called by the pool itself, so it also covers pandas reads that go through
+    the engine; the wait is charged to the method running on this thread.
+    """
+    metrics.record_checkout(seconds)
+    if getattr(_local, 'depth', 0):
+        _local.pool_wait += seconds
+
+
+def instrument(metrics=METRICS, slow_ms=500.0, exclude=()):
+    """Class decorator recording metrics for every public method not in exclude.
+
+    classmethods and staticmethods are left alone; generator methods are timed
+    while they produce items, not while the caller consumes them.
+    """
+    def decorate(cls):
+        for name, attr in list(vars(cls).items()):
+            if name.startswith('_') or name in exclude or not inspect.isfunction(attr):
+                continue
+            wrap = _wrap_generator if inspect.isgeneratorfunction(attr) else _wrap_function
+            setattr(cls, name, wrap(name, attr, metrics, slow_ms / 1000))
+        return cls
+    return decorate
+
+
+def _wrap_function(name, func, metrics, slow_seconds):
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if getattr(_local, 'depth', 0):
+            return func(*args, **kwargs)
+        _local.depth = 1
+        _local.pool_wait = 0.0
+        result = None
+        error = False
+        started = time.perf_counter()
+        try:
+            result = func(*args, **kwargs)
+            return result
+        except Exception:
+            error = True
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            _local.depth = 0
+            _finish(metrics, name, elapsed, _row_count(result), _local.pool_wait, error, slow_seconds)
+    return wrapper
+
+
+def _wrap_generator(name, func, metrics, slow_seconds):
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        generator = func(*args, **kwargs)
+        if getattr(_local, 'depth', 0):
+            return generator
+        return _timed(generator, name, metrics, slow_seconds)
+    return wrapper
+
+
+def _timed(generator, name, metrics, slow_seconds):
+    """Yield from generator, timing only the work done inside it; each item counts as one row"""
+    elapsed = pool_wait = 0.0
+    items = 0
+    error = False
+    try:
+        while True:
+            _local.depth = 1
+            _local.pool_wait = 0.0
+            started = time.perf_counter()
+            try:
+                item = next(generator)
+            except StopIteration:
+                break
+            except Exception:
+                error = True
+                raise
+            finally:
+                elapsed += time.perf_counter() - started
+                pool_wait += _local.pool_wait
+                _local.depth = 0
+            items += 1
+            yield item
+    finally:
+        # Closing early (the consumer stopped iterating) still releases the generator's connection
+        generator.close()
+        _finish(metrics, name, elapsed, items, pool_wait, error, slow_seconds)
+
+
+def _finish(metrics, name, elapsed, rows, pool_wait, error, slow_seconds):
+    slow = elapsed >= slow_seconds
+    metrics.record(name, elapsed, rows, pool_wait, error=error, slow=slow)
+    if slow:
+        logger.warning(
+            f"Slow database call {name}: {elapsed * 1000:.0f} ms, {rows} row(s), "
+            f"{pool_wait * 1000:.0f} ms waiting for a connection{' (failed)' if error else ''}"
+        )
+
+
+def _row_count(result):
+    """Rows in a method's result: a frame or list counts its length, a (frame, cursor)
+    page its frame, a dict of frames their total, a single row dict one"""
+    if isinstance(result, tuple) and result and hasattr(result[0], 'columns'):
+        result = result[0]
+    if hasattr(result, 'columns') or isinstance(result, list):
+        return len(result)
+    if isinstance(result, dict):
+        frames = [value for value in result.values() if hasattr(value, 'columns')]
+        return sum(len(frame) for frame in frames) if frames else 1
+    return 0
@@ -0,0 +1,200 @@
+"""Per-phase timing of App.py reruns.
+
+Streamlit runs App.py top to bottom on every interaction. start() begins timing
+a rerun, phase() marks where the next phase begins (imports, database, caches,
+admin_user, sidebar, page) and finish() closes it at the end of the script.
+App.py's _safe_rerun() and _stop() finish the rerun as 'rerun' or 'stopped'
+before leaving early. Any other rerun that never reached finish(), cut short
+by a direct st.rerun() or an exception, is abandoned as 'interrupted' when the
+session's next rerun starts, with the times it reached before ending.
+
+Timings are cheap and always aggregated per page key, for the DB Metrics page.
+Set EIMS_PROFILE=1, or open the app with ?profile=1 for one session, to also
+log every rerun as a JSON line to eims_app.log. With EIMS_PROFILE=cprofile (or
+?profile=cprofile) the slowest reruns of each page are also saved as cProfile
+stats under EIMS_PROFILE_DIR; open them with pstats, snakeviz, or flameprof for
+a flame graph. Only one rerun in the process is run under cProfile at a time.
+"""
+import cProfile
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+
+import streamlit as st
+
+logger = logging.getLogger(__name__)
+
+PROFILE_MODE = os.getenv('EIMS_PROFILE', '').strip().lower()
+PROFILE_DIR = os.getenv('EIMS_PROFILE_DIR', 'profiles')
+
+# cProfile dumps kept per page; a rerun only replaces the fastest of them
+KEEP_SLOWEST = 3
+
+# Upper bounds of the rerun duration buckets in seconds; one more bucket catches everything slower
+RERUN_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_OFF = ('', '0', 'false', 'off', 'no')
+
+_lock = threading.Lock()
+_pages = {}
+_slowest = {}
+_cprofile_lock = threading.Lock()
+
+
+class RerunProfile:
+    def __init__(self, session_id, log, use_cprofile):
+        self.session_id = session_id
+        self.log = log
+        self.page = ''
+        self.phases = {}
+        self.finished = False
+        self.started = self._phase_started = time.perf_counter()
+        self._phase = 'imports'
+        self._profiler = None
+        if use_cprofile and _cprofile_lock.acquire(blocking=False):
+            profiler = cProfile.Profile()
+            try:
+                profiler.enable()
+                self._profiler = profiler
+            except ValueError:
+                # Another profiler (a debugger, or cProfile on 3.12+) is already active
+                _cprofile_lock.release()
+
+    def phase(self, name):
+        """End the current phase and start timing name"""
+        now = time.perf_counter()
+        self._close_phase(now)
+        self._phase, self._phase_started = name, now
+
+    def finish(self, status='complete'):
+        """Close the rerun; later calls do nothing"""
+        self._finish(status, time.perf_counter())
+
+    def abandon(self):
+        """Close a rerun that never reached finish(), counting only the phases it completed"""
+        self._finish('interrupted', self._phase_started)
+
+    def _close_phase(self, now):
+        self.phases[self._phase] = self.phases.get(self._phase, 0.0) + now - self._phase_started
+
+    def _finish(self, status, now):
+        if self.finished:
+            return
+        self.finished = True
+        if self._profiler is not None:
+            self._profiler.disable()
+            _cprofile_lock.release()
+        self._close_phase(now)
+        seconds = now - self.started
+        page = self.page or 'unknown'
+        _record(page, status, seconds, self.phases)
+
+        dump_path = None
+        if self._profiler is not None:
+            try:
+                dump_path = _dump(self._profiler, page, self.session_id, seconds)
+            except OSError as e:
+                logger.warning(f"Could not save the profile of a {page} rerun: {e}")
+        if self.log:
+            logger.info(json.dumps({
+                'event': 'rerun',
+                'session': self.session_id,
+                'page': page,
+                'status': status,
+                'total_ms': round(seconds * 1000, 1),
+                'phases_ms': {name: round(value * 1000, 1) for name, value in self.phases.items()},
+                'profile': dump_path,
+            }))
+
+
+def start():
+    """Begin timing this rerun; call at the top of App.py, before its other imports.
+
+    Returns the RerunProfile for App.py to mark phases on and finish.
+    """
+    state = st.session_state
+    previous = state.get('_rerun_profile')
+    if previous is not None and not previous.finished:
+        previous.abandon()
+
+    requested = st.query_params.get('profile')
+    if requested is not None:
+        state['_profile_mode'] = requested.strip().lower()
+    mode = state.get('_profile_mode', PROFILE_MODE)
+    if '_profile_session' not in state:
+        state['_profile_session'] = uuid.uuid4().hex[:8]
+
+    profile = RerunProfile(state['_profile_session'], log=mode not in _OFF, use_cprofile=mode == 'cprofile')
+    state['_rerun_profile'] = profile
+    return profile
+
+
+def snapshot():
+    """One dict per page key, slowest total first: rerun counts by status, total,
+    mean and max milliseconds, mean milliseconds per phase, and the raw per-bucket
+    counts (not cumulative) matching RERUN_BUCKETS"""
+    with _lock:
+        pages = {page: dict(stats, statuses=dict(stats['statuses']), phases=dict(stats['phases']),
+                            buckets=list(stats['buckets']))
+                 for page, stats in _pages.items()}
+    rows = []
+    for page, stats in pages.items():
+        reruns = stats['reruns']
+        rows.append({
+            'page': page,
+            'reruns': reruns,
+            'statuses': stats['statuses'],
+            'total_ms': stats['seconds'] * 1000,
+            'mean_ms': stats['seconds'] * 1000 / reruns,
+            'max_ms': stats['max_seconds'] * 1000,
+            'phases_mean_ms': {name: value * 1000 / reruns for name, value in stats['phases'].items()},
+            'buckets': stats['buckets'],
+        })
+    rows.sort(key=lambda row: row['total_ms'], reverse=True)
+    return rows
+
+
+def reset():
+    with _lock:
+        _pages.clear()
+
+
+def _record(page, status, seconds, phases):
+    index = next((i for i, bound in enumerate(RERUN_BUCKETS) if seconds <= bound), len(RERUN_BUCKETS))
+    with _lock:
+        stats = _pages.get(page)
+        if stats is None:
+            stats = _pages[page] = {'reruns': 0, 'statuses': {}, 'seconds': 0.0, 'max_seconds': 0.0,
+                                    'phases': {}, 'buckets': [0] * (len(RERUN_BUCKETS) + 1)}
+        stats['reruns'] += 1
+        stats['statuses'][status] = stats['statuses'].get(status, 0) + 1
+        stats['seconds'] += seconds
+        stats['max_seconds'] = max(stats['max_seconds'], seconds)
+        for name, value in phases.items():
+            stats['phases'][name] = stats['phases'].get(name, 0.0) + value
+        stats['buckets'][index] += 1
+
+
+def _dump(profiler, page, session_id, seconds):
+    """Save the stats if this is one of the page's KEEP_SLOWEST reruns; returns the path or None"""
+    with _lock:
+        slowest = _slowest.setdefault(page, [])
+        if len(slowest) >= KEEP_SLOWEST and seconds <= slowest[-1][0]:
+            return None
+        path = os.path.join(PROFILE_DIR, f"{page}_{time.strftime('%Y%m%d-%H%M%S')}_{session_id}_{seconds * 1000:.0f}ms.prof")
+        slowest.append((seconds, path))
+        slowest.sort(reverse=True)
+        dropped = slowest[KEEP_SLOWEST:]
+        del slowest[KEEP_SLOWEST:]
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    profiler.dump_stats(path)
+    for _, old_path in dropped:
+        try:
+            os.remove(old_path)
+        except FileNotFoundError:
+            pass
+    return path
+
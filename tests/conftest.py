@@ -0,0 +1,14 @@
+import os
+import sys
+
+import pytest
+
+# The app modules live flat in the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def sqlite_db(tmp_path):
+    """A migrated SQLite Database in a fresh file"""
+    from database import Database
+    return Database(str(tmp_path / 'company_data.db'))
@@ -0,0 +1,51 @@
+import pandas as pd
+
+import bulk_import
+
+
+def _import(db, target, **columns):
+    rows, errors = bulk_import.validate(pd.DataFrame(columns, dtype=object), target)
+    return rows, errors, (db.import_rows(target, rows) if len(rows) else None)
+
+
+def _client_shipment(db, number='SHP-1', weight=0, value=0):
+    db.create_user('client@example.com', 'hash', 'salt', role='client')
+    client_id = db.get_user_by_email('client@example.com')['id']
+    db.create_shipment(number, client_id, 'Import', 'China', 'Turkey', '2024-01-01', '2024-02-01', weight, value)
+    return db.get_shipment_by_number(number)
+
+
+def test_shipment_import_requires_dates_and_defaults_totals(sqlite_db):
+    _client_shipment(sqlite_db)
+    rows, errors, result = _import(
+        sqlite_db, 'shipments',
+        shipment_number=['SHP-2', 'SHP-3'], client_email=['client@example.com'] * 2, type=['Export'] * 2,
+        departure_date=['2024-03-01', ''], expected_arrival=['2024-04-01', '2024-04-01'],
+    )
+
+    assert errors.to_dict('records') == [{'row': 3, 'error': 'departure_date is required'}]
+    assert result['inserted'] == 1
+    shipment = sqlite_db.get_shipment_by_number('SHP-2')
+    assert shipment['total_weight'] == 0 and shipment['total_value'] == 0
+
+
+def test_cargo_import_recomputes_shipment_totals(sqlite_db):
+    first = _client_shipment(sqlite_db, 'SHP-1')
+    sqlite_db.create_shipment('SHP-2', first['client_id'], 'Export', 'Turkey', 'Egypt', '2024-01-01', '2024-02-01', 0, 0)
+    second = sqlite_db.get_shipment_by_number('SHP-2')
+    added = sqlite_db.save_cargo_items(added=[
+        {'shipment_id': first['id'], 'item_name': 'Bolts', 'quantity': 1, 'weight': 10, 'value': 100},
+    ])['added']
+
+    # Add one item to SHP-1 and move the existing one to SHP-2
+    _import(
+        sqlite_db, 'cargo_items',
+        id=['', str(added[0])], shipment_number=['SHP-1', 'SHP-2'], item_name=['Nuts', 'Bolts'],
+        quantity=['2', '1'], weight=['5', '10'], value=['50', '100'],
+    )
+
+    first = sqlite_db.get_shipment_by_id(first['id'])
+    second = sqlite_db.get_shipment_by_id(second['id'])
+    assert (first['total_weight'], first['total_value']) == (5, 50)
+    assert (second['total_weight'], second['total_value']) == (10, 100)
+
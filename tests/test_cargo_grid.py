@@ -0,0 +1,73 @@
+import numpy as np
+import pandas as pd
+
+import database
+from data_manager import DataManager
+
+CARGO_COLUMNS = ['item_name', 'description', 'quantity', 'unit', 'weight', 'value', 'hs_code']
+
+
+def _shipment(db, number, client_id):
+    db.create_shipment(number, client_id, 'Import', 'China', 'Turkey', '2024-01-01', '2024-02-01', 0, 0)
+    return db.get_shipment_by_number(number)
+
+
+def _manifest(db, shipment_id):
+    """The frame the Manage Shipments grid starts from, and what st.data_editor hands back unchanged:
+    with a dynamic row count the id column comes back as float and empty cells as NaN"""
+    cargo_df = db.get_shipment_bundle(shipment_id)['cargo_items']
+    assert list(cargo_df.columns) == list(database.SHIPMENT_BUNDLE_FRAMES['cargo_items'])
+    edited = cargo_df[['id'] + CARGO_COLUMNS].copy()
+    edited['id'] = edited['id'].astype('float64')
+    return cargo_df, edited
+
+
+def test_grid_save_diffs_rows_and_recomputes_each_shipment_once(sqlite_db, monkeypatch):
+    sqlite_db.create_user('client@example.com', 'hash', 'salt', role='client')
+    client_id = sqlite_db.get_user_by_email('client@example.com')['id']
+    first = _shipment(sqlite_db, 'SHP-1', client_id)
+    second = _shipment(sqlite_db, 'SHP-2', client_id)
+    kept, changed, removed = sqlite_db.save_cargo_items(added=[
+        {'shipment_id': first['id'], 'item_name': 'Bolts', 'quantity': 1, 'weight': 10, 'value': 100},
+        {'shipment_id': first['id'], 'item_name': 'Nuts', 'quantity': 2, 'weight': 5, 'value': 50},
+        {'shipment_id': first['id'], 'item_name': 'Gears', 'quantity': 3, 'weight': 7, 'value': 70},
+    ])['added']
+    sqlite_db.save_cargo_items(added=[
+        {'shipment_id': second['id'], 'item_name': 'Pipes', 'quantity': 1, 'weight': 1, 'value': 1},
+    ])
+
+    cargo_df, edited = _manifest(sqlite_db, first['id'])
+    # An untouched row whose empty text comes back as NaN where the original holds None
+    cargo_df.loc[cargo_df['id'] == kept, 'hs_code'] = None
+    edited.loc[edited['id'] == kept, 'hs_code'] = np.nan
+    edited.loc[edited['id'] == changed, 'weight'] = 6.0
+    edited = edited[edited['id'] != removed]
+    new_row = {'id': np.nan, 'item_name': 'Washers', 'description': np.nan, 'quantity': 4, 'unit': 'pcs',
+               'weight': 2.5, 'value': 25.0, 'hs_code': np.nan}
+    edited = pd.concat([edited, pd.DataFrame([new_row])], ignore_index=True)
+
+    added, updated, deleted = DataManager(sqlite_db).diff_rows(cargo_df, edited, CARGO_COLUMNS)
+
+    assert added == [{'item_name': 'Washers', 'description': None, 'quantity': 4, 'unit': 'pcs',
+                      'weight': 2.5, 'value': 25.0, 'hs_code': None}]
+    assert [(item['id'], item['weight']) for item in updated] == [(changed, 6.0)]
+    assert isinstance(updated[0]['id'], int)
+    assert deleted == [removed]
+
+    recomputed = []
+    recompute = database._recompute_shipment_totals
+
+    def spy(cursor, shipment_ids):
+        recomputed.append(sorted(shipment_ids))
+        recompute(cursor, shipment_ids)
+
+    monkeypatch.setattr(database, '_recompute_shipment_totals', spy)
+    for item in added:
+        item['shipment_id'] = first['id']
+    result = sqlite_db.save_cargo_items(added=added, updated=updated, deleted=deleted)
+
+    assert (len(result['added']), result['updated'], result['deleted']) == (1, 1, 1)
+    assert recomputed == [[first['id']]]
+    first = sqlite_db.get_shipment_by_id(first['id'])
+    assert (first['total_weight'], first['total_value']) == (10 + 6 + 2.5, 100 + 50 + 25)
+    assert sqlite_db.get_shipment_by_id(second['id'])['total_weight'] == 1
@@ -0,0 +1,40 @@
+def test_record_filter_options_on_populated_table(sqlite_db):
+    sqlite_db.add_record('Ada', 'Research', 'Developer', 5000, '2024-01-05', 'ada@example.com', '0500', 'On Leave')
+    sqlite_db.create_user('ada@example.com', 'hash', 'salt', role='employee')
+
+    options = sqlite_db.get_record_filter_options()
+
+    assert set(options) == {'departments', 'statuses', 'roles'}
+    assert 'Research' in options['departments']
+    assert 'On Leave' in options['statuses']
+    assert 'employee' in options['roles']
+    assert options['departments'] == sorted(options['departments'])
+
+
+def test_expired_export_file_claimed_by_a_running_job_is_kept(sqlite_db):
+    expired = sqlite_db.create_export_job('a', 'csv', ['records'])
+    sqlite_db.start_export_job(expired)
+    sqlite_db.finish_export_job(expired, 'exports/shared.csv', -60)
+    running = sqlite_db.create_export_job('b', 'csv', ['records'])
+    sqlite_db.start_export_job(running)
+    sqlite_db.claim_export_file(running, 'exports/shared.csv')
+
+    assert sqlite_db.expire_export_jobs() == []
+    assert sqlite_db.get_export_job(expired)['status'] == 'expired'
+
+
+def test_search_filters_apply_before_the_limit(sqlite_db):
+    for i in range(5):
+        sqlite_db.add_record(f'Zebulon {i}', 'Sales', 'Rep', 4000, '2024-01-05', f'z{i}@example.com', '0500', 'Active')
+    sqlite_db.add_record('Zebulon Old', 'Research', 'Rep', 4000, '2020-01-05', 'zold@example.com', '0500', 'Active')
+    sqlite_db.create_user('zold@example.com', 'hash', 'salt', role='manager')
+    for i in range(5):
+        sqlite_db.add_record(f'Zebulon {i + 5}', 'Sales', 'Rep', 4000, '2024-01-05', f'zz{i}@example.com', '0500', 'Active')
+
+    for term in ('Zebulon', 'Ze'):
+        by_department = sqlite_db.search_records(term, limit=3, department='Research')
+        by_role = sqlite_db.search_records(term, limit=3, role='manager')
+
+        assert by_department['employee_name'].tolist() == ['Zebulon Old']
+        assert by_role['employee_name'].tolist() == ['Zebulon Old']
+        assert sqlite_db.search_records(term, limit=3, status='Inactive').empty
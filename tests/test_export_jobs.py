@@ -0,0 +1,44 @@
+import os
+import tempfile
+import threading
+import time
+from datetime import timedelta
+
+from export_jobs import ExportJobQueue
+
+
+class SlowCsvDataManager:
+    """Writes its CSV only after release is set, like a long COPY that reports no progress"""
+
+    def __init__(self):
+        self.release = threading.Event()
+
+    def export_table_csv(self, name):
+        self.release.wait(10)
+        fd, path = tempfile.mkstemp(suffix='.csv')
+        with os.fdopen(fd, 'w') as out:
+            out.write('id\n1\n')
+        return path
+
+
+def wait_for(predicate, timeout=10):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.05)
+
+
+def test_long_csv_job_heartbeats_and_survives_stale_checks(sqlite_db, tmp_path):
+    data_manager = SlowCsvDataManager()
+    queue = ExportJobQueue(sqlite_db, data_manager, output_dir=str(tmp_path / 'exports'),
+                           stale_after=timedelta(seconds=2))
+    job_id = queue.submit('csv', ['records'])
+    wait_for(lambda: queue.status(job_id)['status'] == 'running')
+
+    # Well past stale_after with no progress reported; another replica checks for stale jobs
+    time.sleep(3.5)
+    assert sqlite_db.fail_stale_export_jobs(2) == 0
+
+    data_manager.release.set()
+    wait_for(lambda: queue.status(job_id)['status'] == 'done')
+    assert os.path.exists(queue.status(job_id)['file_path'])
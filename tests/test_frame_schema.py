@@ -0,0 +1,20 @@
+import pandas as pd
+
+from frame_schema import compact_frame, RECORD_SCHEMA, SHIPMENT_SCHEMA
+
+
+def test_ids_stay_int32_whatever_the_row_count():
+    small = compact_frame(pd.DataFrame({'id': [1, 2]}), RECORD_SCHEMA)
+    large = compact_frame(pd.DataFrame({'id': [1, 70000]}), RECORD_SCHEMA)
+
+    assert small['id'].dtype == 'int32'
+    assert large['id'].dtype == 'int32'
+    assert compact_frame(pd.concat([small, large]), RECORD_SCHEMA)['id'].dtype == 'int32'
+
+
+def test_ids_beyond_int32_are_kept_whole():
+    frame = compact_frame(pd.DataFrame({'id': [1, 2 ** 40], 'client_id': [3, 4]}), SHIPMENT_SCHEMA)
+
+    assert frame['id'].dtype == 'int64'
+    assert frame['id'].tolist() == [1, 2 ** 40]
+    assert frame['client_id'].dtype == 'int32'
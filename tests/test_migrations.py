@@ -0,0 +1,47 @@
+import sqlite3
+
+import pytest
+
+import migrations
+
+
+def test_editing_a_callable_step_changes_the_checksum():
+    def step(cursor):
+        cursor.execute("ALTER TABLE company_records ADD COLUMN notes TEXT")
+    original = migrations.Migration(99, 'notes', [], [step]).checksum(migrations.SQLITE)
+
+    def step(cursor):  # noqa: F811 - same name, different body
+        cursor.execute("ALTER TABLE company_records ADD COLUMN notes TEXT DEFAULT ''")
+    edited = migrations.Migration(99, 'notes', [], [step]).checksum(migrations.SQLITE)
+
+    assert original != edited
+
+
+def test_a_changed_applied_migration_refuses_to_start(tmp_path, monkeypatch):
+    conn = sqlite3.connect(str(tmp_path / 'company_data.db'))
+    migrations.migrate(conn, migrations.SQLITE)
+    conn.execute("UPDATE schema_migrations SET checksum = 'stale' WHERE version = 1")
+    conn.commit()
+    monkeypatch.setattr(migrations, 'current_version', lambda conn: 0)
+
+    with pytest.raises(migrations.MigrationError, match="was changed after it was applied"):
+        migrations.migrate(conn, migrations.SQLITE)
+    conn.close()
+
+
+def test_checksums_recorded_by_step_name_are_upgraded(tmp_path, monkeypatch):
+    conn = sqlite3.connect(str(tmp_path / 'company_data.db'))
+    migrations.migrate(conn, migrations.SQLITE)
+    with_callables = [m for m in migrations.MIGRATIONS
+                      if any(callable(step) for step in m.statements[migrations.SQLITE])]
+    assert with_callables
+    for migration in with_callables:
+        conn.execute("UPDATE schema_migrations SET checksum = ? WHERE version = ?",
+                     (migration.checksum(migrations.SQLITE, by_name=True), migration.version))
+    conn.commit()
+    monkeypatch.setattr(migrations, 'current_version', lambda conn: 0)
+
+    assert migrations.migrate(conn, migrations.SQLITE) == 0
+    recorded = dict(conn.execute("SELECT version, checksum FROM schema_migrations"))
+    assert all(recorded[m.version] == m.checksum(migrations.SQLITE) for m in with_callables)
+    conn.close()
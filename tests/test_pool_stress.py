@@ -0,0 +1,139 @@
+"""Hundreds of concurrent sessions against the shared pool.
+
+SQLite in-memory connections stand in for Postgres: the engine is built by
+Database.__init__ exactly as in production (same QueuePool subclass, sizes and
+timeout), only the DBAPI connections come from a stub factory.
+"""
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from sqlalchemy import create_engine
+
+import database_postgres
+from database_postgres import Database
+
+SESSIONS = 300
+
+
+class StubConnection:
+    """sqlite3 connection with psycopg2's cursor(cursor_factory=...) signature"""
+
+    def __init__(self):
+        self._conn = sqlite3.connect(':memory:', check_same_thread=False)
+
+    def cursor(self, cursor_factory=None):
+        return self._conn.cursor()
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    """Patch in a stand-in engine factory; yields a function building Database() with pool settings"""
+    engines = []
+
+    def fake_create_engine(url, **options):
+        engines.append(create_engine('sqlite://', creator=StubConnection, **options))
+        return engines[-1]
+
+    def build(size, overflow, timeout):
+        monkeypatch.setenv('DATABASE_URL', 'postgresql://stand-in/eims')
+        monkeypatch.setenv('DB_POOL_SIZE', str(size))
+        monkeypatch.setenv('DB_MAX_OVERFLOW', str(overflow))
+        monkeypatch.setenv('DB_POOL_TIMEOUT', str(timeout))
+        return Database()
+
+    monkeypatch.setattr(database_postgres, 'create_engine', fake_create_engine)
+    monkeypatch.setattr(Database, '_engine', None)
+    monkeypatch.setattr(Database, '_checked_out', 0)
+    build.engines = engines
+    yield build
+    for engine in engines:
+        engine.dispose()
+
+
+def test_concurrent_first_sessions_build_one_engine(pool):
+    start = threading.Barrier(50)
+
+    def session():
+        start.wait()
+        return pool(5, 5, 10)
+
+    with ThreadPoolExecutor(max_workers=50) as executor:
+        list(executor.map(lambda _: session(), range(50)))
+
+    assert len(pool.engines) == 1
+
+
+def test_hundreds_of_sessions_share_a_bounded_pool(pool):
+    db = pool(5, 5, 30)
+    peak = 0
+    peak_lock = threading.Lock()
+
+    def session(i):
+        nonlocal peak
+        with db.cursor() as cursor:
+            with peak_lock:
+                peak = max(peak, Database.checked_out_connections())
+            cursor.execute('SELECT ?', (i,))
+            assert cursor.fetchone()[0] == i
+            time.sleep(0.005)
+            if i % 7 == 0:
+                raise ValueError("session failed mid-transaction")
+
+    with ThreadPoolExecutor(max_workers=SESSIONS) as executor:
+        futures = [executor.submit(session, i) for i in range(SESSIONS)]
+    failures = [future.exception() for future in futures if future.exception() is not None]
+
+    assert all(isinstance(error, ValueError) for error in failures)
+    assert len(failures) == len(range(0, SESSIONS, 7))
+    assert 1 < peak <= 10
+    assert Database._engine.pool.checkedout() == 0
+    Database.assert_no_leaks()
+
+
+def test_exhausted_pool_times_out_instead_of_connecting_outside_it(pool):
+    db = pool(1, 0, 0.2)
+    held = db.get_connection()
+    try:
+        started = time.monotonic()
+        with pytest.raises(RuntimeError, match="Database is busy"):
+            db.get_connection()
+        assert 0.2 <= time.monotonic() - started < 2
+        assert Database._engine.pool.checkedout() == 1
+    finally:
+        db.return_connection(held)
+    Database.assert_no_leaks()
+
+
+def test_assert_no_leaks_reports_a_connection_never_returned(pool):
+    db = pool(2, 0, 1)
+    conn = db.get_connection()
+    with pytest.raises(RuntimeError, match="1 database connection"):
+        Database.assert_no_leaks()
+    db.return_connection(conn)
+    Database.assert_no_leaks()
+
+
+def test_only_checkouts_blocked_on_a_full_pool_count_as_waiting(pool):
+    db = pool(1, 1, 5)
+    first = db.get_connection()
+    second = db.get_connection()
+    assert Database.pool_stats()['waiting'] == 0
+
+    blocked = threading.Thread(target=lambda: db.return_connection(db.get_connection()))
+    blocked.start()
+    deadline = time.monotonic() + 5
+    while Database.pool_stats()['waiting'] != 1:
+        assert time.monotonic() < deadline, "the blocked checkout was never counted"
+        time.sleep(0.01)
+
+    db.return_connection(first)
+    blocked.join(5)
+    assert Database.pool_stats()['waiting'] == 0
+    db.return_connection(second)
+    Database.assert_no_leaks()
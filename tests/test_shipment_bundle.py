@@ -0,0 +1,20 @@
+import pytest
+
+import database
+import database_postgres
+
+
+@pytest.mark.parametrize('backend', [database, database_postgres])
+def test_bundle_frames_parse_timestamps_of_mixed_precision(backend):
+    # json_agg leaves out zero fractional seconds, so one array mixes both forms
+    rows = [
+        {'id': 1, 'shipment_id': 1, 'item_name': 'Box', 'description': '', 'quantity': 2, 'unit': 'pcs',
+         'weight': 1.5, 'value': 10.0, 'hs_code': '', 'created_at': '2024-01-01T10:00:00.123456'},
+        {'id': 2, 'shipment_id': 1, 'item_name': 'Crate', 'description': '', 'quantity': 1, 'unit': 'pcs',
+         'weight': 3.0, 'value': 20.0, 'hs_code': '', 'created_at': '2024-01-01T10:00:00'},
+    ]
+
+    df = backend._typed_frame(rows, backend.SHIPMENT_BUNDLE_FRAMES['cargo_items'])
+
+    assert df['created_at'].dt.microsecond.tolist() == [123456, 0]
+    assert df['created_at'].dt.second.tolist() == [0, 0]